@@ -1,62 +0,0 @@
-from PIL import Image
-import os
-
-def convert_jpeg_to_png(input_path):
-    """Convert JPEG to PNG format"""
-    output_path = input_path.replace('.jpg', '.png').replace('.jpeg', '.png')
-    image = Image.open(input_path)
-    image.save(output_path, 'PNG')
-    return output_path
-
-def convert_png_to_jpeg(input_path):
-    """Convert PNG to JPEG format"""
-    output_path = input_path.replace('.png', '.jpg')
-    image = Image.open(input_path)
-    # Convert RGBA to RGB if necessary
-    if image.mode in ('RGBA', 'LA'):
-        background = Image.new('RGB', image.size, (255, 255, 255))
-        background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-        image = background
-    image.save(output_path, 'JPEG', quality=95)
-    return output_path
-
-def convert_png_to_svg(input_path):
-    """Convert PNG to SVG format (simple approach)"""
-    output_path = input_path.replace('.png', '.svg')
-    # Create a simple SVG wrapper around the image
-    image = Image.open(input_path)
-    width, height = image.size
-    
-    svg_content = f'''<?xml version="1.0" encoding="UTF-8"?>
-<svg width="{width}" height="{height}" xmlns="http://www.w3.org/2000/svg">
-  <image href="{input_path}" width="{width}" height="{height}"/>
-</svg>'''
-    
-    with open(output_path, 'w') as f:
-        f.write(svg_content)
-    return output_path
-
-def convert_jpeg_to_svg(input_path):
-    """Convert JPEG to SVG format"""
-    output_path = input_path.replace('.jpg', '.svg').replace('.jpeg', '.svg')
-    image = Image.open(input_path)
-    width, height = image.size
-    
-    svg_content = f'''<?xml version="1.0" encoding="UTF-8"?>
-<svg width="{width}" height="{height}" xmlns="http://www.w3.org/2000/svg">
-  <image href="{input_path}" width="{width}" height="{height}"/>
-</svg>'''
-    
-    with open(output_path, 'w') as f:
-        f.write(svg_content)
-    return output_path
-
-def convert_svg_to_png(input_path):
-    """Convert SVG to PNG format (placeholder - requires additional setup)"""
-    print("SVG to PNG conversion requires additional setup. Please use an online converter.")
-    return None
-
-def convert_svg_to_jpeg(input_path):
-    """Convert SVG to JPEG format (placeholder - requires additional setup)"""
-    print("SVG to JPEG conversion requires additional setup. Please use an online converter.")
-    return None
\ No newline at end of file
@@ -1,84 +1,140 @@
-from flask import Flask, request, jsonify, send_file
+import time
+
+# Measured from here so /api/health can report how long the API took to import
+_import_started = time.perf_counter()
+
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 import os
+import json
 import tempfile
 import uuid
 import shutil
-import zipfile
 from werkzeug.utils import secure_filename
 import mimetypes
+import multiprocessing
+import threading
 
-# Configure ffmpeg for audio conversions
-def configure_ffmpeg():
-    """Configure ffmpeg path for audio conversions"""
-    try:
-        from pydub import AudioSegment
-        
-        # Check if we're in a cloud environment
-        if os.environ.get('RAILWAY_ENVIRONMENT') or os.environ.get('RENDER') or os.environ.get('HEROKU'):
-            # In cloud environment, use system ffmpeg
-            print("Running in cloud environment, using system FFmpeg")
-            return True
-        
-        # Local environment - try to use local ffmpeg
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.dirname(os.path.dirname(current_dir))
-        ffmpeg_bin = os.path.join(project_root, 'ffmpeg-master-latest-win64-gpl', 'bin')
-        
-        if os.path.exists(ffmpeg_bin):
-            # Add ffmpeg to system PATH
-            if ffmpeg_bin not in os.environ.get('PATH', ''):
-                os.environ['PATH'] = ffmpeg_bin + os.pathsep + os.environ.get('PATH', '')
-            
-            # Configure pydub to use local ffmpeg
-            AudioSegment.converter = os.path.join(ffmpeg_bin, "ffmpeg.exe")
-            AudioSegment.ffmpeg = os.path.join(ffmpeg_bin, "ffmpeg.exe")
-            
-            print(f"FFmpeg configured successfully: {ffmpeg_bin}")
-            return True
-        else:
-            print(f"FFmpeg directory not found: {ffmpeg_bin}")
-            return False
-    except Exception as e:
-        print(f"Error configuring ffmpeg: {e}")
-        return False
-
-# Configure ffmpeg before importing converters
-configure_ffmpeg()
-
-# Import converter functions
-from converter.pdf_converter import convert_pdf_to_word, convert_word_to_pdf, convert_pdf_to_png
-from converter.audio_converter import (
-    convert_mp3_to_wav, convert_wav_to_mp3, convert_mp3_to_m4a,
-    convert_wav_to_m4a, convert_m4a_to_mp3, convert_m4a_to_wav
-)
-from converter.image_converter import (
-    convert_jpeg_to_png, convert_png_to_jpeg, convert_png_to_svg,
-    convert_jpeg_to_svg, convert_svg_to_png, convert_svg_to_jpeg
-)
+from conversion_tasks import remove_stale_workdirs, run_conversion, warm_worker
+from converter import registry
+from converter.instrumentation import ANALYSIS_SUFFIX
+from job_queue import JobQueue, QueueFullError
+from result_cache import ResultCache, file_sha256
+from chunked_upload import ChunkedUploadManager, UploadError, OffsetMismatch, save_stream
+import metrics
+from zip_stream import ZipStream
+from storage import StorageManager, StorageFullError
+from state_store import open_state_store
+from blob_store import FilesystemBlobStore
+from file_probe import ProbeError, file_kind, probe, sniff
+from pdf_preview import DEFAULT_THUMBNAIL_SIZE, PdfPreviews, PreviewError
 
 app = Flask(__name__)
 CORS(app)
 
 # Configuration
-UPLOAD_FOLDER = 'uploads'
-OUTPUT_FOLDER = 'outputs'
-ALLOWED_EXTENSIONS = {
-    'audio': {'mp3', 'wav', 'm4a'},
-    'image': {'jpg', 'jpeg', 'png', 'svg'},
-    'document': {'pdf', 'docx'}
-}
-
-# Create directories if they don't exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
+OUTPUT_FOLDER = os.environ.get('OUTPUT_FOLDER', 'outputs')
+CACHE_FOLDER = 'cache'
+# Upload types per job lane: every format some conversion starts from
+ALLOWED_EXTENSIONS = registry.upload_extensions()
+
+# Uploaded and converted files; every process sharing these folders and the
+# state store can serve any session's files and jobs
+uploads = FilesystemBlobStore(UPLOAD_FOLDER)
+outputs = FilesystemBlobStore(OUTPUT_FOLDER)
+state_store = open_state_store()
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
+app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size (and max chunk size)
+app.config['MAX_BATCH_ITEMS'] = int(os.environ.get('MAX_BATCH_ITEMS', 50))
+app.config['MAX_CHUNKED_UPLOAD_SIZE'] = int(os.environ.get('MAX_CHUNKED_UPLOAD_SIZE', 2 * 1024 * 1024 * 1024))
+
+# Downloads can be handed to the front server: 'x-sendfile' (Apache, lighttpd)
+# or 'x-accel' (nginx, with outputs exposed as an internal location)
+DOWNLOAD_OFFLOAD = os.environ.get('DOWNLOAD_OFFLOAD', '').lower()
+DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '/protected-outputs/')
+# Downloaded files are kept this long so interrupted downloads can resume
+DOWNLOAD_GRACE = int(os.environ.get('DOWNLOAD_GRACE', 300))
 
-# Track uploaded files by session
-uploaded_files = {}  # session_id -> list of file paths
+# Uploads and outputs are indexed with their owning session, size and
+# expiry; files are deleted on expiry or, oldest first, to stay in quota
+FILE_TTL = int(os.environ.get('FILE_TTL', 3600))
+def forget_file(path):
+    """Drop the small values kept about a deleted upload or output"""
+    state_store.pop_value('upload_hash', os.path.basename(path))
+    state_store.pop_value('upload_meta', os.path.basename(path))
+    state_store.pop_value('output_type', os.path.basename(path))
+    state_store.pop_value('output_hash', os.path.basename(path))
+
+storage = StorageManager(
+    state_store,
+    quota_bytes=int(os.environ.get('STORAGE_QUOTA_BYTES', 4 * 1024 * 1024 * 1024)),
+    ttl=FILE_TTL,
+    on_remove=forget_file,
+)
+
+# Conversions run in background worker pools whose processes import their
+# lane's converter libraries once at start-up
+worker_ready = multiprocessing.SimpleQueue()
+job_queue = JobQueue(initializer=warm_worker, initargs=(worker_ready,), store=state_store)
+worker_status = {}  # lane -> {'started': worker processes, 'warmup_seconds': slowest start}
+
+# Finished outputs keyed on input content, kept apart from uploads/outputs
+result_cache = ResultCache(
+    state_store,
+    CACHE_FOLDER,
+    max_bytes=int(os.environ.get('RESULT_CACHE_MAX_BYTES', 512 * 1024 * 1024)),
+    ttl=int(os.environ.get('RESULT_CACHE_TTL', 24 * 3600)),
+)
+
+# PDF page thumbnails keyed on input content, page and size. The preview
+# lane's workers render them and keep recent documents open, so paging
+# through a file reparses nothing
+pdf_previews = PdfPreviews(
+    state_store,
+    os.path.join(CACHE_FOLDER, 'previews'),
+    job_queue,
+    max_bytes=int(os.environ.get('PREVIEW_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    ttl=FILE_TTL,
+)
+
+# Resumable uploads for files too large for a single request
+chunked_uploads = ChunkedUploadManager(
+    state_store, UPLOAD_FOLDER, app.config['MAX_CHUNKED_UPLOAD_SIZE'], head_check=sniff
+)
+
+def get_upload_hash(unique_filename):
+    """Return the SHA-256 of an uploaded file, hashing it on first use"""
+    file_hash = state_store.get_value('upload_hash', unique_filename)
+    if file_hash is None:
+        file_hash = file_sha256(uploads.path(unique_filename))
+        state_store.set_value('upload_hash', unique_filename, file_hash)
+    return file_hash
+
+def get_output_hash(output_filename):
+    """Return the SHA-256 of a converted file, hashing it on first use"""
+    file_hash = state_store.get_value('output_hash', output_filename)
+    if file_hash is None:
+        file_hash = file_sha256(outputs.path(output_filename))
+        state_store.set_value('output_hash', output_filename, file_hash)
+    return file_hash
+
+def validate_upload(file_path, filename):
+    """Probe a stored upload's headers; delete it and re-raise if it is rejected"""
+    try:
+        return probe(file_path, filename)
+    except ProbeError as e:
+        reject_upload(file_path, filename, e)
+        raise
+
+def reject_upload(file_path, filename, error):
+    """Delete an upload that failed validation and count the rejection"""
+    print(f"Upload rejected: {filename}: {error}")
+    metrics.uploads_rejected.inc(file_type=get_file_type(filename), status_code=str(error.status_code))
+    if file_path and os.path.exists(file_path):
+        os.remove(file_path)
 
 def allowed_file(filename, file_type):
     """Check if file extension is allowed"""
@@ -89,32 +145,14 @@ def get_file_type(filename):
     """Detect file type based on extension"""
     ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
     
-    if ext in ALLOWED_EXTENSIONS['audio']:
-        return 'audio'
-    elif ext in ALLOWED_EXTENSIONS['image']:
-        return 'image'
-    elif ext in ALLOWED_EXTENSIONS['document']:
-        return 'document'
-    else:
-        return 'unknown'
+    for file_type, extensions in ALLOWED_EXTENSIONS.items():
+        if ext in extensions:
+            return file_type
+    return 'unknown'
 
 def get_available_conversions(filename):
     """Get available conversion options for a file"""
-    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
-    
-    conversion_map = {
-        '.pdf': ['pdf_to_word', 'pdf_to_png'],
-        '.docx': ['word_to_pdf'],
-        '.mp3': ['mp3_to_wav', 'mp3_to_m4a'],
-        '.wav': ['wav_to_mp3', 'wav_to_m4a'],
-        '.m4a': ['m4a_to_mp3', 'm4a_to_wav'],
-        '.jpg': ['jpeg_to_png', 'jpeg_to_svg'],
-        '.jpeg': ['jpeg_to_png', 'jpeg_to_svg'],
-        '.png': ['png_to_jpeg', 'png_to_svg'],
-        '.svg': ['svg_to_png', 'svg_to_jpeg'],
-    }
-    
-    return conversion_map.get(f'.{ext}', [])
+    return registry.conversions_from(filename)
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
@@ -130,20 +168,30 @@ def upload_file():
         # Generate session ID if not provided
         session_id = request.form.get('session_id', str(uuid.uuid4()))
         
-        # Create directories if they don't exist
-        os.makedirs('uploads', exist_ok=True)
-        os.makedirs('outputs', exist_ok=True)
-        
         # Save file with unique name
         filename = secure_filename(file.filename or 'unknown')
         unique_filename = f"{uuid.uuid4()}_{filename}"
-        file_path = os.path.join('uploads', unique_filename)
-        file.save(file_path)
+        file_path = uploads.path(unique_filename)
+        storage.ensure_space(request.content_length or 0)
+        write_started = time.perf_counter()
+        # The first bytes are checked against the extension before anything is written
+        try:
+            file_hash = save_stream(file.stream, file_path, head_check=lambda head: sniff(filename, head))
+        except ProbeError as e:
+            reject_upload(file_path, filename, e)
+            raise
+        metrics.upload_write_seconds.observe(time.perf_counter() - write_started, file_type=get_file_type(filename))
+        metadata = validate_upload(file_path, filename)
+        uploads.commit(unique_filename)
+        state_store.set_value('upload_hash', unique_filename, file_hash)
+        state_store.set_value('upload_meta', unique_filename, metadata)
         
         # Track uploaded file for this session
-        if session_id not in uploaded_files:
-            uploaded_files[session_id] = []
-        uploaded_files[session_id].append(file_path)
+        try:
+            storage.register(file_path, owner=session_id, kind='upload')
+        except StorageFullError:
+            storage.remove(file_path)
+            raise
         
         print(f"File uploaded: {file_path} for session: {session_id}")
         
@@ -151,149 +199,514 @@ def upload_file():
             'message': 'File uploaded successfully',
             'filename': filename,
             'unique_filename': unique_filename,
-            'session_id': session_id
+            'session_id': session_id,
+            'metadata': metadata,
+            'conversions': get_available_conversions(filename),
         })
         
+    except ProbeError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except StorageFullError as e:
+        return jsonify({'error': str(e)}), 507, {'Retry-After': '30'}
     except Exception as e:
         print(f"Upload error: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/convert', methods=['POST'])
-def convert_file():
-    """Convert a file to the specified format"""
+def serialize_chunked_upload(state):
+    """Build the API representation of a resumable upload"""
+    return {
+        'upload_id': state['upload_id'],
+        'filename': state['filename'],
+        'size': state['size'],
+        'offset': state['offset'],
+        'session_id': state['session_id'],
+        'upload_url': f"/api/uploads/{state['upload_id']}",
+    }
+
+@app.route('/api/uploads', methods=['POST'])
+def create_chunked_upload():
+    """Start a resumable upload"""
     try:
         data = request.get_json()
-        if not data:
-            return jsonify({'error': 'No data provided'}), 400
-        
-        unique_filename = data.get('unique_filename')
-        conversion_type = data.get('conversion_type')
-        
-        if not unique_filename or not conversion_type:
-            return jsonify({'error': 'Missing filename or conversion type'}), 400
-        
-        # Find the uploaded file
-        input_path = os.path.join('uploads', unique_filename)
-        
-        if not os.path.exists(input_path):
-            return jsonify({'error': 'Uploaded file not found'}), 404
-        
-        print(f"Starting conversion: {input_path} -> {conversion_type}")
-        
-        # Perform conversion
-        conversion_functions = {
-            'mp3_to_wav': convert_mp3_to_wav,
-            'wav_to_mp3': convert_wav_to_mp3,
-            'mp3_to_m4a': convert_mp3_to_m4a,
-            'wav_to_m4a': convert_wav_to_m4a,
-            'm4a_to_mp3': convert_m4a_to_mp3,
-            'm4a_to_wav': convert_m4a_to_wav,
-            'jpeg_to_png': convert_jpeg_to_png,
-            'png_to_jpeg': convert_png_to_jpeg,
-            'png_to_svg': convert_png_to_svg,
-            'jpeg_to_svg': convert_jpeg_to_svg,
-            'svg_to_png': convert_svg_to_png,
-            'svg_to_jpeg': convert_svg_to_jpeg,
-            'pdf_to_word': convert_pdf_to_word,
-            'word_to_pdf': convert_word_to_pdf,
-            'pdf_to_png': convert_pdf_to_png,
-        }
-        
-        if conversion_type not in conversion_functions:
-            return jsonify({'error': 'Unsupported conversion type'}), 400
-        
-        # Perform conversion
-        output_path = conversion_functions[conversion_type](input_path)
-        print(f"Conversion output path: {output_path}")
-        print(f"Output path exists: {output_path and os.path.exists(output_path) if output_path else None}")
-        
-        if not output_path or not os.path.exists(output_path):
-            return jsonify({'error': 'Conversion failed'}), 500
-        
-        # Move converted file to outputs directory with clean filename
-        original_filename = unique_filename.split('_', 1)[1] if '_' in unique_filename else unique_filename
-        original_name = os.path.splitext(original_filename)[0]
-        
-        # Get new extension based on conversion type
-        new_extension = get_extension_for_conversion(conversion_type)
-        clean_filename = f"{original_name}{new_extension}"
-        
-        # Create unique output filename
-        output_filename = f"{uuid.uuid4()}_{clean_filename}"
-        final_output_path = os.path.join('outputs', output_filename)
-        
-        # Copy instead of move to avoid issues with reconversion
-        shutil.copy2(output_path, final_output_path)
-        print(f"File copied successfully to: {final_output_path}")
-        
-        # Clean up the original converted file
+        if not data or not data.get('filename') or not data.get('size'):
+            return jsonify({'error': 'Missing filename or size'}), 400
+        
+        session_id = data.get('session_id') or str(uuid.uuid4())
+        if file_kind(data['filename']) is None:
+            return jsonify({'error': 'Unsupported file type'}), 415
+        storage.ensure_space(int(data['size']))
+        state = chunked_uploads.create(data['filename'], int(data['size']), session_id)
+        print(f"Started resumable upload {state['upload_id']} ({state['size']} bytes) for session: {session_id}")
+        return jsonify(serialize_chunked_upload(state)), 201
+        
+    except StorageFullError as e:
+        return jsonify({'error': str(e)}), 507, {'Retry-After': '30'}
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        print(f"Upload error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def chunked_upload_status(upload_id):
+    """Report how many bytes of a resumable upload have been stored"""
+    try:
+        return jsonify(serialize_chunked_upload(chunked_uploads.get(upload_id)))
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Append a chunk described by a Content-Range header to a resumable upload"""
+    try:
+        write_started = time.perf_counter()
+        state, file_hash = chunked_uploads.write_chunk(
+            upload_id, request.headers.get('Content-Range'), request.stream
+        )
+        metrics.upload_write_seconds.observe(time.perf_counter() - write_started, file_type=get_file_type(state['filename']))
+        if file_hash is None:
+            return jsonify(serialize_chunked_upload(state))
+        
+        unique_filename = state['unique_filename']
+        file_path = uploads.path(unique_filename)
+        metadata = validate_upload(file_path, state['filename'])
+        uploads.commit(unique_filename)
+        state_store.set_value('upload_hash', unique_filename, file_hash)
+        state_store.set_value('upload_meta', unique_filename, metadata)
+        session_id = state['session_id']
         try:
-            os.remove(output_path)
-            print(f"Cleaned up original converted file: {output_path}")
-        except Exception as e:
-            print(f"Error cleaning up original file: {e}")
+            storage.register(file_path, owner=session_id, kind='upload')
+        except StorageFullError:
+            storage.remove(file_path)
+            raise
         
-        print(f"Final file exists: {os.path.exists(final_output_path)}")
+        print(f"File uploaded: {file_path} for session: {session_id}")
         
         return jsonify({
+            'message': 'File uploaded successfully',
+            'filename': state['filename'],
+            'unique_filename': unique_filename,
+            'session_id': session_id,
+            'size': state['size'],
+            'offset': state['offset'],
+            'sha256': file_hash,
+            'metadata': metadata,
+            'conversions': get_available_conversions(state['filename']),
+        })
+        
+    except ProbeError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except OffsetMismatch as e:
+        return jsonify({'error': str(e), 'offset': e.offset}), e.status_code
+    except StorageFullError as e:
+        return jsonify({'error': str(e)}), 507, {'Retry-After': '30'}
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        print(f"Upload error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# Conversion dispatch table, planned over the converter graph; the plans
+# only name their converters, which the worker processes import
+conversion_functions = registry.conversion_plans()
+
+def serialize_job(job):
+    """Build the API representation of a conversion job"""
+    payload = {
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'conversion_type': job['meta'].get('conversion_type'),
+        'status_url': f"/api/jobs/{job['job_id']}",
+        'result_url': f"/api/jobs/{job['job_id']}/result",
+        'events_url': f"/api/jobs/{job['job_id']}/events",
+        'progress': job.get('progress'),
+    }
+    if job['status'] == 'finished':
+        # The converter may pick the final extension, so read names from the result
+        output_filename = os.path.basename(job['result']['output_path'])
+        payload.update({
             'success': True,
             'output_filename': output_filename,
-            'clean_filename': clean_filename,
-            'download_url': f'/api/download/{output_filename}'
+            'clean_filename': output_filename.split('_', 1)[1],
+            'download_url': f"/api/download/{output_filename}",
+            'cached': job['meta'].get('cached', False),
         })
+        analysis = job['result'].get('analysis')
+        if analysis is not None:
+            payload['analysis'] = analysis
+            payload['analysis_url'] = f"/api/download/{output_filename}{ANALYSIS_SUFFIX}"
+    elif job['status'] == 'failed':
+        payload['error'] = job['error'] or 'Conversion failed'
+    return payload
+
+def record_job_metrics(job):
+    """Feed a completed job's queue wait and stage timings into the metrics"""
+    conversion_type = job['meta'].get('conversion_type')
+    if job['error']:
+        metrics.jobs_total.inc(conversion_type=conversion_type, status='failed')
+        return
+    
+    metrics.jobs_total.inc(conversion_type=conversion_type, status='finished')
+    metrics.stage_seconds.observe(
+        max(0.0, job['started_at'] - job['created_at']), stage='queue_wait', conversion_type=conversion_type
+    )
+    for stage, seconds in job['result']['timings'].items():
+        metrics.stage_seconds.observe(seconds, stage=stage, conversion_type=conversion_type)
+    state_store.set_value('output_type', os.path.basename(job['result']['output_path']), conversion_type)
+
+class ConversionRequestError(Exception):
+    """Raised when a conversion request cannot be queued"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+def track_output(output_path, input_path):
+    """Index a conversion output under the session that uploaded its input"""
+    try:
+        storage.register(output_path, owner=storage.owner_of(input_path), kind='output')
+    except StorageFullError:
+        # The output is already written and about to be downloaded, so keep it
+        print(f"Storage quota exceeded by output: {output_path}")
+
+def validate_conversion_request(unique_filename, conversion_type, options=None):
+    """Check a conversion request without queueing it and return its job lane
+
+    Raises ConversionRequestError for anything queue_conversion would refuse.
+    """
+    if not unique_filename or not conversion_type:
+        raise ConversionRequestError('Missing filename or conversion type')
+    
+    if not isinstance(unique_filename, str) or not isinstance(conversion_type, str):
+        raise ConversionRequestError('Filename and conversion type must be strings')
+    
+    if options is not None and not isinstance(options, dict):
+        raise ConversionRequestError('Options must be an object')
+    
+    # Find the uploaded file
+    if not uploads.exists(unique_filename):
+        raise ConversionRequestError('Uploaded file not found', 404)
+    
+    if conversion_type not in conversion_functions:
+        raise ConversionRequestError('Unsupported conversion type')
+    if conversion_functions[conversion_type].source != registry.format_for(unique_filename):
+        raise ConversionRequestError('Conversion type does not match the file type')
+    
+    lane = get_file_type(unique_filename)
+    if lane not in job_queue.lanes:
+        raise ConversionRequestError('Unsupported file type')
+    return lane
+
+def queue_conversion(unique_filename, conversion_type, options=None):
+    """Queue a conversion, or satisfy it from the result cache, and return the job"""
+    lane = validate_conversion_request(unique_filename, conversion_type, options)
+    options = options or {}
+    input_path = uploads.path(unique_filename)
+    
+    # Work out the clean output filename up front
+    original_filename = unique_filename.split('_', 1)[1] if '_' in unique_filename else unique_filename
+    original_name = os.path.splitext(original_filename)[0]
+    new_extension = get_extension_for_conversion(conversion_type)
+    clean_filename = f"{original_name}{new_extension}"
+    output_filename = f"{uuid.uuid4()}_{clean_filename}"
+    final_output_path = outputs.path(output_filename)
+    
+    conversion_func = conversion_functions[conversion_type]
+    # Drop options the plan does not take, so they cannot split the result cache
+    accepted = conversion_func.option_names()
+    options = {key: value for key, value in options.items() if value is not None and key in accepted}
+    meta = {'conversion_type': conversion_type, 'options': options}
+    
+    # Serve repeated conversions of identical input from the cache
+    cache_key = ResultCache.make_key(get_upload_hash(unique_filename), conversion_type, options)
+    cached_path = result_cache.get(cache_key, final_output_path)
+    analysis = None
+    if cached_path and options.get('analyze'):
+        # The analysis is cached beside the output; without it, convert again
+        analysis_path = result_cache.get(f'{cache_key}.analysis', cached_path + ANALYSIS_SUFFIX)
+        if analysis_path:
+            with open(analysis_path) as f:
+                analysis = json.load(f)
+            track_output(analysis_path, input_path)
+        else:
+            os.remove(cached_path)
+            cached_path = None
+    if cached_path:
+        print(f"Cache hit for {input_path} -> {conversion_type}")
+        state_store.set_value('output_type', os.path.basename(cached_path), conversion_type)
+        track_output(cached_path, input_path)
+        metrics.jobs_total.inc(conversion_type=conversion_type, status='cached')
+        return job_queue.record_finished(
+            lane, {'output_path': cached_path, 'analysis': analysis, 'timings': {}}, meta={**meta, 'cached': True}
+        )
+    
+    def on_success(finished):
+        storage.unpin(input_path)
+        record_job_metrics(finished)
+        output_path = finished['result']['output_path']
+        outputs.commit(os.path.basename(output_path))
+        state_store.set_value('output_hash', os.path.basename(output_path), finished['result']['sha256'])
+        result_cache.put(cache_key, output_path)
+        track_output(output_path, input_path)
+        if finished['result'].get('analysis') is not None:
+            analysis_path = output_path + ANALYSIS_SUFFIX
+            outputs.commit(os.path.basename(analysis_path))
+            result_cache.put(f'{cache_key}.analysis', analysis_path)
+            track_output(analysis_path, input_path)
+    
+    def on_failure(failed):
+        storage.unpin(input_path)
+        record_job_metrics(failed)
+    
+    # Keep the input from being evicted while the job waits or runs
+    storage.pin(input_path)
+    try:
+        job = job_queue.submit(
+            lane,
+            run_conversion,
+            conversion_func,
+            input_path,
+            final_output_path,
+            options,
+            meta=meta,
+            on_success=on_success,
+            on_failure=on_failure,
+        )
+    except Exception:
+        storage.unpin(input_path)
+        raise
+    print(f"Queued conversion job {job['job_id']}: {input_path} -> {conversion_type}")
+    return job
+
+@app.route('/api/convert', methods=['POST'])
+def convert_file():
+    """Queue a conversion job for an uploaded file"""
+    try:
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data, dict):
+            return jsonify({'error': 'No data provided'}), 400
+        
+        job = queue_conversion(data.get('unique_filename'), data.get('conversion_type'), data.get('options'))
+        return jsonify(serialize_job(job)), 200 if job['status'] == 'finished' else 202
         
+    except ConversionRequestError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
     except Exception as e:
         print(f"Conversion error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/convert-batch', methods=['POST'])
+def convert_batch():
+    """Convert several uploaded files concurrently and stream the results as one ZIP"""
+    try:
+        data = request.get_json(silent=True)
+        items = (data.get('items') if isinstance(data, dict) else None) or []
+        if not items:
+            return jsonify({'error': 'No files specified'}), 400
+        if not isinstance(items, list):
+            return jsonify({'error': 'Items must be a list'}), 400
+        if len(items) > app.config['MAX_BATCH_ITEMS']:
+            return jsonify({'error': f"At most {app.config['MAX_BATCH_ITEMS']} files per batch"}), 400
+        
+        # Validate every item and check for room before queueing anything, so a
+        # bad item cannot leave the ones before it running with no one to collect them
+        lane_counts = {}
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                return jsonify({'error': f'Item {index} must be an object'}), 400
+            try:
+                lane = validate_conversion_request(
+                    item.get('unique_filename'), item.get('conversion_type'), item.get('options')
+                )
+            except ConversionRequestError as e:
+                return jsonify({'error': f"Item {index} ({item.get('unique_filename')}): {e}"}), e.status_code
+            lane_counts[lane] = lane_counts.get(lane, 0) + 1
+        if not job_queue.has_capacity(lane_counts):
+            return jsonify({'error': 'The conversion queue is full, please retry shortly'}), 503, {'Retry-After': '5'}
+        
+        jobs = [
+            queue_conversion(item['unique_filename'], item['conversion_type'], item.get('options'))
+            for item in items
+        ]
+        
+    except ConversionRequestError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    except Exception as e:
+        print(f"Batch conversion error: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        # Add each output to the archive as soon as its job finishes
+        archive = ZipStream()
+        failures = []
+        for job in job_queue.iter_completed([job['job_id'] for job in jobs]):
+            payload = serialize_job(job)
+            if job['status'] != 'finished':
+                failures.append(f"{payload.get('conversion_type')}: {payload.get('error', 'Conversion failed')}")
+                continue
+            
+            output_path = job['result']['output_path']
+            storage.pin(output_path)
+            try:
+                metrics.download_bytes.observe(
+                    os.path.getsize(output_path),
+                    conversion_type=state_store.pop_value('output_type', payload['output_filename'], 'unknown'),
+                )
+                yield from archive.add_file(output_path, payload['clean_filename'])
+            finally:
+                storage.unpin(output_path)
+                storage.remove(output_path)
+        
+        if failures:
+            yield from archive.add_bytes('errors.txt', '\n'.join(failures) + '\n')
+        yield archive.close()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/zip',
+        headers={'Content-Disposition': 'attachment; filename=converted_files.zip'},
+    )
+
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """Get the status of a conversion job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(serialize_job(job))
+
+@app.route('/api/jobs/<job_id>/result')
+def job_result(job_id):
+    """Get the result of a conversion job once it has finished"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    payload = serialize_job(job)
+    if job['status'] == 'failed':
+        return jsonify(payload), 500
+    if job['status'] != 'finished':
+        return jsonify(payload), 202, {'Retry-After': '1'}
+    return jsonify(payload)
+
+@app.route('/api/jobs/<job_id>/events')
+def job_events(job_id):
+    """Stream a job's status and progress as server-sent events until it settles"""
+    if job_queue.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def generate():
+        for job in job_queue.watch(job_id):
+            if job is None:
+                # Comment line so proxies keep an idle stream open
+                yield ': keep-alive\n\n'
+                continue
+            event = job['status'] if job['status'] in ('finished', 'failed') else 'progress'
+            yield f"event: {event}\ndata: {json.dumps(serialize_job(job))}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    """Report result cache hit/miss counters and size"""
+    return jsonify({**result_cache.stats(), 'previews': pdf_previews.cache.stats()})
+
+@app.route('/api/preview/<unique_filename>/<int:page>')
+def preview_page(unique_filename, page):
+    """Serve a small PNG of one page of an uploaded PDF, rendered on first request"""
+    try:
+        if registry.format_for(unique_filename) != 'pdf':
+            return jsonify({'error': 'Previews are only available for PDFs'}), 400
+        if not uploads.exists(unique_filename):
+            return jsonify({'error': 'Uploaded file not found'}), 404
+        size = request.args.get('size', DEFAULT_THUMBNAIL_SIZE, type=int)
+        pages = (state_store.get_value('upload_meta', unique_filename) or {}).get('pages')
+        if page < 1 or (pages and page > pages):
+            return jsonify({'error': f'Page {page} is outside 1-{pages}'}), 404
+        file_hash = get_upload_hash(unique_filename)
+        
+        etag = PdfPreviews.make_key(file_hash, page, size)
+        if request.if_none_match.contains(etag):
+            # Already in the browser's cache; skip even reading ours
+            response = Response(status=304)
+        else:
+            response = Response(
+                pdf_previews.thumbnail(file_hash, uploads.path(unique_filename), page, size),
+                mimetype='image/png',
+            )
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.max_age = FILE_TTL
+        return response
+        
+    except PreviewError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    except Exception as e:
+        print(f"Preview error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/metrics')
+def prometheus_metrics():
+    """Export timing histograms in the Prometheus text format"""
+    return metrics.registry.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/api/jobs')
+def job_queue_stats():
+    """Report queue depth for every job lane"""
+    return jsonify({'lanes': job_queue.stats()})
+
 def get_extension_for_conversion(conversion_type):
     """Get the file extension for a conversion type"""
-    extension_map = {
-        'pdf_to_word': '.docx',
-        'word_to_pdf': '.pdf',
-        'pdf_to_png': '.png',
-        'jpeg_to_png': '.png',
-        'png_to_jpeg': '.jpg',
-        'png_to_svg': '.svg',
-        'jpeg_to_svg': '.svg',
-        'svg_to_png': '.png',
-        'svg_to_jpeg': '.jpg',
-        'mp3_to_wav': '.wav',
-        'wav_to_mp3': '.mp3',
-        'mp3_to_m4a': '.m4a',
-        'wav_to_m4a': '.m4a',
-        'm4a_to_mp3': '.mp3',
-        'm4a_to_wav': '.wav'
-    }
-    return extension_map.get(conversion_type, '.converted')
+    conversion_func = conversion_functions.get(conversion_type)
+    return conversion_func.extension if conversion_func else '.converted'
 
 @app.route('/api/download/<filename>')
 def download_file(filename):
-    """Download a converted file and delete it after download"""
+    """Download a converted file, with byte ranges and ETag revalidation
+
+    The file is deleted DOWNLOAD_GRACE seconds after the last request for it,
+    which leaves time to resume an interrupted download with a Range request.
+    """
     try:
-        file_path = os.path.join('outputs', filename)
-        print(f"Looking for file: {file_path}")
-        
-        if not os.path.exists(file_path):
-            print(f"File not found: {file_path}")
+        if not outputs.exists(filename):
+            print(f"File not found: {filename}")
             return jsonify({'error': 'File not found'}), 404
-        
-        print(f"File exists: {os.path.exists(file_path)}")
-        
-        # Send file and delete it after download
-        response = send_file(file_path, as_attachment=True, download_name=filename)
-        
-        # Delete file after sending response
-        def delete_after_response(response):
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    print(f"Deleted file after download: {file_path}")
-            except Exception as e:
-                print(f"Error deleting file: {e}")
-            return response
-        
-        response.call_on_close(lambda: delete_after_response(response))
+        file_path = outputs.path(filename)
+        etag = get_output_hash(filename)
+        
+        if DOWNLOAD_OFFLOAD in ('x-accel', 'x-sendfile'):
+            # The front server sends the bytes and handles Range itself
+            response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+            if DOWNLOAD_OFFLOAD == 'x-accel':
+                response.headers['X-Accel-Redirect'] = DOWNLOAD_ACCEL_PREFIX + filename
+            else:
+                response.headers['X-Sendfile'] = os.path.abspath(file_path)
+            response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+            response.set_etag(etag)
+            response.cache_control.no_cache = True
+            response = response.make_conditional(request)
+        else:
+            # Whole-file responses go out through the server's sendfile support
+            response = send_file(
+                os.path.abspath(file_path), as_attachment=True, download_name=filename,
+                conditional=True, etag=etag,
+            )
+        
+        if response.status_code == 200 and 'Range' not in request.headers:
+            metrics.download_bytes.observe(
+                os.path.getsize(file_path), conversion_type=state_store.get_value('output_type', filename, 'unknown')
+            )
+        storage.expire_in(file_path, DOWNLOAD_GRACE)
         return response
         
     except Exception as e:
@@ -302,7 +715,7 @@ def download_file(filename):
 
 @app.route('/api/download-zip', methods=['POST'])
 def download_zip():
-    """Download multiple files as zip and delete them after download"""
+    """Stream multiple files as a zip and delete them after download"""
     try:
         data = request.get_json()
         filenames = data.get('filenames', [])
@@ -310,37 +723,46 @@ def download_zip():
         if not filenames:
             return jsonify({'error': 'No files specified'}), 400
         
-        # Create temporary zip file
         zip_filename = f"converted_files_{uuid.uuid4()}.zip"
-        zip_path = os.path.join('outputs', zip_filename)
-        
-        with zipfile.ZipFile(zip_path, 'w') as zipf:
-            for filename in filenames:
-                file_path = os.path.join('outputs', filename)
-                if os.path.exists(file_path):
-                    zipf.write(file_path, filename)
+        file_paths = [(filename, outputs.path(filename)) for filename in filenames if outputs.exists(filename)]
         
-        # Send zip file and delete all files after download
-        response = send_file(zip_path, as_attachment=True, download_name=zip_filename)
+        def unpin_all():
+            for filename, file_path in file_paths:
+                storage.unpin(file_path)
         
-        def delete_after_response(response):
+        def generate():
+            # Entries are compressed and sent one chunk at a time, nothing is staged on disk
             try:
-                # Delete individual files
-                for filename in filenames:
-                    file_path = os.path.join('outputs', filename)
+                archive = ZipStream()
+                for filename, file_path in file_paths:
                     if os.path.exists(file_path):
-                        os.remove(file_path)
-                        print(f"Deleted file after zip download: {file_path}")
-                
-                # Delete zip file
-                if os.path.exists(zip_path):
-                    os.remove(zip_path)
-                    print(f"Deleted zip file after download: {zip_path}")
-            except Exception as e:
-                print(f"Error deleting files after zip download: {e}")
+                        metrics.download_bytes.observe(
+                            os.path.getsize(file_path), conversion_type=state_store.pop_value('output_type', filename, 'unknown')
+                        )
+                        yield from archive.add_file(file_path, filename)
+                yield archive.close()
+            finally:
+                # Also runs when the client disconnects mid-stream
+                unpin_all()
+        
+        def delete_after_response(response):
+            # Delete individual files
+            for filename, file_path in file_paths:
+                storage.remove(file_path)
             return response
         
-        response.call_on_close(lambda: delete_after_response(response))
+        for filename, file_path in file_paths:
+            storage.pin(file_path)
+        try:
+            response = Response(
+                stream_with_context(generate()),
+                mimetype='application/zip',
+                headers={'Content-Disposition': f'attachment; filename={zip_filename}'},
+            )
+            response.call_on_close(lambda: delete_after_response(response))
+        except Exception:
+            unpin_all()
+            raise
         return response
         
     except Exception as e:
@@ -357,19 +779,7 @@ def cleanup_session():
         if not session_id:
             return jsonify({'error': 'No session ID provided'}), 400
         
-        deleted_count = 0
-        if session_id in uploaded_files:
-            for file_path in uploaded_files[session_id]:
-                try:
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                        deleted_count += 1
-                        print(f"Deleted uploaded file: {file_path}")
-                except Exception as e:
-                    print(f"Error deleting file {file_path}: {e}")
-            
-            # Remove session from tracking
-            del uploaded_files[session_id]
+        deleted_count = storage.remove_owner(session_id, kind='upload')
         
         print(f"Cleaned up {deleted_count} files for session: {session_id}")
         return jsonify({'message': f'Cleaned up {deleted_count} files', 'deleted_count': deleted_count})
@@ -378,46 +788,36 @@ def cleanup_session():
         print(f"Cleanup error: {e}")
         return jsonify({'error': str(e)}), 500
 
-def cleanup_old_files():
-    """Clean up files older than 1 hour"""
-    import time
-    current_time = time.time()
-    max_age = 3600  # 1 hour in seconds
+def sweep_storage():
+    """Expire old files and the bookkeeping that refers to them
+
+    Only files whose expiry has passed are touched; the result cache has its
+    own folder and expiry, so it is asked to drop expired entries separately.
+    """
+    storage.evict_expired()
+    
+    # Drop resumable uploads that were abandoned part way through
+    chunked_uploads.expire(FILE_TTL)
     
-    # Clean up uploads folder
-    upload_dir = app.config['UPLOAD_FOLDER']
-    if os.path.exists(upload_dir):
-        for filename in os.listdir(upload_dir):
-            file_path = os.path.join(upload_dir, filename)
-            if os.path.isfile(file_path):
-                file_age = current_time - os.path.getmtime(file_path)
-                if file_age > max_age:
-                    try:
-                        os.remove(file_path)
-                        print(f"Cleaned up old upload file: {filename}")
-                    except Exception as e:
-                        print(f"Error cleaning up {filename}: {e}")
+    # And job directories whose worker was killed before it could remove them
+    remove_stale_workdirs(OUTPUT_FOLDER, FILE_TTL)
     
-    # Clean up outputs folder
-    output_dir = app.config['OUTPUT_FOLDER']
-    if os.path.exists(output_dir):
-        for filename in os.listdir(output_dir):
-            file_path = os.path.join(output_dir, filename)
-            if os.path.isfile(file_path):
-                file_age = current_time - os.path.getmtime(file_path)
-                if file_age > max_age:
-                    try:
-                        os.remove(file_path)
-                        print(f"Cleaned up old output file: {filename}")
-                    except Exception as e:
-                        print(f"Error cleaning up {filename}: {e}")
+    result_cache.evict_expired()
+    pdf_previews.cache.evict_expired()
+    job_queue.prune(FILE_TTL)
 
 @app.route('/api/cleanup', methods=['POST'])
 def manual_cleanup():
     """Manual cleanup endpoint"""
-    cleanup_old_files()
+    sweep_storage()
     return jsonify({'message': 'Cleanup completed'})
 
+@app.route('/api/storage')
+def storage_usage():
+    """Report disk usage against the quota, overall or for one session"""
+    session_id = request.args.get('session_id')
+    return jsonify(storage.usage(session_id) if session_id else storage.usage())
+
 @app.route('/api/terms/<filename>')
 def get_terms(filename):
     """Get terms and conditions file"""
@@ -439,13 +839,53 @@ def get_terms(filename):
 @app.route('/api/health')
 def health_check():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy'})
+    return jsonify({
+        'status': 'healthy',
+        'startup_seconds': round(startup_seconds, 4),
+        'uptime_seconds': round(time.time() - started_at, 1),
+        'workers': worker_status,
+    })
+
+def watch_worker_startup():
+    """Record each worker process as it finishes preloading its libraries"""
+    while True:
+        info = worker_ready.get()
+        status = worker_status.setdefault(info['lane'], {'started': 0, 'warmup_seconds': 0.0})
+        status['started'] += 1
+        status['warmup_seconds'] = round(max(status['warmup_seconds'], info['warmup_seconds']), 4)
+        metrics.workers_started.inc(lane=info['lane'])
+        metrics.startup_seconds.set(info['warmup_seconds'], process=f"{info['lane']}_worker")
+
+def warm_workers():
+    """Start every conversion worker ahead of the first job"""
+    started = time.perf_counter()
+    try:
+        job_queue.warm()
+    except Exception as e:
+        print(f"Worker warm-up failed: {e}")
+        return
+    elapsed = time.perf_counter() - started
+    metrics.startup_seconds.set(elapsed, process='worker_pools')
+    print(f"Conversion workers ready in {elapsed:.2f}s")
+
+started_at = time.time()
+startup_seconds = time.perf_counter() - _import_started
+metrics.startup_seconds.set(startup_seconds, process='api')
+
+# Warm the pools in the background so the API answers immediately. Child
+# processes that re-import this module (spawn) must not start pools of their own.
+if multiprocessing.parent_process() is None:
+    # Index files left by a previous run once, then sweep incrementally
+    storage.scan(UPLOAD_FOLDER, 'upload')
+    storage.scan(OUTPUT_FOLDER, 'output')
+    storage.start(int(os.environ.get('STORAGE_SWEEP_INTERVAL', 60)), sweep_storage)
+    threading.Thread(target=watch_worker_startup, name='worker-startup', daemon=True).start()
+    if os.environ.get('WARM_WORKERS', '1') != '0':
+        threading.Thread(target=warm_workers, name='warm-workers', daemon=True).start()
 
 if __name__ == '__main__':
-    # Run initial cleanup
-    cleanup_old_files()
     print("File Converter API started with automatic cleanup enabled")
-    print("Files will be kept for 1 hour before automatic deletion")
+    print(f"Files will be kept for {FILE_TTL} seconds before automatic deletion")
     
     # Get port from environment variable (for cloud deployment)
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,316 @@
+"""Convert directory trees of files without the API
+
+Usage (from web_app/backend):
+
+    python batch_convert.py assets/ --to webp --output-dir converted/
+    python batch_convert.py scans/ --to jpeg png --output-dir out/ --options '{"dpi": 150}'
+
+Inputs are walked recursively and converted across a process pool into the
+same layout under the output directory. A manifest in the output directory
+records each input's size, mtime and SHA-256, so a re-run skips files that
+have not changed. Outputs are renamed into place only once complete.
+"""
+import argparse
+import fnmatch
+import importlib
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from converter import instrumentation, registry
+from conversion_tasks import staged_input, supported_options
+from result_cache import file_sha256
+
+MANIFEST_NAME = '.batch-manifest.json'
+MANIFEST_VERSION = 1
+# Seconds between manifest saves and progress lines during a run
+SAVE_INTERVAL = 10.0
+
+
+def load_manifest(path):
+    """Read a manifest written by an earlier run, or start an empty one"""
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        print(f"Ignoring manifest {path}: unknown version")
+        return {}
+    return manifest['entries']
+
+
+def save_manifest(path, entries):
+    """Write the manifest atomically, so an interrupted run never leaves half a file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix='.manifest-', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'entries': entries}, f, separators=(',', ':'))
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def resolve_target(name):
+    """Accept a format name ('jpeg') or an extension ('jpg', '.jpg')"""
+    name = name.lower().lstrip('.')
+    if name in registry.FORMATS and registry.is_file_format(name):
+        return name
+    target = registry.format_for(f'file.{name}')
+    if target is None:
+        raise ValueError(f"Unknown output format '{name}'")
+    return target
+
+
+def walk_inputs(paths, include=None, exclude_dir=None):
+    """Yield (path, path relative to its input root) for every file, in sorted order"""
+    exclude_dir = os.path.abspath(exclude_dir) if exclude_dir else None
+    for root in paths:
+        if os.path.isfile(root):
+            yield root, os.path.basename(root)
+            continue
+        for directory, subdirectories, filenames in os.walk(root):
+            # Never convert our own outputs when they live inside an input tree
+            subdirectories[:] = sorted(name for name in subdirectories
+                                       if os.path.abspath(os.path.join(directory, name)) != exclude_dir)
+            for filename in sorted(filenames):
+                if filename.startswith('.'):
+                    continue
+                if include and not any(fnmatch.fnmatch(filename, pattern) for pattern in include):
+                    continue
+                path = os.path.join(directory, filename)
+                yield path, os.path.relpath(path, root)
+
+
+def options_key(options):
+    return json.dumps(options, sort_keys=True)
+
+
+def preload(modules):
+    """Process pool initializer: import the converters this run needs up front"""
+    for module in modules:
+        importlib.import_module(module)
+
+
+def convert_one(input_path, output_path, conversion_type, options, known_sha256=None):
+    """Convert one file and rename the result into place; runs in a worker process
+
+    The input is linked into a private directory next to the output, so
+    converters never write into the source tree and a partial output is
+    never visible under its final name. When the content hash matches
+    known_sha256 and the output exists, nothing is converted.
+    """
+    started = time.perf_counter()
+    sha256 = file_sha256(input_path)
+    if sha256 == known_sha256 and os.path.exists(output_path):
+        return {'status': 'unchanged', 'sha256': sha256, 'output_path': output_path}
+
+    plan = registry.conversion_plans()[conversion_type]
+    output_dir = os.path.dirname(output_path)
+    os.makedirs(output_dir, exist_ok=True)
+    with staged_input(input_path, output_dir, prefix='.batch-') as staged_path:
+        instrumentation.collect()
+        result_path = plan(staged_path, **supported_options(plan, options))
+        if not result_path or not os.path.exists(result_path):
+            raise RuntimeError('Conversion produced no output')
+        # Some options change the output format (e.g. several PDF pages become a ZIP)
+        extension = os.path.splitext(result_path)[1]
+        if not output_path.lower().endswith(extension.lower()):
+            output_path = os.path.splitext(output_path)[0] + extension
+        os.replace(result_path, output_path)
+        # Audio analysis, when asked for, is written beside the output
+        if os.path.exists(result_path + instrumentation.ANALYSIS_SUFFIX):
+            os.replace(result_path + instrumentation.ANALYSIS_SUFFIX, output_path + instrumentation.ANALYSIS_SUFFIX)
+
+    return {
+        'status': 'converted',
+        'sha256': sha256,
+        'output_path': output_path,
+        'output_bytes': os.path.getsize(output_path),
+        'seconds': time.perf_counter() - started,
+        'timings': instrumentation.collect(),
+    }
+
+
+def plan_tasks(args, targets, entries):
+    """Pair every input with its conversions; skip those the manifest shows are current
+
+    Returns (tasks, counts) where each task is (manifest key, input path,
+    output path, conversion type, stat result, known hash).
+    """
+    tasks = []
+    counts = {'skipped': 0, 'unsupported': 0}
+    taken = set()
+    current_options = options_key(args.options)
+    for input_path, relative_path in walk_inputs(args.inputs, args.include, args.output_dir):
+        source = registry.format_for(input_path)
+        stat = os.stat(input_path)
+        for target in targets:
+            plan = registry.plan(source, target) if source else None
+            if plan is None:
+                counts['unsupported'] += 1
+                continue
+            output_path = os.path.join(args.output_dir, os.path.splitext(relative_path)[0] + plan.extension)
+            if output_path in taken:
+                # a.png and a.jpg would both become a.webp, so keep the source extension
+                output_path = os.path.join(args.output_dir, relative_path + plan.extension)
+            taken.add(output_path)
+
+            key = f'{relative_path}:{target}'
+            entry = entries.get(key)
+            known_sha256 = None
+            if entry and entry['options'] == current_options and not args.force:
+                if (entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+                        and os.path.exists(entry['output_path'])):
+                    counts['skipped'] += 1
+                    continue
+                # Touched or copied but maybe not changed: the worker compares hashes
+                known_sha256 = entry['sha256']
+            tasks.append((key, input_path, output_path, plan.__name__, stat, known_sha256))
+    return tasks, counts
+
+
+def format_bytes(size):
+    if size < 1024:
+        return f'{size:.0f} B'
+    for unit in ('KB', 'MB'):
+        size /= 1024
+        if size < 1024:
+            return f'{size:.1f} {unit}'
+    return f'{size / 1024:.1f} GB'
+
+
+def run_batch(args, targets):
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest_path = args.manifest or os.path.join(args.output_dir, MANIFEST_NAME)
+    entries = load_manifest(manifest_path)
+
+    started = time.perf_counter()
+    tasks, counts = plan_tasks(args, targets, entries)
+    counts.update({'converted': 0, 'unchanged': 0, 'failed': 0})
+    print(f"{len(tasks)} conversion(s) to run, {counts['skipped']} up to date, "
+          f"{counts['unsupported']} unsupported")
+
+    modules = sorted({module for task in tasks for module in registry.conversion_plans()[task[3]].modules})
+    input_bytes = output_bytes = 0
+    timings = {}
+    failures = []
+    pending = {}
+    queue = iter(tasks)
+    last_save = time.monotonic()
+    # Enough queued work to keep every worker busy without submitting the whole tree
+    window = args.workers * 4
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=preload, initargs=(modules,)) as executor:
+            while True:
+                for task in queue:
+                    key, input_path, output_path, conversion_type, stat, known_sha256 = task
+                    future = executor.submit(convert_one, input_path, output_path, conversion_type,
+                                             args.options, known_sha256)
+                    pending[future] = task
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, input_path, output_path, conversion_type, stat, _ = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        counts['failed'] += 1
+                        failures.append((input_path, conversion_type, str(e)))
+                        print(f"Failed: {input_path} ({conversion_type}): {e}")
+                        continue
+
+                    counts[result['status']] += 1
+                    converted_at = entries.get(key, {}).get('converted_at')
+                    if result['status'] == 'converted':
+                        converted_at = time.time()
+                    entries[key] = {
+                        'size': stat.st_size,
+                        'mtime_ns': stat.st_mtime_ns,
+                        'sha256': result['sha256'],
+                        'options': options_key(args.options),
+                        'output_path': result['output_path'],
+                        'converted_at': converted_at,
+                    }
+                    if result['status'] == 'converted':
+                        input_bytes += stat.st_size
+                        output_bytes += result['output_bytes']
+                        for stage, seconds in result['timings'].items():
+                            timings[stage] = timings.get(stage, 0.0) + seconds
+
+                if time.monotonic() - last_save >= SAVE_INTERVAL:
+                    save_manifest(manifest_path, entries)
+                    last_save = time.monotonic()
+                    finished = counts['converted'] + counts['unchanged'] + counts['failed']
+                    elapsed = time.perf_counter() - started
+                    print(f"{finished}/{len(tasks)} done, {finished / elapsed:.1f} files/s")
+    finally:
+        # An interrupted run keeps everything it finished
+        save_manifest(manifest_path, entries)
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        **counts,
+        'input_bytes': input_bytes,
+        'output_bytes': output_bytes,
+        'seconds': round(elapsed, 3),
+        'files_per_second': round(counts['converted'] / elapsed, 2) if elapsed else None,
+        'bytes_per_second': round(input_bytes / elapsed) if elapsed else None,
+        'stage_seconds': {stage: round(seconds, 3) for stage, seconds in sorted(timings.items())},
+        'failures': [{'input': path, 'conversion_type': conversion_type, 'error': error}
+                     for path, conversion_type, error in failures],
+    }
+    print_summary(summary, args.workers)
+    if args.summary_json:
+        with open(args.summary_json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return 1 if failures else 0
+
+
+def print_summary(summary, workers):
+    print(f"Converted {summary['converted']}, unchanged {summary['unchanged']}, "
+          f"up to date {summary['skipped']}, failed {summary['failed']}, "
+          f"unsupported {summary['unsupported']}")
+    print(f"Read {format_bytes(summary['input_bytes'])}, wrote {format_bytes(summary['output_bytes'])} "
+          f"in {summary['seconds']:.1f}s with {workers} worker(s): "
+          f"{summary['files_per_second'] or 0:.1f} files/s, "
+          f"{format_bytes(summary['bytes_per_second'] or 0)}/s")
+    if summary['stage_seconds']:
+        # Summed over workers, so these can exceed the wall-clock time
+        stages = ', '.join(f'{stage} {seconds:.1f}s' for stage, seconds in
+                           sorted(summary['stage_seconds'].items(), key=lambda item: -item[1]))
+        print(f"Worker time by stage: {stages}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert directory trees with a process pool')
+    parser.add_argument('inputs', nargs='+', help='Files or directories to convert')
+    parser.add_argument('--to', nargs='+', required=True, help="Output formats, e.g. 'webp' or 'jpg pdf'")
+    parser.add_argument('--output-dir', required=True)
+    parser.add_argument('--include', nargs='+', help="Only files matching these patterns, e.g. '*.png'")
+    parser.add_argument('--options', type=json.loads, default={}, help='JSON options passed to every conversion')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--manifest', help=f'Manifest path (default: <output-dir>/{MANIFEST_NAME})')
+    parser.add_argument('--force', action='store_true', help='Convert everything, ignoring the manifest')
+    parser.add_argument('--summary-json', help='Also write the run summary as JSON here')
+    args = parser.parse_args(argv)
+
+    try:
+        targets = [resolve_target(name) for name in args.to]
+    except ValueError as e:
+        parser.error(str(e))
+    return run_batch(args, targets)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
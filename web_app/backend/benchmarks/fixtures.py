@@ -0,0 +1,139 @@
+"""Synthetic input files for the conversion benchmarks"""
+import math
+import os
+import shutil
+import struct
+import subprocess
+import wave
+
+import fitz  # PyMuPDF
+from docx import Document
+from PIL import Image
+
+IMAGE_SIZES = {
+    'small': (640, 480),
+    'medium': (1920, 1080),
+    'large': (4000, 3000),
+}
+PDF_PAGES = {'short': 5, 'long': 40}
+DOCX_PARAGRAPHS = {'short': 50, 'long': 1000}
+AUDIO_SECONDS = {'short': 10, 'long': 120}
+
+
+def _make_image(size, with_alpha):
+    """Gradient with a noise layer so encoders do real work"""
+    width, height = size
+    gradient = Image.linear_gradient('L').resize(size)
+    noise = Image.effect_noise(size, 64)
+    image = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    if with_alpha:
+        image.putalpha(Image.radial_gradient('L').resize(size))
+    return image
+
+
+def _write_svg(path):
+    shapes = []
+    for index in range(40):
+        angle = index * math.pi / 20
+        shapes.append(
+            f'<circle cx="{256 + 180 * math.cos(angle):.1f}" cy="{256 + 180 * math.sin(angle):.1f}" '
+            f'r="{10 + index % 7 * 4}" fill="hsl({index * 9}, 70%, 50%)"/>'
+        )
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<svg xmlns="http://www.w3.org/2000/svg" width="512" height="512" viewBox="0 0 512 512">\n'
+                '<rect width="512" height="512" fill="#f4f4f4"/>\n' + '\n'.join(shapes) + '\n</svg>\n')
+
+
+def _write_pdf(path, pages, image):
+    document = fitz.open()
+    buffer_path = f"{path}.jpg"
+    image.convert('RGB').save(buffer_path, 'JPEG', quality=80)
+    for number in range(pages):
+        page = document.new_page()
+        page.insert_text((72, 72), f"Benchmark page {number + 1}", fontsize=24)
+        text = ' '.join(f"word{index}" for index in range(400))
+        page.insert_textbox(fitz.Rect(72, 100, 540, 400), text, fontsize=10)
+        page.insert_image(fitz.Rect(72, 420, 540, 720), filename=buffer_path)
+    document.save(path)
+    document.close()
+    os.remove(buffer_path)
+
+
+def _write_docx(path, paragraphs):
+    document = Document()
+    document.add_heading('Benchmark document', level=1)
+    for index in range(paragraphs):
+        document.add_paragraph(f"Paragraph {index}: " + ' '.join(f"word{n}" for n in range(60)))
+    document.save(path)
+
+
+def _write_wav(path, seconds, rate=44100):
+    # A 440 Hz tone repeats exactly every second, so build one second and repeat it
+    one_second = bytearray()
+    for index in range(rate):
+        sample = int(12000 * math.sin(2 * math.pi * 440 * index / rate))
+        one_second += struct.pack('<hh', sample, sample)
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        for _ in range(seconds):
+            wav.writeframes(one_second)
+
+
+def _encode_with_ffmpeg(wav_path, output_path, codec_args):
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        return False
+    subprocess.run([ffmpeg, '-loglevel', 'error', '-y', '-i', wav_path] + codec_args + [output_path], check=True)
+    return True
+
+
+def generate_fixtures(directory):
+    """Create every fixture in directory and return {extension: [(label, path), ...]}"""
+    os.makedirs(directory, exist_ok=True)
+    fixtures = {}
+
+    def add(extension, label, path):
+        fixtures.setdefault(extension, []).append((label, path))
+
+    for label, size in IMAGE_SIZES.items():
+        image = _make_image(size, with_alpha=True)
+        png_path = os.path.join(directory, f"image_{label}.png")
+        image.save(png_path, 'PNG')
+        add('png', f"{label}_{size[0]}x{size[1]}", png_path)
+
+        jpeg_path = os.path.join(directory, f"image_{label}.jpg")
+        image.convert('RGB').save(jpeg_path, 'JPEG', quality=90)
+        add('jpg', f"{label}_{size[0]}x{size[1]}", jpeg_path)
+
+    svg_path = os.path.join(directory, 'icon.svg')
+    _write_svg(svg_path)
+    add('svg', 'icon_512', svg_path)
+
+    page_image = _make_image((800, 500), with_alpha=False)
+    for label, pages in PDF_PAGES.items():
+        path = os.path.join(directory, f"document_{label}.pdf")
+        _write_pdf(path, pages, page_image)
+        add('pdf', f"{pages}_pages", path)
+
+    for label, paragraphs in DOCX_PARAGRAPHS.items():
+        path = os.path.join(directory, f"document_{label}.docx")
+        _write_docx(path, paragraphs)
+        add('docx', f"{paragraphs}_paragraphs", path)
+
+    for label, seconds in AUDIO_SECONDS.items():
+        wav_path = os.path.join(directory, f"audio_{label}.wav")
+        _write_wav(wav_path, seconds)
+        add('wav', f"{seconds}s", wav_path)
+
+        mp3_path = os.path.join(directory, f"audio_{label}.mp3")
+        if _encode_with_ffmpeg(wav_path, mp3_path, ['-c:a', 'libmp3lame', '-b:a', '192k']):
+            add('mp3', f"{seconds}s", mp3_path)
+
+        m4a_path = os.path.join(directory, f"audio_{label}.m4a")
+        if _encode_with_ffmpeg(wav_path, m4a_path, ['-c:a', 'aac', '-b:a', '192k']):
+            add('m4a', f"{seconds}s", m4a_path)
+
+    return fixtures
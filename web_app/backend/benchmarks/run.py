@@ -0,0 +1,291 @@
+"""Benchmark every registered conversion and compare benchmark runs
+
+Usage (from web_app/backend):
+
+    python -m benchmarks.run run --output bench.json
+    python -m benchmarks.run compare baseline.json bench.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.fixtures import generate_fixtures
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _maxrss_kb(who=resource.RUSAGE_SELF):
+    peak = resource.getrusage(who).ru_maxrss
+    # macOS reports bytes, Linux reports kilobytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def _current_rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return _maxrss_kb()
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def _import_app(workdir, warm_workers=True):
+    """Import the Flask app with its upload/output folders inside workdir"""
+    os.chdir(workdir)
+    os.environ['WARM_WORKERS'] = '1' if warm_workers else '0'
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    # Every repetition must really convert, so keep the result cache empty
+    os.environ['RESULT_CACHE_MAX_BYTES'] = '0'
+    import app
+    return app
+
+
+def _run_in_process_case(workdir, conversion_type, fixture_path, repeat, warmup, options):
+    """Time a converter called directly; runs in a fresh process per case"""
+    # Converters are called directly here, so the job worker pools are not needed
+    app = _import_app(workdir, warm_workers=False)
+    from conversion_tasks import supported_options
+    conversion_func = app.conversion_functions[conversion_type].load()
+    options = supported_options(conversion_func, options)
+    baseline_rss = _current_rss_kb()
+    extension = os.path.splitext(fixture_path)[1]
+
+    latencies = []
+    errors = []
+    for index in range(warmup + repeat):
+        input_path = os.path.join(workdir, f"bench_{conversion_type}_{index}{extension}")
+        shutil.copy2(fixture_path, input_path)
+        started = time.perf_counter()
+        try:
+            output_path = conversion_func(input_path, **options)
+            elapsed = time.perf_counter() - started
+            if not output_path or not os.path.exists(output_path):
+                raise RuntimeError('Conversion produced no output')
+            os.remove(output_path)
+            if index >= warmup:
+                latencies.append(elapsed)
+        except Exception as e:
+            errors.append(str(e))
+        finally:
+            if os.path.exists(input_path):
+                os.remove(input_path)
+
+    return {
+        'latencies': latencies,
+        'errors': errors,
+        'baseline_rss_kb': baseline_rss,
+        'peak_rss_kb': _maxrss_kb(),
+        'peak_child_rss_kb': _maxrss_kb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def _run_flask_case(app, conversion_type, fixture_path, repeat, warmup, options, timeout=600):
+    """Time upload, queued conversion and download through the Flask test client"""
+    client = app.app.test_client()
+    latencies = []
+    errors = []
+
+    for index in range(warmup + repeat):
+        started = time.perf_counter()
+        try:
+            with open(fixture_path, 'rb') as f:
+                upload = client.post('/api/upload', data={'file': (f, os.path.basename(fixture_path))})
+            if upload.status_code != 200:
+                raise RuntimeError(f"Upload failed: {upload.get_json()}")
+
+            response = client.post('/api/convert', json={
+                'unique_filename': upload.get_json()['unique_filename'],
+                'conversion_type': conversion_type,
+                'options': options,
+            })
+            job = response.get_json()
+            if response.status_code >= 400:
+                raise RuntimeError(job.get('error'))
+
+            deadline = time.monotonic() + timeout
+            while job['status'] in ('queued', 'running'):
+                if time.monotonic() > deadline:
+                    raise RuntimeError('Timed out waiting for the job')
+                time.sleep(0.01)
+                job = client.get(job['status_url']).get_json()
+            if job['status'] != 'finished':
+                raise RuntimeError(job.get('error'))
+
+            download = client.get(job['download_url'])
+            download.get_data()
+            download.close()
+            elapsed = time.perf_counter() - started
+            if index >= warmup:
+                latencies.append(elapsed)
+        except Exception as e:
+            errors.append(str(e))
+
+    return {'latencies': latencies, 'errors': errors}
+
+
+def _summarize(conversion_type, label, fixture_path, mode, raw):
+    latencies = raw['latencies']
+    size = os.path.getsize(fixture_path)
+    mean = sum(latencies) / len(latencies) if latencies else None
+    summary = {
+        'conversion_type': conversion_type,
+        'fixture': label,
+        'mode': mode,
+        'input_bytes': size,
+        'runs': len(latencies),
+        'errors': raw['errors'][:3],
+        'error_count': len(raw['errors']),
+        'p50_seconds': percentile(latencies, 0.50),
+        'p95_seconds': percentile(latencies, 0.95),
+        'mean_seconds': mean,
+        'files_per_second': 1 / mean if mean else None,
+        'throughput_mb_per_second': size / mean / (1024 * 1024) if mean else None,
+    }
+    for key in ('baseline_rss_kb', 'peak_rss_kb', 'peak_child_rss_kb'):
+        if key in raw:
+            summary[key] = raw[key]
+    return summary
+
+
+def run_benchmarks(args):
+    # The app is imported with its working directory inside workdir, so
+    # resolve user-supplied paths first
+    output_path = os.path.abspath(args.output)
+    workdir = tempfile.mkdtemp(prefix='converter_bench_')
+    fixtures_dir = os.path.abspath(args.fixtures_dir) if args.fixtures_dir else os.path.join(workdir, 'fixtures')
+    print(f"Generating fixtures in {fixtures_dir}")
+    fixtures = generate_fixtures(fixtures_dir)
+
+    app = _import_app(workdir)
+    cases = []
+    for extension, items in sorted(fixtures.items()):
+        for conversion_type in app.get_available_conversions(f"fixture.{extension}"):
+            if args.only and conversion_type not in args.only:
+                continue
+            for label, path in items:
+                cases.append((conversion_type, label, path))
+
+    options = json.loads(args.options) if args.options else {}
+    results = []
+    spawn = multiprocessing.get_context('spawn')
+    try:
+        for conversion_type, label, path in cases:
+            if 'in-process' in args.modes:
+                print(f"[in-process] {conversion_type} {label}")
+                # A fresh process per case keeps peak RSS attributable to it
+                with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+                    raw = executor.submit(
+                        _run_in_process_case, workdir, conversion_type, path,
+                        args.repeat, args.warmup, options,
+                    ).result()
+                results.append(_summarize(conversion_type, label, path, 'in-process', raw))
+
+            if 'flask' in args.modes:
+                print(f"[flask] {conversion_type} {label}")
+                raw = _run_flask_case(app, conversion_type, path, args.repeat, args.warmup, options)
+                results.append(_summarize(conversion_type, label, path, 'flask', raw))
+    finally:
+        app.job_queue.shutdown()
+
+    report = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+            'warmup': args.warmup,
+            'options': options,
+        },
+        'results': results,
+    }
+
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {output_path}")
+
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+def compare_reports(args):
+    """Print p50/p95 changes between two reports; exit 1 on regressions"""
+    with open(args.baseline) as f:
+        baseline = {(r['conversion_type'], r['fixture'], r['mode']): r for r in json.load(f)['results']}
+    with open(args.candidate) as f:
+        candidate = json.load(f)['results']
+
+    regressions = 0
+    print(f"{'conversion':<14} {'fixture':<20} {'mode':<11} {'p50 old':>9} {'p50 new':>9} {'change':>8}")
+    for result in candidate:
+        key = (result['conversion_type'], result['fixture'], result['mode'])
+        old = baseline.get(key)
+        if not old or not old['p50_seconds'] or not result['p50_seconds']:
+            continue
+
+        change = result['p50_seconds'] / old['p50_seconds'] - 1
+        flag = ''
+        if change > args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        elif change < -args.threshold:
+            flag = '  faster'
+        print(f"{key[0]:<14} {key[1]:<20} {key[2]:<11} "
+              f"{old['p50_seconds']:>9.4f} {result['p50_seconds']:>9.4f} {change:>+8.1%}{flag}")
+
+        if result['error_count'] and not old['error_count']:
+            print(f"    new errors: {result['errors']}")
+            regressions += 1
+
+    print(f"{regressions} regression(s) above {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Conversion benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='Run the benchmarks')
+    run.add_argument('--output', default='bench.json')
+    run.add_argument('--repeat', type=int, default=5)
+    run.add_argument('--warmup', type=int, default=1)
+    run.add_argument('--modes', nargs='+', default=['in-process', 'flask'], choices=['in-process', 'flask'])
+    run.add_argument('--only', nargs='+', help='Only these conversion types')
+    run.add_argument('--options', help='JSON options passed to every conversion')
+    run.add_argument('--fixtures-dir', help='Where to write fixtures (default: a temp dir)')
+    run.add_argument('--keep', action='store_true', help='Keep the temporary working directory')
+
+    compare = commands.add_parser('compare', help='Compare two benchmark reports')
+    compare.add_argument('baseline')
+    compare.add_argument('candidate')
+    compare.add_argument('--threshold', type=float, default=0.10, help='Relative p50 slowdown to flag')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        return run_benchmarks(args)
+    return compare_reports(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
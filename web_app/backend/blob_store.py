@@ -0,0 +1,67 @@
+import abc
+import os
+
+from werkzeug.utils import secure_filename
+
+
+class BlobStore(abc.ABC):
+    """Named file storage for uploads and outputs
+
+    Converters work on local paths, so every store hands out one through
+    path(). A networked store (S3, GCS, ...) would keep a local cache there,
+    fetch blobs on path() and upload them on commit().
+    """
+
+    @abc.abstractmethod
+    def path(self, name):
+        """Local filesystem path holding the named blob"""
+
+    @abc.abstractmethod
+    def commit(self, name):
+        """Publish a blob after it was written completely at path(name)"""
+
+    @abc.abstractmethod
+    def exists(self, name):
+        """Whether the named blob exists"""
+
+    @abc.abstractmethod
+    def size(self, name):
+        """Size of the named blob in bytes"""
+
+    @abc.abstractmethod
+    def delete(self, name):
+        """Remove the named blob if it exists"""
+
+
+class FilesystemBlobStore(BlobStore):
+    """Blobs as files in one directory, shared by every process that mounts it"""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, name):
+        # Names come from clients, so never let them leave the directory
+        if not name or secure_filename(name) != name:
+            raise ValueError(f'Invalid file name: {name!r}')
+        return os.path.join(self.root, name)
+
+    def commit(self, name):
+        # Already visible to every process sharing the directory
+        pass
+
+    def exists(self, name):
+        try:
+            return os.path.isfile(self.path(name))
+        except ValueError:
+            return False
+
+    def size(self, name):
+        return os.path.getsize(self.path(name))
+
+    def delete(self, name):
+        try:
+            os.remove(self.path(name))
+            return True
+        except FileNotFoundError:
+            return False
@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+
+from werkzeug.utils import secure_filename
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+READ_SIZE = 64 * 1024
+# A chunk write holds its upload's lock this long at most, so a process
+# killed mid-chunk only blocks that upload until the lease runs out
+CHUNK_LOCK_SECONDS = int(os.environ.get('CHUNK_LOCK_SECONDS', 3600))
+
+
+class UploadError(Exception):
+    """Raised when a chunk cannot be accepted"""
+    status_code = 400
+
+
+class UploadNotFound(UploadError):
+    status_code = 404
+
+
+class OffsetMismatch(UploadError):
+    """Raised when a chunk does not start where the stored data ends"""
+    status_code = 409
+
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
+
+
+def parse_content_range(header):
+    """Parse 'bytes start-end/total' into (start, end, total)"""
+    match = CONTENT_RANGE_RE.match((header or '').strip())
+    if not match:
+        raise UploadError('Missing or invalid Content-Range header')
+    start, end, total = (int(value) for value in match.groups())
+    if end < start or end >= total:
+        raise UploadError('Invalid Content-Range header')
+    return start, end, total
+
+
+def copy_stream(stream, destination, digest, length=None, head_check=None):
+    """Copy a stream to an open file in fixed-size pieces, updating digest
+
+    ``head_check(first_piece)`` can reject the data before anything is written.
+    """
+    written = 0
+    while length is None or written < length:
+        size = READ_SIZE if length is None else min(READ_SIZE, length - written)
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        if head_check is not None and written == 0:
+            head_check(chunk)
+        destination.write(chunk)
+        digest.update(chunk)
+        written += len(chunk)
+    return written
+
+
+def save_stream(stream, path, head_check=None):
+    """Write a stream to path and return its SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        copy_stream(stream, f, digest, head_check=head_check)
+    return digest.hexdigest()
+
+
+class ChunkedUploadManager:
+    """Resumable uploads written chunk by chunk into uploads/.partial
+
+    Upload state lives in the shared folder and each chunk is written under
+    a lock in the shared state store, so chunks of one upload may arrive at
+    any process. The running hashes are a per-process shortcut: one is used
+    only if it covers exactly the bytes on disk, which are never rewritten
+    below the current offset, and is rebuilt from the file otherwise.
+    """
+
+    def __init__(self, store, upload_dir, max_size, head_check=None):
+        self.store = store
+        self.upload_dir = upload_dir
+        self.head_check = head_check  # head_check(filename, first_bytes), may raise
+        self.partial_dir = os.path.join(upload_dir, '.partial')
+        self.max_size = max_size
+        self._digests = {}  # upload_id -> (offset, running SHA-256)
+        os.makedirs(self.partial_dir, exist_ok=True)
+
+    def _state_path(self, upload_id):
+        return os.path.join(self.partial_dir, f"{upload_id}.json")
+
+    def _data_path(self, upload_id):
+        return os.path.join(self.partial_dir, f"{upload_id}.part")
+
+    @contextmanager
+    def _upload_lock(self, upload_id):
+        """Hold the upload's lock in the state store, or raise OffsetMismatch if another chunk has it"""
+        name = f'upload:{upload_id}'
+        owner = uuid.uuid4().hex
+        now = time.time()
+        if not self.store.acquire_lock(name, owner, now + CHUNK_LOCK_SECONDS, now):
+            raise OffsetMismatch('Another chunk of this upload is being written', self.get(upload_id)['offset'])
+        try:
+            yield
+        finally:
+            self.store.release_lock(name, owner)
+
+    def _save_state(self, state):
+        tmp_path = f"{self._state_path(state['upload_id'])}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._state_path(state['upload_id']))
+
+    def create(self, filename, size, session_id):
+        """Start a new resumable upload"""
+        if size <= 0:
+            raise UploadError('Upload size must be positive')
+        if size > self.max_size:
+            raise UploadError(f'File is larger than the {self.max_size} byte limit')
+
+        filename = secure_filename(filename or 'unknown')
+        upload_id = str(uuid.uuid4())
+        state = {
+            'upload_id': upload_id,
+            'filename': filename,
+            'unique_filename': f"{uuid.uuid4()}_{filename}",
+            'size': size,
+            'offset': 0,
+            'session_id': session_id,
+            'created_at': time.time(),
+        }
+        open(self._data_path(upload_id), 'wb').close()
+        self._save_state(state)
+        self._digests[upload_id] = (0, hashlib.sha256())
+        return state
+
+    def get(self, upload_id):
+        """Load the state of an upload"""
+        if not re.fullmatch(r'[0-9a-f-]{36}', upload_id or ''):
+            raise UploadNotFound('Upload not found')
+        try:
+            with open(self._state_path(upload_id)) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            raise UploadNotFound('Upload not found')
+        # The data file is the source of truth if a previous write was cut off
+        state['offset'] = os.path.getsize(self._data_path(upload_id))
+        return state
+
+    def _get_digest(self, upload_id, offset):
+        """Return a running hash covering exactly the first offset bytes"""
+        cached = self._digests.get(upload_id)
+        if cached and cached[0] == offset:
+            return cached[1]
+
+        # Rebuild after a restart or an interrupted chunk
+        digest = hashlib.sha256()
+        with open(self._data_path(upload_id), 'rb') as f:
+            remaining = offset
+            while remaining:
+                chunk = f.read(min(READ_SIZE, remaining))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+        return digest
+
+    def write_chunk(self, upload_id, content_range, stream):
+        """Append one Content-Range chunk; returns the state and the hash once complete"""
+        start, end, total = parse_content_range(content_range)
+
+        with self._upload_lock(upload_id):
+            state = self.get(upload_id)
+            if total != state['size']:
+                raise UploadError('Content-Range total does not match the upload size')
+            if start != state['offset']:
+                raise OffsetMismatch('Chunk does not start at the current offset', state['offset'])
+
+            length = end - start + 1
+            digest = self._get_digest(upload_id, start)
+            data_path = self._data_path(upload_id)
+            head_check = None
+            if start == 0 and self.head_check is not None:
+                head_check = lambda head: self.head_check(state['filename'], head)
+            with open(data_path, 'r+b') as f:
+                f.seek(start)
+                written = copy_stream(stream, f, digest, length, head_check)
+                f.truncate(start + written)
+
+            state['offset'] = start + written
+            if written != length:
+                self._digests.pop(upload_id, None)
+                raise UploadError('Chunk body is shorter than its Content-Range')
+            self._digests[upload_id] = (state['offset'], digest)
+
+            if state['offset'] < state['size']:
+                self._save_state(state)
+                return state, None
+
+            # Move the finished file into uploads/ next to regular uploads
+            final_path = os.path.join(self.upload_dir, state['unique_filename'])
+            os.replace(data_path, final_path)
+            os.remove(self._state_path(upload_id))
+            self._digests.pop(upload_id, None)
+            return state, digest.hexdigest()
+
+    def expire(self, max_age):
+        """Delete unfinished uploads that have not been written to for max_age seconds"""
+        cutoff = time.time() - max_age
+        removed = 0
+        for filename in os.listdir(self.partial_dir):
+            if not filename.endswith('.json'):
+                continue
+            upload_id = filename[:-len('.json')]
+            data_path = self._data_path(upload_id)
+            last_write = os.path.getmtime(data_path) if os.path.exists(data_path) else 0
+            if last_write >= cutoff:
+                continue
+            for path in (data_path, self._state_path(upload_id)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._digests.pop(upload_id, None)
+            removed += 1
+        return removed
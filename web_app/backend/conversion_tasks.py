@@ -0,0 +1,126 @@
+import importlib
+import inspect
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from converter import instrumentation, registry
+from job_queue import report_progress
+from result_cache import file_sha256, link_or_copy
+
+# Converter modules each job lane imports when its worker processes start,
+# so the heavy libraries are loaded once per worker rather than per job
+LANE_MODULES = {**registry.lane_modules(), 'preview': ['fitz', 'converter.pdf_thumbnails']}
+
+
+def warm_worker(lane, ready_queue=None):
+    """Process pool initializer: import the lane's converter libraries up front
+
+    Reports the lane, pid and import time on ready_queue so the API process
+    can tell when its workers are warm.
+    """
+    started = time.perf_counter()
+    for module in LANE_MODULES.get(lane, []):
+        importlib.import_module(module)
+    if ready_queue is not None:
+        ready_queue.put({'lane': lane, 'pid': os.getpid(), 'warmup_seconds': time.perf_counter() - started})
+
+
+def supported_options(conversion_func, options):
+    """Keep only the options that a converter accepts as keyword arguments"""
+    parameters = inspect.signature(conversion_func).parameters
+    return {key: value for key, value in (options or {}).items()
+            if key in parameters and key != 'input_path'}
+
+
+@contextmanager
+def staged_input(input_path, directory, prefix='.job-'):
+    """Link the input into a private directory for one conversion and yield its path
+
+    Converters write their output and any intermediates next to their
+    input, so jobs on the same file must not share its directory. The
+    directory is made inside ``directory`` so results can be renamed out of
+    it, and is removed afterwards with whatever is left in it.
+    """
+    workdir = tempfile.mkdtemp(prefix=prefix, dir=directory)
+    try:
+        name, extension = os.path.splitext(os.path.basename(input_path))
+        staged_path = os.path.join(workdir, name + extension.lower())
+        link_or_copy(input_path, staged_path)
+        yield staged_path
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def remove_stale_workdirs(directory, max_age, prefix='.job-'):
+    """Delete job directories nothing has written to for max_age seconds
+
+    staged_input cleans up after itself, but not when its worker process is
+    killed; the sweep calls this for whatever such workers left behind.
+    """
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(directory):
+        if not (entry.name.startswith(prefix) and entry.is_dir(follow_symlinks=False)):
+            continue
+        try:
+            # A running job may only be growing one file, which leaves the directory mtime alone
+            last_write = max([entry.stat().st_mtime] + [child.stat().st_mtime for child in os.scandir(entry.path)])
+        except OSError:
+            continue
+        if last_write >= cutoff:
+            continue
+        shutil.rmtree(entry.path, ignore_errors=True)
+        removed += 1
+    return removed
+
+
+def report_conversion_progress(done, total=None, unit=None):
+    """Forward a converter's progress to the API process as a JSON-safe dict"""
+    percent = round(100.0 * done / total, 1) if total else None
+    report_progress({'done': done, 'total': total, 'unit': unit, 'percent': percent})
+
+
+def run_conversion(conversion_func, input_path, final_output_path, options=None):
+    """Convert a file inside a worker process and place the result in outputs
+
+    Returns the final output path and its SHA-256 together with the
+    per-stage timings that the converter recorded.
+    """
+    print(f"Starting conversion: {input_path} -> {conversion_func.__name__}")
+    instrumentation.collect()
+    instrumentation.set_progress_reporter(report_conversion_progress)
+    # Other jobs may be converting the same upload at the same time
+    with staged_input(input_path, os.path.dirname(final_output_path) or '.') as staged_path:
+        output_path = conversion_func(staged_path, **supported_options(conversion_func, options))
+        print(f"Conversion output path: {output_path}")
+
+        if not output_path or not os.path.exists(output_path):
+            raise RuntimeError('Conversion failed')
+
+        # Some options change the output format (e.g. several PDF pages become a ZIP)
+        output_extension = os.path.splitext(output_path)[1]
+        if output_extension and not final_output_path.lower().endswith(output_extension.lower()):
+            final_output_path = os.path.splitext(final_output_path)[0] + output_extension
+
+        with instrumentation.stage('output_copy'):
+            os.replace(output_path, final_output_path)
+        print(f"File moved to: {final_output_path}")
+
+        # Analysis written by the converter follows the output into outputs
+        analysis = None
+        analysis_path = output_path + instrumentation.ANALYSIS_SUFFIX
+        if os.path.exists(analysis_path):
+            with open(analysis_path) as f:
+                analysis = json.load(f)
+            os.replace(analysis_path, final_output_path + instrumentation.ANALYSIS_SUFFIX)
+
+    # Hashed here so the API can answer conditional downloads without reading the file
+    with instrumentation.stage('output_hash'):
+        sha256 = file_sha256(final_output_path)
+
+    return {'output_path': final_output_path, 'sha256': sha256, 'analysis': analysis,
+            'timings': instrumentation.collect()}
@@ -0,0 +1,207 @@
+import json
+import math
+import struct
+
+import numpy as np
+
+# ITU-R BS.1770 K-weighting: a high shelf for the head, then a high pass
+# (RLB). Coefficients are derived per sample rate from these parameters.
+SHELF_FREQUENCY, SHELF_GAIN_DB, SHELF_Q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+HIGHPASS_FREQUENCY, HIGHPASS_Q = 38.13547087602444, 0.5003270373238773
+
+# Loudness is measured on 400 ms blocks overlapping by 75%, built from 100 ms segments
+SEGMENT_SECONDS = 0.1
+SEGMENTS_PER_BLOCK = 4
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+
+# Samples at or beyond 16-bit full scale count as clipped
+CLIP_LEVEL = 32767 / 32768
+
+DEFAULT_PEAKS = 1000
+MAX_PEAKS = 10000
+
+
+def k_weighting_filter(sample_rate):
+    """ffmpeg filter chain applying K-weighting at the given sample rate
+
+    Uses the bilinear-transform form from libebur128, which reproduces the
+    BS.1770 reference coefficients at 48 kHz.
+    """
+    k = math.tan(math.pi * SHELF_FREQUENCY / sample_rate)
+    vh = 10 ** (SHELF_GAIN_DB / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / SHELF_Q + k * k
+    shelf = {
+        'b0': (vh + vb * k / SHELF_Q + k * k) / a0,
+        'b1': 2 * (k * k - vh) / a0,
+        'b2': (vh - vb * k / SHELF_Q + k * k) / a0,
+        'a0': 1,
+        'a1': 2 * (k * k - 1) / a0,
+        'a2': (1 - k / SHELF_Q + k * k) / a0,
+    }
+    k = math.tan(math.pi * HIGHPASS_FREQUENCY / sample_rate)
+    a0 = 1 + k / HIGHPASS_Q + k * k
+    highpass = {
+        'b0': 1,
+        'b1': -2,
+        'b2': 1,
+        'a0': 1,
+        'a1': 2 * (k * k - 1) / a0,
+        'a2': (1 - k / HIGHPASS_Q + k * k) / a0,
+    }
+    return ','.join('biquad=' + ':'.join(f'{key}={value:.12g}' for key, value in biquad.items())
+                    for biquad in (shelf, highpass))
+
+
+def analysis_filter(sample_rate, channels=None):
+    """ffmpeg filter graph whose output holds the decoded channels, then the same channels K-weighted"""
+    layout = {1: ':channel_layouts=mono', 2: ':channel_layouts=stereo'}.get(int(channels) if channels else None, '')
+    return (f'aformat=sample_fmts=flt:sample_rates={sample_rate}{layout},asplit[raw][k];'
+            f'[k]{k_weighting_filter(sample_rate)}[weighted];[raw][weighted]amerge=inputs=2')
+
+
+def read_wav_header(stream):
+    """Read a streamed WAV header up to the data chunk; returns (sample_rate, channels)"""
+    header = stream.read(12)
+    if len(header) < 12 or header[:4] not in (b'RIFF', b'RF64') or header[8:12] != b'WAVE':
+        raise ValueError('Analysis stream is not WAV')
+    sample_rate = channels = bits = None
+    while True:
+        chunk = stream.read(8)
+        if len(chunk) < 8:
+            raise ValueError('Analysis stream ended before its data')
+        chunk_id, size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+        if chunk_id == b'data':
+            break
+        body = stream.read(size + (size & 1))
+        if chunk_id == b'fmt ':
+            channels, sample_rate = struct.unpack('<HI', body[2:8])
+            bits = struct.unpack('<H', body[14:16])[0]
+    if bits != 32:
+        raise ValueError('Analysis stream is not 32-bit float WAV')
+    return sample_rate, channels
+
+
+class AudioAnalyzer:
+    """Accumulate waveform peaks, levels and loudness over streamed samples
+
+    Samples are fed as float32 frames in chunks of any size. With
+    ``weighted``, each frame holds the channels followed by the same
+    channels K-weighted, and integrated loudness is measured too. Only
+    per-block maxima and 100 ms power segments are kept, so memory grows
+    by a few bytes per 100 ms of audio.
+    """
+
+    def __init__(self, sample_rate, channels, peaks=DEFAULT_PEAKS, expected_frames=None, weighted=True):
+        peaks = int(peaks)
+        if not 1 <= peaks <= MAX_PEAKS:
+            raise ValueError(f'Peaks must be between 1 and {MAX_PEAKS}')
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.peaks = peaks
+        self.weighted = weighted
+        # Several blocks per final peak, so regrouping them stays even
+        if expected_frames:
+            self.block_frames = max(1, int(expected_frames) // (peaks * 4))
+        else:
+            self.block_frames = max(1, sample_rate // 100)
+        self.segment_frames = max(1, round(sample_rate * SEGMENT_SECONDS))
+        self.frames = 0
+        self.sum_squares = 0.0
+        self.peak = 0.0
+        self.clipped = 0
+        self._block_maxima = []
+        self._segment_powers = []
+        self._pending_abs = np.empty(0, dtype=np.float32)
+        self._pending_power = np.empty(0, dtype=np.float64)
+        self._pending_bytes = b''
+
+    def feed_bytes(self, data):
+        """Feed interleaved little-endian float32 frames, in chunks of any length"""
+        data = self._pending_bytes + data
+        frame_bytes = 4 * self.channels * (2 if self.weighted else 1)
+        usable = len(data) - len(data) % frame_bytes
+        self._pending_bytes = data[usable:]
+        if usable:
+            self.feed(np.frombuffer(data[:usable], dtype='<f4').reshape(-1, frame_bytes // 4))
+        return usable // frame_bytes
+
+    def feed(self, frames):
+        """Feed a (frames, channels) array, with the K-weighted channels after the others"""
+        samples = frames[:, :self.channels]
+        magnitude = np.abs(samples)
+        self.frames += len(samples)
+        self.sum_squares += float(np.square(samples, dtype=np.float64).sum())
+        if len(samples):
+            self.peak = max(self.peak, float(magnitude.max()))
+        self.clipped += int(np.count_nonzero(magnitude >= CLIP_LEVEL))
+
+        self._pending_abs = self._reduce(np.concatenate([self._pending_abs, magnitude.max(axis=1)]),
+                                         self.block_frames, np.max, self._block_maxima)
+        if self.weighted:
+            weighted = frames[:, self.channels:2 * self.channels]
+            power = np.square(weighted, dtype=np.float64).sum(axis=1)
+            self._pending_power = self._reduce(np.concatenate([self._pending_power, power]),
+                                               self.segment_frames, np.mean, self._segment_powers)
+
+    @staticmethod
+    def _reduce(values, size, function, out):
+        """Reduce every complete run of size values into out; return the remainder"""
+        complete = len(values) - len(values) % size
+        if complete:
+            out.append(function(values[:complete].reshape(-1, size), axis=1))
+        return values[complete:]
+
+    def loudness(self):
+        """Integrated loudness in LUFS with absolute and relative gating, or None"""
+        if not self.weighted or not self._segment_powers:
+            return None
+        segments = np.concatenate(self._segment_powers)
+        if len(segments) < SEGMENTS_PER_BLOCK:
+            return None
+        blocks = np.convolve(segments, np.full(SEGMENTS_PER_BLOCK, 1.0 / SEGMENTS_PER_BLOCK), mode='valid')
+        with np.errstate(divide='ignore'):
+            levels = -0.691 + 10 * np.log10(blocks)
+        gated = blocks[levels > ABSOLUTE_GATE_LUFS]
+        if not len(gated):
+            return None
+        relative_gate = -0.691 + 10 * math.log10(gated.mean()) + RELATIVE_GATE_LU
+        gated = gated[-0.691 + 10 * np.log10(gated) > relative_gate]
+        return round(-0.691 + 10 * math.log10(gated.mean()), 2)
+
+    def envelope(self):
+        """Peak magnitude in each of self.peaks equal slices of the track"""
+        parts = list(self._block_maxima)
+        if len(self._pending_abs):
+            parts.append(self._pending_abs.max(keepdims=True))
+        if not parts:
+            return []
+        blocks = np.concatenate(parts)
+        if len(blocks) > self.peaks:
+            starts = (np.arange(self.peaks) * len(blocks)) // self.peaks
+            blocks = np.maximum.reduceat(blocks, starts)
+        return [round(float(value), 4) for value in blocks]
+
+    def result(self):
+        samples = self.frames * self.channels
+        rms = math.sqrt(self.sum_squares / samples) if samples else 0.0
+        return {
+            'duration': round(self.frames / self.sample_rate, 3),
+            'sample_rate': self.sample_rate,
+            'channels': self.channels,
+            'peak_dbfs': _dbfs(self.peak),
+            'rms_dbfs': _dbfs(rms),
+            'loudness_lufs': self.loudness(),
+            'clipped_samples': self.clipped,
+            'peaks': self.envelope(),
+        }
+
+
+def _dbfs(level):
+    return round(20 * math.log10(level), 2) if level > 0 else None
+
+
+def write_analysis(path, analysis):
+    with open(path, 'w') as f:
+        json.dump(analysis, f, separators=(',', ':'))
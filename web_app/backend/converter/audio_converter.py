@@ -1,69 +1,245 @@
 from pydub import AudioSegment
+import numpy as np
 import os
+import re
+import shutil
+import subprocess
+import tempfile
+from converter.audio_analysis import (DEFAULT_PEAKS, MAX_PEAKS, AudioAnalyzer, analysis_filter,
+                                      read_wav_header, write_analysis)
+from converter.instrumentation import ANALYSIS_SUFFIX, stage, progress
 
-def convert_mp3_to_wav(input_path):
-    """Convert MP3 to WAV format"""
-    try:
-        output_path = input_path.replace('.mp3', '.wav')
-        audio = AudioSegment.from_mp3(input_path)
-        audio.export(output_path, format="wav")
-        return output_path
-    except Exception as e:
-        print(f"Audio conversion error: {e}")
-        print("Please install ffmpeg: https://ffmpeg.org/download.html")
-        return None
+# ffmpeg codec and container arguments for each output format
+FFMPEG_OUTPUT_ARGS = {
+    'wav': ['-c:a', 'pcm_s16le', '-f', 'wav'],
+    'mp3': ['-c:a', 'libmp3lame', '-f', 'mp3'],
+    'm4a': ['-c:a', 'aac', '-f', 'ipod'],
+}
 
-def convert_wav_to_mp3(input_path):
-    """Convert WAV to MP3 format"""
-    try:
-        output_path = input_path.replace('.wav', '.mp3')
-        audio = AudioSegment.from_wav(input_path)
-        audio.export(output_path, format="mp3")
-        return output_path
-    except Exception as e:
-        print(f"Audio conversion error: {e}")
-        return None
+DURATION_RE = re.compile(rb'Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)')
+SAMPLE_RATE_RE = re.compile(rb'Audio: [^\n]*?(\d+) Hz')
 
-def convert_mp3_to_m4a(input_path):
-    """Convert MP3 to M4A format"""
-    try:
-        output_path = input_path.replace('.mp3', '.m4a')
-        audio = AudioSegment.from_mp3(input_path)
-        audio.export(output_path, format="ipod")
-        return output_path
-    except Exception as e:
-        print(f"Audio conversion error: {e}")
-        return None
+# Bytes of analysis PCM read from ffmpeg at a time
+ANALYSIS_CHUNK = 256 * 1024
 
-def convert_wav_to_m4a(input_path):
-    """Convert WAV to M4A format"""
-    try:
-        output_path = input_path.replace('.wav', '.m4a')
-        audio = AudioSegment.from_wav(input_path)
-        audio.export(output_path, format="ipod")
-        return output_path
-    except Exception as e:
-        print(f"Audio conversion error: {e}")
-        return None
+# pydub export format names for the fallback path
+PYDUB_EXPORT_FORMATS = {
+    'wav': 'wav',
+    'mp3': 'mp3',
+    'm4a': 'ipod',
+}
 
-def convert_m4a_to_mp3(input_path):
-    """Convert M4A to MP3 format"""
+def configure_ffmpeg():
+    """Configure ffmpeg path for audio conversions"""
     try:
-        output_path = input_path.replace('.m4a', '.mp3')
-        audio = AudioSegment.from_file(input_path, format="m4a")
-        audio.export(output_path, format="mp3")
-        return output_path
+        # Check if we're in a cloud environment
+        if os.environ.get('RAILWAY_ENVIRONMENT') or os.environ.get('RENDER') or os.environ.get('HEROKU'):
+            # In cloud environment, use system ffmpeg
+            print("Running in cloud environment, using system FFmpeg")
+            return True
+        
+        # Local environment - try to use local ffmpeg
+        backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        project_root = os.path.dirname(os.path.dirname(backend_dir))
+        ffmpeg_bin = os.path.join(project_root, 'ffmpeg-master-latest-win64-gpl', 'bin')
+        
+        if os.path.exists(ffmpeg_bin):
+            # Add ffmpeg to system PATH
+            if ffmpeg_bin not in os.environ.get('PATH', ''):
+                os.environ['PATH'] = ffmpeg_bin + os.pathsep + os.environ.get('PATH', '')
+            
+            # Configure pydub to use local ffmpeg
+            AudioSegment.converter = os.path.join(ffmpeg_bin, "ffmpeg.exe")
+            AudioSegment.ffmpeg = os.path.join(ffmpeg_bin, "ffmpeg.exe")
+            
+            print(f"FFmpeg configured successfully: {ffmpeg_bin}")
+            return True
+        else:
+            print(f"FFmpeg directory not found: {ffmpeg_bin}")
+            return False
     except Exception as e:
-        print(f"Audio conversion error: {e}")
+        print(f"Error configuring ffmpeg: {e}")
+        return False
+
+# Configure ffmpeg as soon as a worker imports the audio converters
+configure_ffmpeg()
+
+def find_ffmpeg():
+    """Locate the ffmpeg binary configured for pydub, or on PATH"""
+    configured = getattr(AudioSegment, 'converter', None)
+    if configured and os.path.isfile(configured):
+        return configured
+    return shutil.which(configured or 'ffmpeg') or shutil.which('ffmpeg')
+
+def validate_audio_options(bitrate=None, sample_rate=None, channels=None):
+    """Check encoder options before handing them to ffmpeg"""
+    if bitrate is not None and not re.fullmatch(r'\d{2,3}k', str(bitrate)):
+        raise ValueError("Bitrate must look like '192k'")
+    if sample_rate is not None and not 8000 <= int(sample_rate) <= 192000:
+        raise ValueError('Sample rate must be between 8000 and 192000 Hz')
+    if channels is not None and int(channels) not in (1, 2):
+        raise ValueError('Channels must be 1 or 2')
+
+def probe_audio(ffmpeg, input_path):
+    """Read a file's duration in seconds and sample rate from ffmpeg's header summary
+
+    Either is None when ffmpeg does not report it.
+    """
+    result = subprocess.run([ffmpeg, '-hide_banner', '-nostdin', '-i', input_path],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    duration = sample_rate = None
+    match = DURATION_RE.search(result.stderr)
+    if match:
+        hours, minutes, seconds = match.groups()
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    match = SAMPLE_RATE_RE.search(result.stderr)
+    if match:
+        sample_rate = int(match.group(1))
+    return duration, sample_rate
+
+def analyze_stream(stream, duration, peaks):
+    """Analyse streamed WAV holding the decoded channels and their K-weighted copies
+
+    Progress is reported in seconds of audio analysed.
+    """
+    sample_rate, channels = read_wav_header(stream)
+    expected_frames = duration * sample_rate if duration else None
+    analyzer = AudioAnalyzer(sample_rate, channels // 2, peaks, expected_frames)
+    for data in iter(lambda: stream.read(ANALYSIS_CHUNK), b''):
+        analyzer.feed_bytes(data)
+        decoded = analyzer.frames / sample_rate
+        progress(round(min(decoded, duration) if duration else decoded, 2), duration, 'seconds')
+    return analyzer.result()
+
+def transcode_with_ffmpeg(input_path, output_path, target_format, bitrate=None, sample_rate=None, channels=None,
+                          peaks=None):
+    """Stream input to output through a single ffmpeg process
+
+    ffmpeg decodes and encodes in small buffers, so memory use does not grow
+    with the length of the track and no PCM passes through Python. The
+    seconds encoded so far are reported as progress.
+
+    With ``peaks``, the same ffmpeg process also sends the decoded samples,
+    and a K-weighted copy for loudness, to this process as float PCM. They
+    are analysed chunk by chunk as they arrive, and the analysis is
+    returned. Otherwise None is returned.
+    """
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        raise RuntimeError('ffmpeg not found')
+    duration, source_rate = probe_audio(ffmpeg, input_path)
+
+    command = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin', '-y', '-nostats']
+    if peaks is None:
+        command += ['-progress', 'pipe:1']
+    command += ['-i', input_path, '-vn', '-map_metadata', '0']
+    command += FFMPEG_OUTPUT_ARGS[target_format]
+    if bitrate and target_format != 'wav':
+        command += ['-b:a', str(bitrate)]
+    if sample_rate:
+        command += ['-ar', str(int(sample_rate))]
+    if channels:
+        command += ['-ac', str(int(channels))]
+    command.append(output_path)
+    if peaks is not None:
+        # Second output: what the encoder was given, resampled and remixed like it
+        analysis_rate = int(sample_rate or source_rate or 48000)
+        command += ['-map', '0:a:0', '-map_metadata', '-1', '-fflags', '+bitexact',
+                    '-af', analysis_filter(analysis_rate, channels),
+                    '-c:a', 'pcm_f32le', '-f', 'wav', 'pipe:1']
+
+    analysis = None
+    # stderr goes to a file so a chatty ffmpeg cannot block on a full pipe
+    with stage('transcode'), tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr)
+        with process.stdout:
+            if peaks is not None:
+                try:
+                    analysis = analyze_stream(process.stdout, duration, peaks)
+                except Exception:
+                    process.kill()
+                    process.wait()
+                    raise
+            else:
+                for line in process.stdout:
+                    key, _, value = line.strip().partition(b'=')
+                    if key == b'out_time_us' and value.isdigit():
+                        encoded = int(value) / 1_000_000
+                        progress(round(min(encoded, duration) if duration else encoded, 2), duration, 'seconds')
+        returncode = process.wait()
+        stderr.seek(0)
+        message = stderr.read().decode('utf-8', 'replace').strip().splitlines()
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {message[-1] if message else returncode}")
+    if duration:
+        progress(duration, duration, 'seconds')
+    return analysis
+
+def transcode_with_pydub(input_path, output_path, target_format, source_format=None,
+                         bitrate=None, sample_rate=None, channels=None, peaks=None):
+    """Decode the whole track with pydub and export it (fallback path)
+
+    With ``peaks`` the decoded samples are analysed too, without loudness,
+    and the analysis is returned; otherwise None is returned.
+    """
+    with stage('decode'):
+        audio = AudioSegment.from_file(input_path, format=source_format)
+        if sample_rate:
+            audio = audio.set_frame_rate(int(sample_rate))
+        if channels:
+            audio = audio.set_channels(int(channels))
+    with stage('encode'):
+        audio.export(output_path, format=PYDUB_EXPORT_FORMATS[target_format],
+                     bitrate=bitrate if target_format != 'wav' else None)
+    if peaks is None:
         return None
+    samples = np.array(audio.get_array_of_samples(), dtype=np.float32).reshape(-1, audio.channels)
+    samples /= float(1 << (8 * audio.sample_width - 1))
+    analyzer = AudioAnalyzer(audio.frame_rate, audio.channels, peaks, len(samples), weighted=False)
+    analyzer.feed(samples)
+    return analyzer.result()
+
+def convert_audio(input_path, output_path, target_format, source_format=None,
+                  bitrate=None, sample_rate=None, channels=None, engine='auto',
+                  analyze=False, peaks=DEFAULT_PEAKS):
+    """Convert audio with ffmpeg streaming, falling back to pydub
+
+    ``engine`` is 'auto' (ffmpeg, then pydub on failure), 'ffmpeg' or 'pydub'.
+    With ``analyze``, the audio is measured in the same decode pass:
+    duration, peak and RMS level, integrated loudness, clipped samples and
+    a waveform envelope of ``peaks`` values. The results are written as
+    JSON at the output path plus ANALYSIS_SUFFIX.
+    """
+    validate_audio_options(bitrate, sample_rate, channels)
+    if engine not in ('auto', 'ffmpeg', 'pydub'):
+        raise ValueError(f"Unknown audio engine '{engine}'")
+    if analyze and not 1 <= int(peaks) <= MAX_PEAKS:
+        raise ValueError(f'Peaks must be between 1 and {MAX_PEAKS}')
+    peaks = int(peaks) if analyze else None
+
+    ffmpeg_error = None
+    if engine in ('auto', 'ffmpeg'):
+        try:
+            analysis = transcode_with_ffmpeg(input_path, output_path, target_format,
+                                             bitrate, sample_rate, channels, peaks)
+            if analysis is not None:
+                write_analysis(output_path + ANALYSIS_SUFFIX, analysis)
+            return output_path
+        except Exception as e:
+            print(f"ffmpeg streaming conversion error: {e}")
+            if engine == 'ffmpeg':
+                raise
+            ffmpeg_error = e
 
-def convert_m4a_to_wav(input_path):
-    """Convert M4A to WAV format"""
     try:
-        output_path = input_path.replace('.m4a', '.wav')
-        audio = AudioSegment.from_file(input_path, format="m4a")
-        audio.export(output_path, format="wav")
+        analysis = transcode_with_pydub(input_path, output_path, target_format, source_format,
+                                        bitrate, sample_rate, channels, peaks)
+        if analysis is not None:
+            write_analysis(output_path + ANALYSIS_SUFFIX, analysis)
         return output_path
     except Exception as e:
         print(f"Audio conversion error: {e}")
-        return None
\ No newline at end of file
+        print("Please install ffmpeg: https://ffmpeg.org/download.html")
+        if ffmpeg_error is not None:
+            raise RuntimeError(f'{ffmpeg_error}; the pydub fallback failed too: {e}') from e
+        raise
@@ -0,0 +1,402 @@
+import io
+import os
+from functools import lru_cache
+from itertools import islice
+from xml.sax.saxutils import escape, quoteattr
+
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml.ns import qn
+from docx.table import Table as DocxTable
+from docx.text.paragraph import Paragraph as DocxParagraph
+from docx.text.run import Run as DocxRun
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_LEFT, TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import Image, PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+from converter.instrumentation import progress
+
+# TrueType families used when installed, for text outside Latin-1, with the
+# built-in PDF fonts as fallback
+FONT_DIRS = [d for d in (os.environ.get('DOCX_FONT_DIR'),
+                         '/usr/share/fonts/truetype/dejavu',
+                         '/usr/share/fonts/dejavu',
+                         '/usr/local/share/fonts') if d]
+TRUETYPE_FAMILIES = {
+    'sans': ('DejaVuSans', 'DejaVuSans-Bold', 'DejaVuSans-Oblique', 'DejaVuSans-BoldOblique'),
+    'serif': ('DejaVuSerif', 'DejaVuSerif-Bold', 'DejaVuSerif-Italic', 'DejaVuSerif-BoldItalic'),
+    'mono': ('DejaVuSansMono', 'DejaVuSansMono-Bold', 'DejaVuSansMono-Oblique', 'DejaVuSansMono-BoldOblique'),
+}
+BUILTIN_FAMILIES = {
+    'sans': ('Helvetica', 'Helvetica-Bold', 'Helvetica-Oblique', 'Helvetica-BoldOblique'),
+    'serif': ('Times-Roman', 'Times-Bold', 'Times-Italic', 'Times-BoldItalic'),
+    'mono': ('Courier', 'Courier-Bold', 'Courier-Oblique', 'Courier-BoldOblique'),
+}
+SERIF_FONTS = ('times', 'georgia', 'cambria', 'garamond', 'book antiqua', 'palatino', 'serif')
+MONO_FONTS = ('courier', 'consolas', 'mono', 'menlo', 'lucida console')
+
+ALIGNMENTS = {
+    WD_ALIGN_PARAGRAPH.LEFT: TA_LEFT,
+    WD_ALIGN_PARAGRAPH.CENTER: TA_CENTER,
+    WD_ALIGN_PARAGRAPH.RIGHT: TA_RIGHT,
+    WD_ALIGN_PARAGRAPH.JUSTIFY: TA_JUSTIFY,
+}
+IMAGE_ALIGNMENTS = {
+    WD_ALIGN_PARAGRAPH.CENTER: 'CENTER',
+    WD_ALIGN_PARAGRAPH.RIGHT: 'RIGHT',
+}
+HEADING_SIZES = {'Title': 26, 'Heading 1': 20, 'Heading 2': 16, 'Heading 3': 14, 'Heading 4': 12}
+DEFAULT_FONT_SIZE = 11
+EMU_PER_POINT = 12700
+
+# Flowables kept ahead of the page being laid out
+STORY_WINDOW = 64
+
+# Elements inside a paragraph whose runs are rendered like its own
+RUN_CONTAINERS = {qn('w:ins'), qn('w:smartTag'), qn('w:customXml'), qn('w:fldSimple')}
+
+GRID_STYLE = [
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 4),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 4),
+]
+
+
+class StreamingDocTemplate(SimpleDocTemplate):
+    """Document template that pulls its story from an iterator as pages are laid out
+
+    ReportLab calls filterFlowables() before handling each flowable; here it
+    tops the story up from the iterator, so only a small window of the
+    document exists as flowables at any time.
+    """
+
+    def build_from(self, flowables, window=None):
+        self._source = iter(flowables)
+        self._window = window or STORY_WINDOW
+        self._story = []
+        self.filterFlowables(self._story)
+        self.build(self._story)
+
+    def filterFlowables(self, flowables):
+        # Also called on ReportLab's own list of postponed actions, which is left alone
+        wanted = self._window - len(flowables)
+        if flowables is self._story and self._source is not None and wanted > 0:
+            added = list(islice(self._source, wanted))
+            flowables.extend(added)
+            if len(added) < wanted:
+                self._source = None
+
+
+@lru_cache(maxsize=None)
+def font_family(kind):
+    """Register (once per process) and return the regular/bold/italic/bold-italic fonts"""
+    faces = []
+    for name in TRUETYPE_FAMILIES[kind]:
+        path = next((os.path.join(d, f'{name}.ttf') for d in FONT_DIRS
+                     if os.path.isfile(os.path.join(d, f'{name}.ttf'))), None)
+        faces.append((name, path))
+    if faces[0][1] is None:
+        return BUILTIN_FAMILIES[kind]
+
+    regular = faces[0][0]
+    registered = []
+    for name, path in faces:
+        if path is None:
+            registered.append(regular)  # missing styles fall back to the regular face
+            continue
+        if name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(name, path))
+        registered.append(name)
+    pdfmetrics.registerFontFamily(regular, normal=registered[0], bold=registered[1],
+                                  italic=registered[2], boldItalic=registered[3])
+    return tuple(registered)
+
+
+def font_kind(font_name):
+    name = (font_name or '').lower()
+    if any(serif in name for serif in SERIF_FONTS):
+        return 'serif'
+    if any(mono in name for mono in MONO_FONTS):
+        return 'mono'
+    return 'sans'
+
+
+@lru_cache(maxsize=1024)
+def paragraph_style(kind, size, alignment, left_indent, space_before, space_after, bold):
+    """Shared ParagraphStyle for one combination of settings, reused across jobs"""
+    family = font_family(kind)
+    return ParagraphStyle(
+        f'docx-{kind}-{size}-{alignment}-{left_indent}-{space_before}-{space_after}-{bold}',
+        fontName=family[1] if bold else family[0],
+        fontSize=size,
+        leading=round(size * 1.2, 1),
+        alignment=alignment,
+        leftIndent=left_indent,
+        spaceBefore=space_before,
+        spaceAfter=space_after,
+    )
+
+
+def _style_value(style, attribute):
+    """Look a font attribute up through a paragraph style and the styles it is based on"""
+    while style is not None:
+        value = getattr(style.font, attribute)
+        if value is not None:
+            return value
+        style = style.base_style
+    return None
+
+
+class DocxRenderer:
+    """Turn one DOCX document into ReportLab flowables, block by block"""
+
+    def __init__(self, document, frame_width):
+        self.document = document
+        self.part = document.part
+        self.frame_width = frame_width
+
+    def flowables(self):
+        """Yield flowables for the body in document order"""
+        blocks = [child for child in self.document.element.body.iterchildren()
+                  if child.tag in (qn('w:p'), qn('w:tbl'))]
+        for done, block in enumerate(blocks, start=1):
+            if block.tag == qn('w:p'):
+                yield from self.paragraph(DocxParagraph(block, self.document))
+            else:
+                yield self.table(DocxTable(block, self.document), self.frame_width)
+            progress(done, len(blocks), 'blocks')
+
+    def paragraph(self, paragraph, width=None):
+        """Yield the flowables for one paragraph: its text, inline images and page breaks"""
+        width = width or self.frame_width
+        style = paragraph.style
+        style_name = style.name if style is not None else ''
+        size = _style_value(style, 'size')
+        size = HEADING_SIZES.get(style_name, size.pt if size else DEFAULT_FONT_SIZE)
+        kind = font_kind(_style_value(style, 'name'))
+        heading = style_name == 'Title' or style_name.startswith('Heading')
+
+        fmt = paragraph.paragraph_format
+        if fmt.page_break_before:
+            yield PageBreak()
+
+        markup, images, page_break = self.runs(paragraph)
+        numbered = style_name.startswith('List') or (
+            paragraph._p.pPr is not None and paragraph._p.pPr.numPr is not None
+        )
+        if numbered and markup:
+            markup = f'• {markup}'
+        if markup.strip():
+            yield Paragraph(markup, paragraph_style(
+                kind,
+                round(size, 1),
+                ALIGNMENTS.get(paragraph.alignment, TA_LEFT),
+                round(fmt.left_indent.pt) if fmt.left_indent else (18 if numbered else 0),
+                round(fmt.space_before.pt) if fmt.space_before is not None else (12 if heading else 0),
+                round(fmt.space_after.pt) if fmt.space_after is not None else 6,
+                bool(heading or _style_value(style, 'bold')),
+            ))
+        elif not images:
+            yield Spacer(1, size * 0.6)
+
+        for blip_id, (cx, cy) in images:
+            image = self.image(blip_id, cx, cy, width)
+            if image is not None:
+                image.hAlign = IMAGE_ALIGNMENTS.get(paragraph.alignment, 'LEFT')
+                yield image
+        if page_break:
+            yield PageBreak()
+
+    def runs(self, paragraph):
+        """Markup for a paragraph's runs, plus its inline images and whether it ends with a page break"""
+        parts = []
+        images = []
+        page_break = False
+        for run, link in self.inner_runs(paragraph._p, paragraph):
+            text = []
+            for child in run._r.iterchildren():
+                if child.tag == qn('w:t'):
+                    text.append(escape(child.text or ''))
+                elif child.tag == qn('w:tab'):
+                    text.append('&nbsp;' * 4)
+                elif child.tag == qn('w:br'):
+                    if child.get(qn('w:type')) == 'page':
+                        page_break = True
+                    else:
+                        text.append('<br/>')
+                elif child.tag == qn('w:drawing'):
+                    images.extend(self.drawing_images(child))
+            text = ''.join(text)
+            if text:
+                markup = self.run_markup(run, text)
+                if link:
+                    markup = f'<a href={quoteattr(link)} color="blue"><u>{markup}</u></a>'
+                parts.append(markup)
+        return ''.join(parts), images, page_break
+
+    def inner_runs(self, element, paragraph, link=None):
+        """(run, link target or None) for every run in a paragraph, including those inside hyperlinks"""
+        for child in element.iterchildren():
+            if child.tag == qn('w:r'):
+                yield DocxRun(child, paragraph), link
+            elif child.tag == qn('w:hyperlink'):
+                yield from self.inner_runs(child, paragraph, self.link_target(child) or link)
+            elif child.tag in RUN_CONTAINERS:
+                yield from self.inner_runs(child, paragraph, link)
+
+    def link_target(self, hyperlink):
+        """URL of an external hyperlink; links to bookmarks inside the document are left out"""
+        relationship = self.part.rels.get(hyperlink.get(qn('r:id')))
+        if relationship is None or not relationship.is_external:
+            return None
+        return relationship.target_ref
+
+    @staticmethod
+    def run_markup(run, text):
+        font = run.font
+        if font.superscript:
+            text = f'<super>{text}</super>'
+        elif font.subscript:
+            text = f'<sub>{text}</sub>'
+        if font.strike:
+            text = f'<strike>{text}</strike>'
+        if font.underline:
+            text = f'<u>{text}</u>'
+        if font.italic:
+            text = f'<i>{text}</i>'
+        if font.bold:
+            text = f'<b>{text}</b>'
+
+        attributes = []
+        if font.name:
+            attributes.append(f'name="{font_family(font_kind(font.name))[0]}"')
+        if font.size:
+            attributes.append(f'size="{font.size.pt:g}"')
+        if font.color is not None and font.color.type is not None and font.color.rgb is not None:
+            attributes.append(f'color="#{font.color.rgb}"')
+        if attributes:
+            text = f'<font {" ".join(attributes)}>{text}</font>'
+        return text
+
+    @staticmethod
+    def drawing_images(drawing):
+        """(relationship id, (width, height) in EMU) for each picture in a drawing"""
+        extent = drawing.find(f'.//{qn("wp:extent")}')
+        size = (int(extent.get('cx')), int(extent.get('cy'))) if extent is not None else (0, 0)
+        return [(blip.get(qn('r:embed')), size) for blip in drawing.iter(qn('a:blip'))
+                if blip.get(qn('r:embed'))]
+
+    def image(self, blip_id, cx, cy, max_width):
+        try:
+            blob = self.part.related_parts[blip_id].blob
+        except KeyError:
+            return None
+        width, height = cx / EMU_PER_POINT, cy / EMU_PER_POINT
+        if not width or not height:
+            return Image(io.BytesIO(blob), width=max_width, kind='proportional')
+        scale = min(1.0, max_width / width)
+        return Image(io.BytesIO(blob), width=width * scale, height=height * scale)
+
+    def table(self, table, width):
+        """A ReportLab table for a DOCX table, keeping merged cells and nested content"""
+        rows = table._tbl.tr_lst
+        grid = table._tbl.tblGrid
+        column_widths = [column.w.pt if column.w else None for column in grid.gridCol_lst] if grid is not None else []
+        columns = max((len(column_widths), *(len(self._row_cells(row)) for row in rows)), default=0)
+        if not columns:
+            return Spacer(1, 0)
+        if len(column_widths) != columns or None in column_widths:
+            column_widths = [width / columns] * columns
+        scale = min(1.0, width / sum(column_widths))
+        column_widths = [column * scale for column in column_widths]
+
+        data = []
+        spans = []
+        vertical = {}  # column -> row where the current vertical merge started
+        for row_index, row in enumerate(rows):
+            data_row = [''] * columns
+            for column, span, tc in self._row_cells(row):
+                if column >= columns:
+                    continue
+                if span > 1:
+                    spans.append(('SPAN', (column, row_index), (column + span - 1, row_index)))
+                merge = tc.vMerge
+                if merge == 'continue':
+                    continue
+                if merge == 'restart':
+                    vertical[column] = (row_index, span)
+                cell_width = sum(column_widths[column:column + span])
+                data_row[column] = self.cell(tc, cell_width)
+            data.append(data_row)
+            for column, (start, span) in list(vertical.items()):
+                next_row = rows[row_index + 1] if row_index + 1 < len(rows) else None
+                continues = next_row is not None and any(
+                    c == column and tc.vMerge == 'continue'
+                    for c, _, tc in self._row_cells(next_row)
+                )
+                if not continues:
+                    if row_index > start:
+                        spans.append(('SPAN', (column, start), (column + span - 1, row_index)))
+                    del vertical[column]
+
+        return Table(data, colWidths=column_widths, style=TableStyle(GRID_STYLE + spans), hAlign='LEFT')
+
+    @staticmethod
+    def _row_cells(row):
+        """(grid column, column span, tc element) for each cell of a table row"""
+        cells = []
+        column = 0
+        for tc in row.tc_lst:
+            span = tc.grid_span
+            cells.append((column, span, tc))
+            column += span
+        return cells
+
+    def cell(self, tc, width):
+        """Flowables for one table cell, with the padding taken off its width"""
+        inner_width = max(width - 8, 12)
+        content = []
+        for child in tc.iterchildren():
+            if child.tag == qn('w:p'):
+                content.extend(self.paragraph(DocxParagraph(child, self.document), inner_width))
+            elif child.tag == qn('w:tbl'):
+                content.append(self.table(DocxTable(child, self.document), inner_width))
+        return [flowable for flowable in content if not isinstance(flowable, PageBreak)]
+
+
+def page_setup(document):
+    """Page size and margins (in points) of the document's first section"""
+    section = document.sections[0] if len(document.sections) else None
+    if section is None or not section.page_width or not section.page_height:
+        return A4, (72, 72, 72, 72)
+    margins = [getattr(section, name) for name in ('left_margin', 'right_margin', 'top_margin', 'bottom_margin')]
+    margins = tuple(margin.pt if margin is not None else 72 for margin in margins)
+    return (section.page_width.pt, section.page_height.pt), margins
+
+
+def render_docx(input_path, output_path):
+    """Lay a DOCX document out as a PDF with ReportLab
+
+    Flowables are produced block by block while pages are laid out, so a
+    long document never exists as one complete story in memory.
+    """
+    document = Document(input_path)
+    pagesize, (left, right, top, bottom) = page_setup(document)
+    pdf = StreamingDocTemplate(
+        output_path,
+        pagesize=pagesize,
+        leftMargin=left,
+        rightMargin=right,
+        topMargin=top,
+        bottomMargin=bottom,
+        title=document.core_properties.title or '',
+        author=document.core_properties.author or '',
+        pageCompression=1,
+    )
+    renderer = DocxRenderer(document, pdf.width)
+    pdf.build_from(renderer.flowables())
+    return output_path
@@ -1,62 +1,232 @@
-from PIL import Image
+from PIL import Image, ImageOps, ExifTags, features
 import os
+import hashlib
+import threading
+from collections import OrderedDict
+import math
+import fitz  # PyMuPDF
+from converter.instrumentation import stage
+from converter.limits import IMAGE_MAX_PIXELS, check_image_size
+from converter.vector_tracer import DETAIL_LEVELS, trace_image
 
-def convert_jpeg_to_png(input_path):
-    """Convert JPEG to PNG format"""
-    output_path = input_path.replace('.jpg', '.png').replace('.jpeg', '.png')
-    image = Image.open(input_path)
-    image.save(output_path, 'PNG')
-    return output_path
+# JPEG shrink-on-load can decode at down to 1/8 scale, so headers up to
+# 64x the IMAGE_MAX_PIXELS budget still open.
+Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS * 32
 
-def convert_png_to_jpeg(input_path):
-    """Convert PNG to JPEG format"""
-    output_path = input_path.replace('.png', '.jpg')
-    image = Image.open(input_path)
-    # Convert RGBA to RGB if necessary
-    if image.mode in ('RGBA', 'LA'):
-        background = Image.new('RGB', image.size, (255, 255, 255))
-        background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-        image = background
-    image.save(output_path, 'JPEG', quality=95)
-    return output_path
+# Rows composited at a time when flattening transparency
+ALPHA_STRIP_HEIGHT = 256
+
+def fit_size(size, max_width=None, max_height=None):
+    """Largest size within the bounds that keeps the aspect ratio, never upscaling"""
+    width, height = size
+    scale = 1.0
+    if max_width:
+        scale = min(scale, int(max_width) / width)
+    if max_height:
+        scale = min(scale, int(max_height) / height)
+    if scale <= 0:
+        raise ValueError('Maximum dimensions must be positive')
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+# Pillow save format and default quality for each output format
+IMAGE_OUTPUT_FORMATS = {
+    'png': {'format': 'PNG', 'quality': None},
+    'jpeg': {'format': 'JPEG', 'quality': 95},
+    'webp': {'format': 'WEBP', 'quality': 80},
+    'avif': {'format': 'AVIF', 'quality': 60},
+}
+
+# EXIF orientations that swap width and height when applied
+ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+
+def open_image(input_path, max_width=None, max_height=None):
+    """Decode an image, shrinking on load when a smaller size is requested
+
+    JPEGs are decoded straight at a reduced DCT scale, so a resized photo
+    never exists in memory at full resolution. Raises ValueError when the
+    decoded image would exceed IMAGE_MAX_PIXELS.
+    """
+    with stage('decode'):
+        image = Image.open(input_path)
+        # Bounds apply to the image as displayed, so swap them for rotated photos
+        if image.getexif().get(ExifTags.Base.Orientation) in ROTATED_ORIENTATIONS:
+            max_width, max_height = max_height, max_width
+        target = fit_size(image.size, max_width, max_height)
+        if image.format == 'JPEG' and target != image.size:
+            image.draft(image.mode if image.mode in ('RGB', 'L') else 'RGB', target)
+
+        check_image_size(*image.size, hint='' if max_width or max_height else ', try setting max_width or max_height')
+        image.load()
+
+    if target != image.size:
+        with stage('resize'):
+            info = image.info
+            image = image.resize(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+            image.info = info
+    return image
+
+def flatten_alpha(image, background=(255, 255, 255)):
+    """Composite a transparent image onto a solid background, a strip at a time
+
+    Only one strip is ever converted to RGBA, so the peak overhead is the RGB
+    output rather than several full-size copies of the image.
+    """
+    if image.mode not in ('RGBA', 'LA', 'PA') and not (image.mode == 'P' and 'transparency' in image.info):
+        return image if image.mode in ('RGB', 'L') else image.convert('RGB')
+
+    with stage('composite'):
+        width, height = image.size
+        output = Image.new('RGB', image.size, background)
+        for top in range(0, height, ALPHA_STRIP_HEIGHT):
+            box = (0, top, width, min(top + ALPHA_STRIP_HEIGHT, height))
+            strip = image.crop(box).convert('RGBA')
+            output.paste(strip, box[:2], strip)
+        output.info = image.info
+    return output
+
+def _prepare_mode(image, target_format):
+    """Convert to a pixel mode the target encoder accepts"""
+    if target_format == 'jpeg':
+        return flatten_alpha(image)
+    if image.mode in ('RGB', 'RGBA', 'L') or (target_format == 'png' and image.mode in ('LA', 'P', 'I', 'I;16', '1')):
+        return image
+    has_alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+    return image.convert('RGBA' if has_alpha else 'RGB')
 
-def convert_png_to_svg(input_path):
-    """Convert PNG to SVG format (simple approach)"""
-    output_path = input_path.replace('.png', '.svg')
-    # Create a simple SVG wrapper around the image
-    image = Image.open(input_path)
-    width, height = image.size
-    
-    svg_content = f'''<?xml version="1.0" encoding="UTF-8"?>
-<svg width="{width}" height="{height}" xmlns="http://www.w3.org/2000/svg">
-  <image href="{input_path}" width="{width}" height="{height}"/>
-</svg>'''
-    
-    with open(output_path, 'w') as f:
-        f.write(svg_content)
+def decode_image(input_path, max_width=None, max_height=None):
+    """Decode an image for encoding, with the EXIF orientation applied to the pixels"""
+    image = open_image(input_path, max_width, max_height)
+    if image.getexif().get(ExifTags.Base.Orientation, 1) != 1:
+        with stage('resize'):
+            image = ImageOps.exif_transpose(image)
+    return image
+
+def encode_image(image, output_path, target_format, quality=None, progressive=False,
+                 optimize=False, strip_metadata=False):
+    """Encode a decoded image in the target format
+
+    ``quality`` (1-100) applies to JPEG, WebP and AVIF. ``progressive`` is
+    JPEG only. ``strip_metadata`` drops EXIF, XMP and comments but keeps the
+    ICC profile, since removing it would shift the colours.
+    """
+    if target_format not in IMAGE_OUTPUT_FORMATS:
+        raise ValueError(f"Unknown image format '{target_format}'")
+    settings = IMAGE_OUTPUT_FORMATS[target_format]
+    if target_format in ('webp', 'avif') and not features.check(target_format):
+        raise ValueError(f'{target_format.upper()} encoding is not available on this server')
+    if quality is not None and not 1 <= int(quality) <= 100:
+        raise ValueError('Quality must be between 1 and 100')
+
+    exif = image.getexif()
+    icc_profile = image.info.get('icc_profile')
+    image = _prepare_mode(image, target_format)
+
+    save_args = {}
+    if icc_profile:
+        save_args['icc_profile'] = icc_profile
+    if not strip_metadata and len(exif):
+        save_args['exif'] = exif.tobytes()
+    if settings['quality'] is not None:
+        save_args['quality'] = int(quality) if quality is not None else settings['quality']
+    if target_format == 'jpeg':
+        save_args['progressive'] = bool(progressive)
+        save_args['optimize'] = bool(optimize)
+    elif target_format == 'png':
+        # optimize trades encode time for a smaller file
+        save_args['optimize'] = bool(optimize)
+    elif target_format == 'webp':
+        save_args['method'] = 6 if optimize else 4
+
+    with stage('encode'):
+        image.save(output_path, settings['format'], **save_args)
     return output_path
 
-def convert_jpeg_to_svg(input_path):
-    """Convert JPEG to SVG format"""
-    output_path = input_path.replace('.jpg', '.svg').replace('.jpeg', '.svg')
-    image = Image.open(input_path)
-    width, height = image.size
-    
-    svg_content = f'''<?xml version="1.0" encoding="UTF-8"?>
-<svg width="{width}" height="{height}" xmlns="http://www.w3.org/2000/svg">
-  <image href="{input_path}" width="{width}" height="{height}"/>
-</svg>'''
-    
-    with open(output_path, 'w') as f:
-        f.write(svg_content)
+def trace_to_svg(input_path, output_path, detail='medium', colors=None):
+    """Vectorize a raster image into a self-contained SVG of filled paths"""
+    with Image.open(input_path) as original:
+        size = original.size
+    # Tracing works on a bounded copy, so shrink on load to that size
+    max_side = DETAIL_LEVELS.get(detail, DETAIL_LEVELS['medium'])['max_side']
+    image = open_image(input_path, max_side, max_side)
+    with stage('trace'):
+        svg_content = trace_image(image, detail, colors, size)
+    with stage('encode'):
+        with open(output_path, 'w') as f:
+            f.write(svg_content)
     return output_path
 
-def convert_svg_to_png(input_path):
-    """Convert SVG to PNG format (placeholder - requires additional setup)"""
-    print("SVG to PNG conversion requires additional setup. Please use an online converter.")
-    return None
+# Parsed SVG documents per worker process, keyed on file content, so the
+# same icon rendered at several sizes is only parsed once
+SVG_CACHE_SIZE = 32
+MAX_SVG_PIXELS = 16384
+_svg_documents = OrderedDict()
+_svg_lock = threading.Lock()
+
+def _load_svg(input_path):
+    """Return a parsed SVG document, reusing a cached parse of identical content"""
+    with open(input_path, 'rb') as f:
+        data = f.read()
+    key = hashlib.sha256(data).hexdigest()
+
+    with _svg_lock:
+        document = _svg_documents.get(key)
+        if document is not None:
+            _svg_documents.move_to_end(key)
+            return document
+
+    document = fitz.open(stream=data, filetype='svg')
+    with _svg_lock:
+        _svg_documents[key] = document
+        while len(_svg_documents) > SVG_CACHE_SIZE:
+            _, evicted = _svg_documents.popitem(last=False)
+            evicted.close()
+    return document
+
+def _svg_matrix(page_rect, width=None, height=None, dpi=None):
+    """Scale the SVG to an explicit size in pixels, or by DPI relative to 96"""
+    if width or height:
+        scale_x = float(width) / page_rect.width if width else None
+        scale_y = float(height) / page_rect.height if height else None
+        # Keep the aspect ratio when only one side is given
+        scale_x = scale_x or scale_y
+        scale_y = scale_y or scale_x
+    else:
+        scale_x = scale_y = float(dpi or 96) / 96.0
+
+    if scale_x <= 0 or scale_y <= 0:
+        raise ValueError('Output size must be positive')
+    output_width = math.ceil(page_rect.width * scale_x)
+    output_height = math.ceil(page_rect.height * scale_y)
+    if output_width > MAX_SVG_PIXELS or output_height > MAX_SVG_PIXELS:
+        raise ValueError(f'Output size is limited to {MAX_SVG_PIXELS} pixels per side')
+    # Checked before the pixmap is allocated; a side limit alone allows 268 MP
+    check_image_size(output_width, output_height)
+    return fitz.Matrix(scale_x, scale_y)
+
+def render_svg(input_path, width=None, height=None, dpi=None, alpha=True):
+    """Rasterize the first page of an SVG to a PyMuPDF pixmap"""
+    with stage('decode'):
+        document = _load_svg(input_path)
+    with stage('render'), _svg_lock:
+        page = document[0]
+        matrix = _svg_matrix(page.rect, width, height, dpi)
+        return page.get_pixmap(matrix=matrix, alpha=alpha)
+
+def save_pixmap(pix, output_path):
+    """Write a pixmap as PNG, keeping any transparency"""
+    with stage('encode'):
+        pix.save(output_path)
+    return output_path
 
-def convert_svg_to_jpeg(input_path):
-    """Convert SVG to JPEG format (placeholder - requires additional setup)"""
-    print("SVG to JPEG conversion requires additional setup. Please use an online converter.")
-    return None
\ No newline at end of file
+def pixmap_to_image(pix, max_width=None, max_height=None):
+    """Wrap a pixmap's samples in a Pillow image, optionally shrinking it"""
+    mode = {1: 'L', 3: 'RGB', 4: 'RGBA'}[pix.n]
+    # Pixmaps from plugin steps have not been checked on render
+    check_image_size(pix.width, pix.height)
+    with stage('decode'):
+        image = Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+    target = fit_size(image.size, max_width, max_height)
+    if target != image.size:
+        with stage('resize'):
+            image = image.resize(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    return image
@@ -0,0 +1,41 @@
+import time
+from contextlib import contextmanager
+
+# Converters that analyse their output write the results as JSON next to
+# it, at the output path plus this suffix
+ANALYSIS_SUFFIX = '.analysis.json'
+
+# Stage timings for the conversion currently running in this process
+_timings = {}
+
+@contextmanager
+def stage(name):
+    """Add the time spent in the block to the named stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _timings[name] = _timings.get(name, 0.0) + time.perf_counter() - started
+
+def record(name, seconds):
+    """Add an externally measured duration to the named stage"""
+    _timings[name] = _timings.get(name, 0.0) + seconds
+
+def collect():
+    """Return and reset the stage timings recorded so far"""
+    timings = dict(_timings)
+    _timings.clear()
+    return timings
+
+# Receives progress(...) calls for the conversion running in this process
+_progress_reporter = None
+
+def set_progress_reporter(reporter):
+    """Send progress updates to reporter(done, total, unit); None discards them"""
+    global _progress_reporter
+    _progress_reporter = reporter
+
+def progress(done, total=None, unit=None):
+    """Report how far the running conversion has got, e.g. 3 of 12 pages"""
+    if _progress_reporter is not None:
+        _progress_reporter(done, total, unit)
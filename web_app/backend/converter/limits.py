@@ -0,0 +1,21 @@
+import os
+
+# Largest decoded image a job may hold, in pixels. Kept apart from the
+# converters so the API process can check uploads without importing them.
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 100_000_000))
+
+# Most pages a PDF job may open. Uploads are checked too, but the upload
+# probe cannot count pages kept in compressed object streams.
+PDF_MAX_PAGES = int(os.environ.get('PDF_MAX_PAGES', 2000))
+
+
+def check_image_size(width, height, hint=''):
+    """Raise ValueError before allocating an image larger than IMAGE_MAX_PIXELS"""
+    if width * height > IMAGE_MAX_PIXELS:
+        raise ValueError(f'Image is too large ({width}x{height}); the limit is {IMAGE_MAX_PIXELS} pixels' + hint)
+
+
+def check_page_count(page_count):
+    """Raise ValueError before working on a PDF with more than PDF_MAX_PAGES pages"""
+    if page_count > PDF_MAX_PAGES:
+        raise ValueError(f'PDF has {page_count} pages, the limit is {PDF_MAX_PAGES}')
@@ -1,42 +1,404 @@
 from pdf2docx import Converter
 import os
-from docx2pdf import convert
+import io
+import re
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from copy import deepcopy
+from docx import Document
+from docx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from docx.opc.part import Part, PartFactory, XmlPart
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from lxml import etree
 import fitz  # PyMuPDF
+from converter.docx_renderer import render_docx
+from converter.instrumentation import stage, progress
+from converter.limits import check_image_size, check_page_count
 
-def convert_pdf_to_word(input_path):
-    """Convert PDF to Word document"""
-    output_path = input_path.replace('.pdf', '.docx')
+# python-docx has no class for note parts; load them as XML so merged
+# shards can have their notes renumbered
+for _content_type in (CT.WML_FOOTNOTES, CT.WML_ENDNOTES):
+    PartFactory.part_type_for.setdefault(_content_type, XmlPart)
+
+def _convert_pdf_shard(input_path, start, end, shard_path):
+    """Convert pages [start, end) to their own DOCX; runs in a worker process"""
     cv = Converter(input_path)
-    cv.convert(output_path)
-    cv.close()
+    try:
+        cv.convert(shard_path, start=start, end=end)
+    finally:
+        cv.close()
+    return shard_path
+
+def _copy_relationships(element, source_part, target_part, copied):
+    """Re-point relationship references in element at target_part
+
+    External targets are related again and images are shared through the
+    package. Other parts, such as headers and footers, are copied along
+    with their own relationships; copied maps source parts to their copies.
+    """
+    for node in element.iter():
+        for attribute, value in list(node.attrib.items()):
+            if attribute not in (qn('r:embed'), qn('r:id'), qn('r:link')):
+                continue
+            rel = source_part.rels.get(value)
+            if rel is None:
+                continue
+            if rel.is_external:
+                new_id = target_part.relate_to(rel.target_ref, rel.reltype, is_external=True)
+            elif rel.reltype == RT.IMAGE:
+                new_id, _ = target_part.get_or_add_image(io.BytesIO(rel.target_part.blob))
+            else:
+                new_id = _copy_part(rel, target_part, copied)
+            node.set(attribute, new_id)
+
+def _copy_part(rel, target_part, copied):
+    """Relate a copy of rel's target part to target_part and return the new relationship id"""
+    part = rel.target_part
+    if part in copied:
+        return target_part.relate_to(copied[part], rel.reltype)
+    package = target_part.package
+    partname = package.next_partname(re.sub(r'\d*(\.\w+)$', r'%d\1', part.partname))
+    if isinstance(part, XmlPart):
+        copy = type(part)(partname, part.content_type, deepcopy(part.element), package)
+    else:
+        copy = Part(partname, part.content_type, part.blob, package)
+    copied[part] = copy
+    # Related before its own references are copied, so the partname is taken
+    new_id = target_part.relate_to(copy, rel.reltype)
+    if isinstance(copy, XmlPart):
+        _copy_relationships(copy.element, part, copy, copied)
+    return new_id
+
+def _copy_notes(element, source_part, target_part, copied):
+    """Copy the footnotes and endnotes element refers to, renumbering them in the target"""
+    for reltype, note_tag, reference_tag in ((RT.FOOTNOTES, 'w:footnote', 'w:footnoteReference'),
+                                             (RT.ENDNOTES, 'w:endnote', 'w:endnoteReference')):
+        references = list(element.iter(qn(reference_tag)))
+        source_rel = _part_relationship(source_part, reltype)
+        target_rel = _part_relationship(target_part, reltype)
+        if not references or (source_rel is not None and source_rel.target_part in copied):
+            continue
+        if source_rel is not None and target_rel is None:
+            # The first notes in the merged document: take the whole part as it is
+            _copy_part(source_rel, target_part, copied)
+            continue
+
+        source_notes = {note.get(qn('w:id')): note
+                        for note in (source_rel.target_part.element.iter(qn(note_tag)) if source_rel else ())}
+        target_notes = target_rel.target_part if target_rel is not None else None
+        for reference in references:
+            note = source_notes.get(reference.get(qn('w:id')))
+            if note is None or target_notes is None:
+                # Nothing to point at, so drop the dangling reference mark
+                reference.getparent().remove(reference)
+                continue
+            note = deepcopy(note)
+            note_id = str(_next_id(target_notes.element, note_tag, 'w:id'))
+            note.set(qn('w:id'), note_id)
+            _copy_relationships(note, source_rel.target_part, target_notes, copied)
+            target_notes.element.append(note)
+            reference.set(qn('w:id'), note_id)
+
+def _copy_numbering(element, source_part, target_part, copied, remapped):
+    """Point list numbering in element at definitions in the target's numbering part
+
+    Definitions equal to the target's under the same id are reused, others
+    are appended under new ids; remapped keeps the choice per source numId.
+    Numbering with no definition is dropped.
+    """
+    num_ids = [num_id for num_id in element.iter(qn('w:numId')) if num_id.get(qn('w:val')) != '0']
+    source_rel = _part_relationship(source_part, RT.NUMBERING)
+    target_rel = _part_relationship(target_part, RT.NUMBERING)
+    if not num_ids or (source_rel is not None and source_rel.target_part in copied):
+        return
+    if source_rel is not None and target_rel is None:
+        _copy_part(source_rel, target_part, copied)
+        return
+
+    for num_id in num_ids:
+        value = num_id.get(qn('w:val'))
+        if value not in remapped:
+            remapped[value] = _copy_numbering_definition(
+                value,
+                source_rel.target_part.element if source_rel is not None else None,
+                target_rel.target_part.element if target_rel is not None else None,
+            )
+        if remapped[value] is None:
+            num_pr = num_id.getparent()
+            num_pr.getparent().remove(num_pr)
+        else:
+            num_id.set(qn('w:val'), remapped[value])
+
+def _numbering_definition(numbering, num_id):
+    """(w:num, w:abstractNum) for a numId, or (None, None)"""
+    if numbering is None:
+        return None, None
+    num = next((num for num in numbering.iter(qn('w:num')) if num.get(qn('w:numId')) == num_id), None)
+    abstract_num_id = num.find(qn('w:abstractNumId')) if num is not None else None
+    if abstract_num_id is None:
+        return None, None
+    abstract = next((abstract for abstract in numbering.iter(qn('w:abstractNum'))
+                     if abstract.get(qn('w:abstractNumId')) == abstract_num_id.get(qn('w:val'))), None)
+    return (num, abstract) if abstract is not None else (None, None)
+
+def _copy_numbering_definition(num_id, source_numbering, target_numbering):
+    """Target numId for a source numId, copying its definition when the target's differs"""
+    num, abstract = _numbering_definition(source_numbering, num_id)
+    if num is None or target_numbering is None:
+        return None
+    existing_num, existing_abstract = _numbering_definition(target_numbering, num_id)
+    if existing_num is not None and etree.tostring(existing_num) == etree.tostring(num) \
+            and etree.tostring(existing_abstract) == etree.tostring(abstract):
+        return num_id
+
+    abstract = deepcopy(abstract)
+    abstract_id = str(_next_id(target_numbering, 'w:abstractNum', 'w:abstractNumId'))
+    abstract.set(qn('w:abstractNumId'), abstract_id)
+    # Abstract definitions come before the first w:num in the schema
+    first_num = target_numbering.find(qn('w:num'))
+    if first_num is not None:
+        first_num.addprevious(abstract)
+    else:
+        target_numbering.append(abstract)
+    num = deepcopy(num)
+    new_id = str(_next_id(target_numbering, 'w:num', 'w:numId'))
+    num.set(qn('w:numId'), new_id)
+    num.find(qn('w:abstractNumId')).set(qn('w:val'), abstract_id)
+    target_numbering.append(num)
+    return new_id
+
+def _next_id(root, tag, attribute):
+    """One more than the largest numeric id among root's tag elements"""
+    return max((int(child.get(qn(attribute))) for child in root.iter(qn(tag))), default=0) + 1
+
+def _part_relationship(part, reltype):
+    """The relationship from part to its internal part of reltype, or None"""
+    return next((rel for rel in part.rels.values() if rel.reltype == reltype and not rel.is_external), None)
+
+def merge_docx_files(docx_paths, output_path):
+    """Concatenate DOCX bodies in order, keeping each shard's section layout"""
+    merged = Document(docx_paths[0])
+    body = merged.element.body
+
+    for path in docx_paths[1:]:
+        # Turn the current final section into a section break so the next
+        # shard starts on a new page with its own page setup
+        final_sect_pr = body.find(qn('w:sectPr'))
+        if final_sect_pr is not None:
+            break_paragraph = OxmlElement('w:p')
+            paragraph_props = OxmlElement('w:pPr')
+            paragraph_props.append(deepcopy(final_sect_pr))
+            break_paragraph.append(paragraph_props)
+            final_sect_pr.addprevious(break_paragraph)
+            body.remove(final_sect_pr)
+
+        shard = Document(path)
+        copied = {}  # shard part -> its copy in the merged document
+        numbering = {}  # shard numId -> merged numId
+        for element in shard.element.body.iterchildren():
+            element = deepcopy(element)
+            _copy_relationships(element, shard.part, merged.part, copied)
+            _copy_notes(element, shard.part, merged.part, copied)
+            _copy_numbering(element, shard.part, merged.part, copied, numbering)
+            body.append(element)
+
+    merged.save(output_path)
+    return output_path
+
+def convert_pdf_to_word(input_path, output_path, shards=None, workers=None):
+    """Convert PDF to Word document
+
+    With ``shards`` the PDF is split into that many page ranges which are
+    converted in parallel worker processes and merged back in order.
+    Progress is reported as each shard finishes.
+    """
+    with fitz.open(input_path) as pdf_document:
+        page_count = pdf_document.page_count
+    check_page_count(page_count)
+    shard_count = min(int(shards or 1), page_count)
+
+    if shard_count <= 1:
+        with stage('transcode'):
+            _convert_pdf_shard(input_path, 0, None, output_path)
+        progress(1, 1, 'shards')
+        return output_path
+
+    # Even page ranges, with the remainder spread over the first shards
+    base, extra = divmod(page_count, shard_count)
+    ranges = []
+    start = 0
+    for index in range(shard_count):
+        end = start + base + (1 if index < extra else 0)
+        ranges.append((start, end))
+        start = end
+
+    workers = min(int(workers or os.cpu_count() or 1), shard_count)
+    shard_dir = tempfile.mkdtemp(prefix='pdf_shards_', dir=os.path.dirname(os.path.abspath(input_path)))
+    shard_paths = [os.path.join(shard_dir, f"shard_{index:03d}.docx") for index in range(shard_count)]
+
+    try:
+        with stage('transcode'), ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_convert_pdf_shard, input_path, start, end, shard_path)
+                for (start, end), shard_path in zip(ranges, shard_paths)
+            ]
+            for done, future in enumerate(as_completed(futures), start=1):
+                future.result()
+                print(f"PDF to Word: {done}/{shard_count} shards converted")
+                progress(done, shard_count, 'shards')
+
+        with stage('encode'):
+            merge_docx_files(shard_paths, output_path)
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
     return output_path
 
-def convert_word_to_pdf(input_path):
-    """Convert Word document to PDF"""
-    output_path = input_path.replace('.docx', '.pdf')
-    convert(input_path, output_path)
+def convert_word_to_pdf(input_path, output_path, engine='reportlab'):
+    """Convert Word document to PDF
+
+    The default engine lays the document out with ReportLab and runs
+    anywhere. engine='word' drives an installed Microsoft Word through
+    docx2pdf, which only exists on Windows and macOS.
+    """
+    if engine == 'reportlab':
+        with stage('transcode'):
+            render_docx(input_path, output_path)
+    elif engine == 'word':
+        from docx2pdf import convert
+        with stage('transcode'):
+            convert(input_path, output_path)
+        progress(1, 1, 'documents')
+    else:
+        raise ValueError(f"Unknown Word to PDF engine '{engine}'")
     return output_path
 
-def convert_pdf_to_png(input_path):
-    """Convert PDF to PNG format (first page only)"""
-    output_path = input_path.replace('.pdf', '.png')
-    
-    # Open the PDF
-    pdf_document = fitz.open(input_path)
-    
-    # Get the first page
-    page = pdf_document[0]
-    
-    # Set zoom factor for better quality
-    mat = fitz.Matrix(2.0, 2.0)
-    
-    # Render page to image
-    pix = page.get_pixmap(matrix=mat)
-    
-    # Save as PNG
-    pix.save(output_path)
-    
-    # Close the document
-    pdf_document.close()
-    
-    return output_path
\ No newline at end of file
+COLORSPACES = {
+    'rgb': fitz.csRGB,
+    'gray': fitz.csGRAY,
+}
+MAX_RENDER_DPI = 600
+
+def parse_page_range(pages, page_count):
+    """Turn 'all', '3' or '1-5,8' (1-based) into a sorted list of 0-based page numbers"""
+    if pages is None:
+        return [0]
+    if str(pages).strip().lower() == 'all':
+        return list(range(page_count))
+
+    selected = set()
+    for part in str(pages).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            first = int(first) if first.strip() else 1
+            last = int(last) if last.strip() else page_count
+        else:
+            first = last = int(part)
+        if first < 1 or last > page_count or first > last:
+            raise ValueError(f"Page range '{part}' is outside 1-{page_count}")
+        selected.update(range(first - 1, last))
+
+    if not selected:
+        raise ValueError('No pages selected')
+    return sorted(selected)
+
+def _render_matrix(zoom, dpi):
+    """Build the render matrix from a zoom factor or a DPI"""
+    if dpi is not None:
+        zoom = float(dpi) / 72.0
+    zoom = float(zoom)
+    if zoom <= 0 or zoom * 72.0 > MAX_RENDER_DPI:
+        raise ValueError(f'Render resolution must be between 1 and {MAX_RENDER_DPI} DPI')
+    return fitz.Matrix(zoom, zoom)
+
+def _render_page(pdf_page, matrix, colorspace):
+    """Render a page to a pixmap, refusing renders over IMAGE_MAX_PIXELS before allocating"""
+    size = (pdf_page.rect * matrix).irect
+    check_image_size(size.width, size.height, ', try a lower zoom or dpi')
+    return pdf_page.get_pixmap(matrix=matrix, colorspace=COLORSPACES[colorspace])
+
+def _render_pages_to_png(input_path, page_numbers, zoom, dpi, colorspace):
+    """Render pages to PNG bytes; runs in a worker with its own document handle"""
+    matrix = _render_matrix(zoom, dpi)
+    rendered = []
+    with fitz.open(input_path) as pdf_document:
+        for page_number in page_numbers:
+            pix = _render_page(pdf_document[page_number], matrix, colorspace)
+            rendered.append((page_number, pix.tobytes('png')))
+    return rendered
+
+def render_pdf_page(input_path, page=1, zoom=2.0, dpi=None, colorspace='rgb'):
+    """Render one page (1-based) to a PyMuPDF pixmap for further conversion"""
+    if colorspace not in COLORSPACES:
+        raise ValueError(f"Unsupported colorspace '{colorspace}'")
+    matrix = _render_matrix(zoom, dpi)
+    with stage('render'), fitz.open(input_path) as pdf_document:
+        check_page_count(pdf_document.page_count)
+        if not 1 <= int(page) <= pdf_document.page_count:
+            raise ValueError(f'Page {page} is outside 1-{pdf_document.page_count}')
+        pix = _render_page(pdf_document[int(page) - 1], matrix, colorspace)
+    progress(1, 1, 'pages')
+    return pix
+
+def convert_pdf_to_png(input_path, output_path, pages=None, zoom=2.0, dpi=None, colorspace='rgb', workers=None):
+    """Convert PDF pages to PNG
+
+    Without ``pages`` only the first page is rendered to a single PNG. With
+    ``pages`` ('all' or a range like '1-5,8') the pages are rendered across a
+    process pool and written into a ZIP as they finish.
+    """
+    if colorspace not in COLORSPACES:
+        raise ValueError(f"Unsupported colorspace '{colorspace}'")
+    _render_matrix(zoom, dpi)
+
+    with fitz.open(input_path) as pdf_document:
+        page_count = pdf_document.page_count
+    check_page_count(page_count)
+    page_numbers = parse_page_range(pages, page_count)
+
+    if len(page_numbers) == 1:
+        with stage('render'):
+            [(_, png_bytes)] = _render_pages_to_png(input_path, page_numbers, zoom, dpi, colorspace)
+        with stage('encode'), open(output_path, 'wb') as f:
+            f.write(png_bytes)
+        progress(1, 1, 'pages')
+        return output_path
+
+    output_path = os.path.splitext(output_path)[0] + '.zip'
+    workers = min(int(workers or os.environ.get('PDF_RENDER_WORKERS', 0) or os.cpu_count() or 1), len(page_numbers))
+
+    # Several small batches per worker keeps the pool busy while letting the
+    # ZIP receive pages early; each batch opens the document only once
+    batch_size = max(1, len(page_numbers) // (workers * 4))
+    batches = [page_numbers[i:i + batch_size] for i in range(0, len(page_numbers), batch_size)]
+    digits = len(str(page_count))
+    rendered_count = 0
+
+    with stage('render'), zipfile.ZipFile(output_path, 'w', zipfile.ZIP_STORED) as zipf:
+        if workers == 1:
+            results = (_render_pages_to_png(input_path, batch, zoom, dpi, colorspace) for batch in batches)
+            for rendered in results:
+                for page_number, png_bytes in rendered:
+                    zipf.writestr(f"page_{page_number + 1:0{digits}d}.png", png_bytes)
+                rendered_count += len(rendered)
+                progress(rendered_count, len(page_numbers), 'pages')
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(_render_pages_to_png, input_path, batch, zoom, dpi, colorspace)
+                    for batch in batches
+                ]
+                for future in as_completed(futures):
+                    rendered = future.result()
+                    for page_number, png_bytes in rendered:
+                        zipf.writestr(f"page_{page_number + 1:0{digits}d}.png", png_bytes)
+                    rendered_count += len(rendered)
+                    progress(rendered_count, len(page_numbers), 'pages')
+
+    return output_path
@@ -0,0 +1,54 @@
+import os
+from collections import OrderedDict
+
+# Documents each preview worker keeps open between jobs
+MAX_DOCUMENTS = int(os.environ.get('PREVIEW_MAX_DOCUMENTS', 8))
+
+
+class DocumentPool:
+    """Open PDF documents kept between preview jobs, least recently used closed first
+
+    Documents are keyed on their content hash, so uploads of the same file
+    share one handle. Each worker process has its own pool and runs one job
+    at a time, so no locking is needed.
+    """
+
+    def __init__(self, max_documents):
+        self.max_documents = max_documents
+        self._documents = OrderedDict()  # file hash -> fitz.Document
+
+    def open(self, file_hash, path):
+        """Return the pooled document for file_hash, opening path on a miss"""
+        document = self._documents.get(file_hash)
+        if document is not None:
+            self._documents.move_to_end(file_hash)
+            return document
+
+        # Imported here so the API process can name this module's functions
+        # in jobs without loading PyMuPDF itself
+        import fitz  # PyMuPDF
+        document = fitz.open(path)
+        if document.needs_pass:
+            document.close()
+            raise ValueError('PDF is password protected')
+        self._documents[file_hash] = document
+        while len(self._documents) > self.max_documents:
+            _, oldest = self._documents.popitem(last=False)
+            oldest.close()
+        return document
+
+
+_pool = DocumentPool(MAX_DOCUMENTS)
+
+
+def render_thumbnail(input_path, file_hash, page, size, output_path):
+    """Render a page (1-based) as a PNG scaled to fit size x size pixels; runs in a worker"""
+    import fitz  # PyMuPDF
+    document = _pool.open(file_hash, input_path)
+    if not 1 <= page <= document.page_count:
+        raise ValueError(f'Page {page} is outside 1-{document.page_count}')
+    pdf_page = document[page - 1]
+    scale = size / max(pdf_page.rect.width, pdf_page.rect.height, 1)
+    pixmap = pdf_page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+    pixmap.save(output_path, output='png')
+    return output_path
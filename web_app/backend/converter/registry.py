@@ -0,0 +1,318 @@
+import ast
+import heapq
+import importlib
+import importlib.util
+import inspect
+import os
+from functools import lru_cache
+
+# Format nodes. File formats have extensions (the first is used for outputs)
+# and a job lane; in-memory formats are decoded objects that one step hands
+# straight to the next, so a multi-hop conversion writes no files between them.
+FORMATS = {}
+
+# Converter edges per source format: (target, function path, cost, bound kwargs)
+EDGES = {}
+
+
+def register_format(name, extensions=(), lane=None):
+    """Declare a format node; without extensions it only exists in memory"""
+    FORMATS[name] = {'extensions': tuple(extensions), 'lane': lane}
+    EDGES.setdefault(name, [])
+    plan.cache_clear()
+
+
+def register_converter(source, target, function, cost=1.0, **bound):
+    """Declare a conversion step from one format node to another
+
+    ``function`` is a 'module:name' path, imported only when a worker runs
+    the step. It is called with the source value (a path for file formats,
+    the decoded object otherwise), then the output path when the target is a
+    file format, then ``bound`` and whichever job options it accepts. It
+    returns the written path or the decoded object. ``cost`` is a rough
+    relative run time used to pick between plans.
+    """
+    for name in (source, target):
+        if name not in FORMATS:
+            raise ValueError(f"Unknown format '{name}'")
+    EDGES[source].append((target, function, float(cost), bound))
+    plan.cache_clear()
+
+
+def is_file_format(name):
+    return bool(FORMATS[name]['extensions'])
+
+
+def format_for(filename):
+    """Name the file format of a filename from its extension, or None"""
+    extension = os.path.splitext(filename)[1].lower()
+    for name, spec in FORMATS.items():
+        if extension in spec['extensions']:
+            return name
+    return None
+
+
+@lru_cache(maxsize=None)
+def load_function(path):
+    module, name = path.split(':')
+    return getattr(importlib.import_module(module), name)
+
+
+@lru_cache(maxsize=None)
+def parameter_names(path):
+    """Argument names of a converter function, read from its source without importing it
+
+    Lets the API process know which options a plan accepts while the
+    converter libraries stay in the workers.
+    """
+    module, name = path.split(':')
+    spec = importlib.util.find_spec(module)
+    if spec is not None and spec.origin and spec.origin.endswith('.py'):
+        with open(spec.origin, encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        for node in tree.body:
+            if isinstance(node, ast.FunctionDef) and node.name == name:
+                arguments = node.args
+                return tuple(argument.arg for argument in
+                             arguments.posonlyargs + arguments.args + arguments.kwonlyargs)
+    # Defined some other way (e.g. assigned or compiled); import it after all
+    return tuple(name for name, parameter in inspect.signature(load_function(path)).parameters.items()
+                 if parameter.kind not in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD))
+
+
+class Step:
+    """One edge of a plan, resolved lazily so plans pickle to workers cheaply"""
+
+    def __init__(self, source, target, function, bound):
+        self.source = source
+        self.target = target
+        self.function = function
+        self.bound = bound
+
+    def parameters(self):
+        """Job options this step accepts, in declaration order"""
+        parameters = list(inspect.signature(load_function(self.function)).parameters.values())
+        # Skip the source value, and the output path for steps that write files
+        parameters = parameters[2 if is_file_format(self.target) else 1:]
+        return [parameter for parameter in parameters if parameter.name not in self.bound
+                and parameter.kind not in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD)]
+
+    def option_names(self):
+        """Names of the job options this step accepts, without importing its converter"""
+        names = parameter_names(self.function)[2 if is_file_format(self.target) else 1:]
+        return [name for name in names if name not in self.bound]
+
+    def __call__(self, value, output_path, options):
+        accepted = {parameter.name for parameter in self.parameters()}
+        kwargs = {key: option for key, option in options.items() if key in accepted}
+        kwargs.update(self.bound)
+        func = load_function(self.function)
+        if is_file_format(self.target):
+            return func(value, output_path, **kwargs)
+        return func(value, **kwargs)
+
+    def __repr__(self):
+        return f'Step({self.source} -> {self.target} via {self.function})'
+
+
+class Plan:
+    """Chain of steps converting a file of one format into another
+
+    Called like a converter: plan(input_path, **options) returns the output
+    path, next to the input and named after it. Each option goes only to
+    the first step that accepts it, so an option meant for one step never
+    changes what a later step does. Decoded objects pass between steps in
+    memory; only a step that works on files (e.g. Word to PDF) leaves a
+    temporary intermediate file, which is removed once the next step has
+    read it.
+    """
+
+    def __init__(self, source, target, steps, cost):
+        self.source = source
+        self.target = target
+        self.steps = steps
+        self.cost = cost
+        self.__name__ = f'{source}_to_{target}'
+
+    @property
+    def extension(self):
+        return FORMATS[self.target]['extensions'][0]
+
+    @property
+    def lane(self):
+        return FORMATS[self.source]['lane']
+
+    @property
+    def route(self):
+        return [self.source] + [step.target for step in self.steps]
+
+    @property
+    def modules(self):
+        return sorted({step.function.split(':')[0] for step in self.steps})
+
+    @property
+    def __signature__(self):
+        # Lets inspect.signature() report every option the plan accepts
+        parameters = [inspect.Parameter('input_path', inspect.Parameter.POSITIONAL_OR_KEYWORD)]
+        seen = set()
+        for step in self.steps:
+            for parameter in step.parameters():
+                if parameter.name not in seen:
+                    seen.add(parameter.name)
+                    parameters.append(parameter.replace(kind=inspect.Parameter.KEYWORD_ONLY))
+        return inspect.Signature(parameters)
+
+    def option_names(self):
+        """Every option some step accepts, without importing the converters"""
+        return {name for step in self.steps for name in step.option_names()}
+
+    def load(self):
+        """Import every step's converter now rather than on first use"""
+        for step in self.steps:
+            load_function(step.function)
+        return self
+
+    def __call__(self, input_path, **options):
+        root = os.path.splitext(input_path)[0]
+        value = input_path
+        intermediates = []
+        remaining = dict(options)
+        try:
+            for index, step in enumerate(self.steps):
+                last = index == len(self.steps) - 1
+                output_path = None
+                if is_file_format(step.target):
+                    extension = FORMATS[step.target]['extensions'][0]
+                    output_path = root + extension if last else f'{root}.step{index}{extension}'
+                accepted = {parameter.name for parameter in step.parameters()}
+                step_options = {key: remaining.pop(key) for key in list(remaining) if key in accepted}
+                value = step(value, output_path, step_options)
+                if value is None:
+                    raise RuntimeError(f'Converting {step.source} to {step.target} failed')
+                if output_path and not last:
+                    intermediates.append(value)
+                    # Some options change a step's output (e.g. several PDF pages become
+                    # a ZIP), which the next step cannot read
+                    if os.path.splitext(value)[1].lower() != extension:
+                        raise ValueError(
+                            f'Converting {step.source} to {step.target} produced a '
+                            f'{os.path.splitext(value)[1]} file, which cannot be converted further; '
+                            f'multi-page output only works when {step.target} is the final format'
+                        )
+            return value
+        finally:
+            for path in intermediates:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def __repr__(self):
+        return f"Plan({' -> '.join(self.route)})"
+
+
+@lru_cache(maxsize=None)
+def plan(source, target):
+    """Cheapest chain of steps from source to target, or None if unreachable
+
+    Only the ends of a plan are file formats the user sees; in-memory
+    formats and other file formats may appear in between.
+    """
+    if source not in FORMATS or target not in FORMATS or source == target:
+        return None
+    best = {source: 0.0}
+    queue = [(0.0, 0, source, ())]
+    counter = 1
+    while queue:
+        cost, _, name, steps = heapq.heappop(queue)
+        if name == target:
+            return Plan(source, target, list(steps), cost)
+        if cost > best.get(name, float('inf')):
+            continue
+        for next_name, function, step_cost, bound in EDGES[name]:
+            next_cost = cost + step_cost
+            if next_cost < best.get(next_name, float('inf')):
+                best[next_name] = next_cost
+                step = Step(name, next_name, function, bound)
+                # The counter keeps heap entries comparable when costs tie
+                heapq.heappush(queue, (next_cost, counter, next_name, steps + (step,)))
+                counter += 1
+    return None
+
+
+def conversion_plans():
+    """Every conversion between two file formats, keyed 'source_to_target'"""
+    plans = {}
+    for source in FORMATS:
+        if not is_file_format(source):
+            continue
+        for target in FORMATS:
+            if is_file_format(target):
+                found = plan(source, target)
+                if found is not None:
+                    plans[found.__name__] = found
+    return plans
+
+
+def conversions_from(filename):
+    """Conversion types available for an uploaded file, in format declaration order"""
+    source = format_for(filename)
+    if source is None:
+        return []
+    return [found.__name__ for found in conversion_plans().values() if found.source == source]
+
+
+def upload_extensions():
+    """Extensions (without the dot) that some conversion starts from, per lane"""
+    lanes = {}
+    for found in conversion_plans().values():
+        extensions = lanes.setdefault(found.lane, set())
+        extensions.update(extension.lstrip('.') for extension in FORMATS[found.source]['extensions'])
+    return lanes
+
+
+def lane_modules():
+    """Converter modules each job lane's workers need, for preloading"""
+    lanes = {}
+    for found in conversion_plans().values():
+        lanes.setdefault(found.lane, set()).update(found.modules)
+    return {lane: sorted(modules) for lane, modules in lanes.items()}
+
+
+register_format('pdf', ['.pdf'], 'document')
+register_format('word', ['.docx'], 'document')
+register_format('png', ['.png'], 'image')
+register_format('jpeg', ['.jpg', '.jpeg'], 'image')
+register_format('svg', ['.svg'], 'image')
+register_format('webp', ['.webp'], 'image')
+register_format('avif', ['.avif'], 'image')
+register_format('mp3', ['.mp3'], 'audio')
+register_format('wav', ['.wav'], 'audio')
+register_format('m4a', ['.m4a'], 'audio')
+# Decoded Pillow images and PyMuPDF pixmaps
+register_format('image')
+register_format('pixmap')
+
+register_converter('pdf', 'word', 'converter.pdf_converter:convert_pdf_to_word', cost=20)
+register_converter('word', 'pdf', 'converter.pdf_converter:convert_word_to_pdf', cost=5)
+register_converter('pdf', 'png', 'converter.pdf_converter:convert_pdf_to_png', cost=1.5)
+register_converter('pdf', 'pixmap', 'converter.pdf_converter:render_pdf_page')
+register_converter('svg', 'pixmap', 'converter.image_converter:render_svg', alpha=True)
+register_converter('pixmap', 'png', 'converter.image_converter:save_pixmap')
+register_converter('pixmap', 'image', 'converter.image_converter:pixmap_to_image', cost=0.5)
+for raster in ('png', 'jpeg'):
+    register_converter(raster, 'image', 'converter.image_converter:decode_image')
+    # Tracing shrinks the image on load, so it reads the file itself
+    register_converter(raster, 'svg', 'converter.image_converter:trace_to_svg', cost=5)
+for raster in ('png', 'jpeg', 'webp', 'avif'):
+    register_converter('image', raster, 'converter.image_converter:encode_image', target_format=raster)
+for audio_source in ('mp3', 'wav', 'm4a'):
+    for audio_target in ('mp3', 'wav', 'm4a'):
+        if audio_source != audio_target:
+            register_converter(audio_source, audio_target, 'converter.audio_converter:convert_audio',
+                               cost=3, target_format=audio_target, source_format=audio_source)
+
+# Modules that register further formats and converters, imported by the API
+# and by every worker so both see the same graph
+for plugin in filter(None, (name.strip() for name in os.environ.get('CONVERTER_PLUGINS', '').split(','))):
+    importlib.import_module(plugin)
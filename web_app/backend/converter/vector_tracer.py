@@ -0,0 +1,227 @@
+import numpy as np
+from PIL import Image, ImageFilter
+from converter.instrumentation import progress
+
+# Working resolution, palette size, path simplification tolerance (in traced
+# pixels) and smallest kept region area for each detail level
+DETAIL_LEVELS = {
+    'low': {'max_side': 256, 'colors': 8, 'epsilon': 1.2, 'min_area': 12, 'smooth': 5},
+    'medium': {'max_side': 512, 'colors': 16, 'epsilon': 0.8, 'min_area': 6, 'smooth': 3},
+    'high': {'max_side': 1024, 'colors': 32, 'epsilon': 0.5, 'min_area': 2, 'smooth': 0},
+}
+TRANSPARENT = -1
+
+
+def quantize_colors(pixels, colors, iterations=6, sample_size=20000, seed=0):
+    """K-means palette for an (N, 3) pixel array; returns (palette, labels)"""
+    pixels = pixels.astype(np.float32)
+    rng = np.random.default_rng(seed)
+    sample = pixels[rng.choice(len(pixels), min(sample_size, len(pixels)), replace=False)]
+
+    # Seed with a median-cut palette, which is fast and already close
+    seed_image = Image.fromarray(sample.astype(np.uint8).reshape(-1, 1, 3), 'RGB')
+    palette = seed_image.quantize(colors=colors, method=Image.Quantize.MEDIANCUT).getpalette()
+    centers = np.array(palette[:colors * 3], dtype=np.float32).reshape(-1, 3)
+
+    for _ in range(iterations):
+        labels = _nearest_center(sample, centers)
+        counts = np.bincount(labels, minlength=len(centers))
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, sample)
+        used = counts > 0
+        centers[used] = sums[used] / counts[used, None]
+        centers = centers[used]
+
+    return centers.round().astype(np.uint8), _nearest_center(pixels, centers)
+
+
+def _nearest_center(pixels, centers, chunk=262144):
+    """Index of the closest palette entry for every pixel, in bounded chunks"""
+    labels = np.empty(len(pixels), dtype=np.int32)
+    center_norms = (centers.astype(np.float32) ** 2).sum(axis=1)
+    for start in range(0, len(pixels), chunk):
+        block = pixels[start:start + chunk]
+        # |p - c|^2 = |p|^2 - 2 p.c + |c|^2, the |p|^2 term does not change the argmin
+        distances = center_norms[None, :] - 2.0 * block @ centers.T.astype(np.float32)
+        labels[start:start + chunk] = distances.argmin(axis=1)
+    return labels
+
+
+def _runs(mask):
+    """Start and end (exclusive) column of each run of True values, per row"""
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    changes = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(changes == 1)
+    _, ends = np.nonzero(changes == -1)
+    return rows, starts, ends
+
+
+def _boundary_segments(mask):
+    """Maximal straight boundary segments of a mask, oriented consistently
+
+    Walking each segment keeps the region on the same side, so every vertex
+    has as many incoming as outgoing segments and they link into loops.
+    """
+    height, width = mask.shape
+    padded = np.zeros((height + 2, width + 2), dtype=bool)
+    padded[1:-1, 1:-1] = mask
+    inner = padded[1:-1, 1:-1]
+
+    segments = []
+    # Top edges run left to right, bottom edges right to left
+    rows, starts, ends = _runs(inner & ~padded[:-2, 1:-1])
+    segments.append(np.stack([starts, rows, ends, rows], axis=1))
+    rows, starts, ends = _runs(inner & ~padded[2:, 1:-1])
+    segments.append(np.stack([ends, rows + 1, starts, rows + 1], axis=1))
+    # Right edges run downwards, left edges upwards (runs found on the transpose)
+    cols, starts, ends = _runs((inner & ~padded[1:-1, 2:]).T)
+    segments.append(np.stack([cols + 1, starts, cols + 1, ends], axis=1))
+    cols, starts, ends = _runs((inner & ~padded[1:-1, :-2]).T)
+    segments.append(np.stack([cols, ends, cols, starts], axis=1))
+    return np.concatenate(segments)
+
+
+def _link_loops(segments):
+    """Chain oriented segments end to start into closed vertex loops"""
+    outgoing = {}
+    for index, (x0, y0, _, _) in enumerate(segments.tolist()):
+        outgoing.setdefault((x0, y0), []).append(index)
+
+    segment_list = segments.tolist()
+    used = [False] * len(segment_list)
+    loops = []
+    for first in range(len(segment_list)):
+        if used[first]:
+            continue
+        loop = []
+        index = first
+        # Every vertex is balanced, so the walk can only get stuck where it began
+        while index is not None:
+            used[index] = True
+            x0, y0, x1, y1 = segment_list[index]
+            loop.append((x0, y0))
+            index = next((c for c in outgoing[(x1, y1)] if not used[c]), None)
+        loops.append(np.array(loop, dtype=np.float32))
+    return loops
+
+
+def _simplify_open(points, epsilon):
+    """Ramer-Douglas-Peucker on an open polyline with vectorized distance checks"""
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[end] - points[start]
+        length = np.hypot(segment[0], segment[1])
+        offsets = points[start + 1:end] - points[start]
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        farthest = int(distances.argmax())
+        if distances[farthest] > epsilon:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return points[keep]
+
+
+def simplify_loop(loop, epsilon):
+    """Simplify a closed loop, splitting it at its two most distant points"""
+    if epsilon <= 0 or len(loop) < 5:
+        return loop
+    far = int(np.hypot(*(loop - loop[0]).T).argmax())
+    first = _simplify_open(loop[:far + 1], epsilon)
+    second = _simplify_open(np.vstack([loop[far:], loop[:1]]), epsilon)
+    return np.vstack([first[:-1], second[:-1]])
+
+
+def _loop_area(loop):
+    x, y = loop[:, 0], loop[:, 1]
+    return 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+def _path_data(loops):
+    parts = []
+    for loop in loops:
+        coordinates = ' '.join(f"{x:g} {y:g}" for x, y in np.round(loop, 1).tolist())
+        parts.append(f"M{coordinates}Z")
+    return ''.join(parts)
+
+
+def trace_image(image, detail='medium', colors=None, size=None):
+    """Trace a PIL image into a self-contained SVG document string
+
+    ``size`` is the (width, height) the SVG should declare, for images that
+    were already downscaled; it defaults to the image's own size.
+    """
+    if detail not in DETAIL_LEVELS:
+        raise ValueError(f"Detail must be one of: {', '.join(DETAIL_LEVELS)}")
+    settings = dict(DETAIL_LEVELS[detail])
+    if colors is not None:
+        colors = int(colors)
+        if not 2 <= colors <= 64:
+            raise ValueError('Colors must be between 2 and 64')
+        settings['colors'] = colors
+
+    original_width, original_height = size or image.size
+    image = image.convert('RGBA')
+    image.thumbnail((settings['max_side'], settings['max_side']), Image.Resampling.LANCZOS)
+    width, height = image.size
+
+    rgba = np.asarray(image)
+    opaque = rgba[:, :, 3] >= 128
+    if opaque.any():
+        palette, labels = quantize_colors(rgba[:, :, :3][opaque], settings['colors'])
+    else:
+        palette, labels = np.zeros((0, 3), dtype=np.uint8), np.zeros(0, dtype=np.int32)
+
+    label_image = np.full((height, width), TRANSPARENT, dtype=np.int32)
+    label_image[opaque] = labels
+    if settings['smooth']:
+        # A mode filter removes single-pixel speckles that would become tiny paths
+        filtered = Image.fromarray((label_image + 1).astype(np.uint8), 'L').filter(
+            ImageFilter.ModeFilter(settings['smooth'])
+        )
+        label_image = np.asarray(filtered).astype(np.int32) - 1
+
+    # Paint large regions first; the largest fully opaque one becomes the background
+    areas = np.bincount(label_image[label_image >= 0].ravel(), minlength=len(palette))
+    order = [int(label) for label in np.argsort(areas)[::-1] if areas[label]]
+    background = order[0] if order and opaque.all() else None
+
+    shapes = []
+    if background is not None:
+        r, g, b = palette[background]
+        shapes.append(f'<rect width="{width}" height="{height}" fill="#{r:02x}{g:02x}{b:02x}"/>')
+
+    for traced, label in enumerate(order):
+        progress(traced, len(order), 'colors')
+        if label == background:
+            continue
+        loops = _link_loops(_boundary_segments(label_image == label))
+        loops = [simplify_loop(loop, settings['epsilon']) for loop in loops]
+        loops = [loop for loop in loops if len(loop) >= 3 and _loop_area(loop) >= settings['min_area']]
+        if not loops:
+            continue
+        r, g, b = palette[label]
+        color = f"#{r:02x}{g:02x}{b:02x}"
+        # A thin stroke in the fill colour hides seams between neighbouring regions
+        shapes.append(
+            f'<path fill="{color}" stroke="{color}" stroke-width="0.5" stroke-linejoin="round" '
+            f'fill-rule="evenodd" d="{_path_data(loops)}"/>'
+        )
+    progress(len(order), len(order), 'colors')
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{original_width}" height="{original_height}" '
+        f'viewBox="0 0 {width} {height}" shape-rendering="geometricPrecision">\n'
+        + '\n'.join(shapes)
+        + '\n</svg>\n'
+    )
@@ -0,0 +1,393 @@
+import os
+import re
+import struct
+import zipfile
+
+from converter import registry
+from converter.limits import IMAGE_MAX_PIXELS, PDF_MAX_PAGES
+
+# Budgets checked at upload, before any worker time is spent; the image and
+# page budgets are the ones the converters enforce
+AUDIO_MAX_SECONDS = int(os.environ.get('AUDIO_MAX_SECONDS', 4 * 3600))
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_IEND = b'IEND\xaeB`\x82'
+# Some writers append data after IEND, so the end chunk is looked for in this tail
+PNG_TAIL_BYTES = 64 * 1024
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+PDF_STARTXREF_RE = re.compile(rb'startxref\s+(\d+)')
+PDF_COUNT_RE = re.compile(rb'/Count\s+(\d+)')
+PDF_PREV_RE = re.compile(rb'/Prev\s+(\d+)')
+PDF_ROOT_RE = re.compile(rb'/Root\s+(\d+)\s+\d+\s+R')
+PDF_PAGES_RE = re.compile(rb'/Pages\s+(\d+)\s+\d+\s+R')
+PDF_OBJECT_BYTES = 4096
+PDF_MAX_XREF_SECTIONS = 32
+SVG_TAG_RE = re.compile(r'<svg\b[^>]*>', re.IGNORECASE)
+SVG_SIZE_RE = re.compile(r'\b(width|height)\s*=\s*["\']\s*([\d.]+)\s*(%?)', re.IGNORECASE)
+
+# MPEG audio bitrates (kbps) by (MPEG-1?, layer) and sample rates by version bits
+MP3_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+MP3_SCAN_BYTES = 64 * 1024
+
+
+class ProbeError(Exception):
+    """Raised when an upload is not a file of the type its name claims"""
+    status_code = 415
+
+
+class CorruptFileError(ProbeError):
+    """Raised when a file has the right signature but unreadable headers"""
+    status_code = 422
+
+
+class OverBudgetError(ProbeError):
+    """Raised when a file is valid but too large to convert"""
+    status_code = 413
+
+
+def file_kind(filename):
+    """Name the converter graph format of an upload, or None if nothing converts from it"""
+    if not registry.conversions_from(filename):
+        return None
+    return registry.format_for(filename)
+
+
+def detect_kind(head):
+    """Name the format of a file from its first bytes, or None"""
+    if head.startswith(PNG_SIGNATURE):
+        return 'png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if b'%PDF-' in head[:1024]:
+        return 'pdf'
+    if head[:4] in (b'RIFF', b'RF64') and head[8:12] == b'WAVE':
+        return 'wav'
+    if head[4:8] == b'ftyp':
+        return 'm4a'
+    if head.startswith(b'PK\x03\x04'):
+        return 'word'
+    if head.startswith(b'ID3') or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return 'mp3'
+    if b'<svg' in head[:64 * 1024].lower():
+        return 'svg'
+    return None
+
+
+def sniff(filename, head):
+    """Check the first bytes of an upload against its extension; returns the kind"""
+    expected = file_kind(filename)
+    if expected is None:
+        raise ProbeError('Unsupported file type')
+    if expected not in PROBES:
+        # A format added to the graph without a sniffing rule is taken on its extension
+        return expected
+    actual = detect_kind(head)
+    # MP3 streams may start with junk before the first frame; probe() scans for it
+    if actual != expected and not (expected == 'mp3' and actual is None):
+        raise ProbeError(f"File content does not match its .{filename.rsplit('.', 1)[1].lower()} extension")
+    return expected
+
+
+def probe(path, filename):
+    """Read cheap header metadata for an upload and enforce the budgets
+
+    Only headers are parsed; nothing is decoded. Returns a JSON-safe dict
+    with the kind, size and whatever the format tells cheaply (image
+    dimensions, PDF page count, audio duration).
+    """
+    kind = file_kind(filename)
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        head = f.read(MP3_SCAN_BYTES)
+        sniff(filename, head)
+        try:
+            metadata = PROBES[kind](f, head, size) if kind in PROBES else {}
+        except (struct.error, IndexError, ValueError, zipfile.BadZipFile) as e:
+            raise CorruptFileError(f'Unreadable {kind} file: {e}')
+    metadata = {'kind': kind, 'size': size, **metadata}
+    check_budget(metadata)
+    return metadata
+
+
+def check_budget(metadata):
+    pixels = metadata.get('width', 0) * metadata.get('height', 0)
+    if metadata['kind'] != 'svg' and pixels > IMAGE_MAX_PIXELS:
+        raise OverBudgetError(f'Image has {pixels} pixels, the limit is {IMAGE_MAX_PIXELS}')
+    if (metadata.get('pages') or 0) > PDF_MAX_PAGES:
+        raise OverBudgetError(f"PDF has {metadata['pages']} pages, the limit is {PDF_MAX_PAGES}")
+    if (metadata.get('duration') or 0) > AUDIO_MAX_SECONDS:
+        raise OverBudgetError(f"Audio lasts {metadata['duration']} seconds, the limit is {AUDIO_MAX_SECONDS}")
+
+
+def probe_png(f, head, size):
+    if head[12:16] != b'IHDR':
+        raise CorruptFileError('PNG has no IHDR chunk')
+    width, height = struct.unpack('>II', head[16:24])
+    # A missing IEND chunk means the upload was cut off
+    f.seek(max(0, size - PNG_TAIL_BYTES))
+    if PNG_IEND not in f.read():
+        raise CorruptFileError('PNG is truncated')
+    return {'width': width, 'height': height}
+
+
+def probe_jpeg(f, head, size):
+    offset = 2
+    while True:
+        f.seek(offset)
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            raise CorruptFileError('JPEG has no frame header')
+        if marker[1] == 0xFF:
+            offset += 1  # fill byte
+            continue
+        if marker[1] in (0x01, *range(0xD0, 0xD8)):
+            offset += 2
+            continue
+        if marker[1] in (0xD9, 0xDA):
+            raise CorruptFileError('JPEG has no frame header')
+        (length,) = struct.unpack('>H', f.read(2))
+        if marker[1] in SOF_MARKERS:
+            _, height, width = struct.unpack('>BHH', f.read(5))
+            if not width or not height:
+                raise CorruptFileError('JPEG has no dimensions')
+            return {'width': width, 'height': height}
+        offset += 2 + length
+
+
+def probe_svg(f, head, size):
+    tag = SVG_TAG_RE.search(head.decode('utf-8', 'replace'))
+    if tag is None:
+        raise CorruptFileError('SVG has no <svg> element')
+    # Percentages and missing sizes are left out; they depend on the viewer
+    return {name.lower(): round(float(value)) for name, value, percent in SVG_SIZE_RE.findall(tag.group())
+            if not percent}
+
+
+def _pdf_xref_sections(f, offset):
+    """Yield (subsections, trailer) for the classic xref tables from offset back through /Prev
+
+    Subsections are (first object, count, entries offset). Stops at an xref
+    stream, which needs decompressing and is left to the worker.
+    """
+    for _ in range(PDF_MAX_XREF_SECTIONS):
+        f.seek(offset)
+        if f.readline().strip() != b'xref':
+            return
+        subsections = []
+        while True:
+            line = f.readline()
+            if not line or line.lstrip().startswith(b'trailer'):
+                break
+            if not line.strip():
+                continue
+            first, count = map(int, line.split())
+            subsections.append((first, count, f.tell()))
+            f.seek(f.tell() + 20 * count)  # entries are exactly 20 bytes
+        trailer = line + f.read(PDF_OBJECT_BYTES)
+        yield subsections, trailer
+        previous = PDF_PREV_RE.search(trailer)
+        if previous is None:
+            return
+        offset = int(previous.group(1))
+
+
+def _pdf_object(f, sections, number):
+    """Bytes at the start of an uncompressed object, or None if the tables do not place it"""
+    for subsections, _ in sections:
+        for first, count, entries in subsections:
+            if first <= number < first + count:
+                f.seek(entries + 20 * (number - first))
+                offset, _, state = f.read(20).split()
+                if state != b'n':
+                    return None
+                f.seek(int(offset))
+                return f.read(PDF_OBJECT_BYTES).split(b'endobj')[0]
+    return None
+
+
+def _pdf_page_count(f, size):
+    """Follow trailer, catalog and page tree root to /Count; None when they are compressed"""
+    f.seek(max(0, size - 1024))
+    startxref = PDF_STARTXREF_RE.findall(f.read())
+    if not startxref:
+        return None
+    sections = list(_pdf_xref_sections(f, int(startxref[-1])))
+    if not sections:
+        return None
+    root = PDF_ROOT_RE.search(sections[0][1])
+    catalog = root and _pdf_object(f, sections, int(root.group(1)))
+    pages = catalog and PDF_PAGES_RE.search(catalog)
+    tree = pages and _pdf_object(f, sections, int(pages.group(1)))
+    count = tree and PDF_COUNT_RE.search(tree)
+    return int(count.group(1)) if count else None
+
+
+def probe_pdf(f, head, size):
+    f.seek(max(0, size - 2048))
+    if b'%%EOF' not in f.read():
+        raise CorruptFileError('PDF is truncated')
+    # Only a few seeks and small reads; the worker checks the count again
+    # for PDFs whose page tree sits in object streams
+    try:
+        pages = _pdf_page_count(f, size)
+    except ValueError:
+        pages = None
+    return {'pages': pages}
+
+
+def probe_wav(f, head, size):
+    if head[:4] == b'RF64':
+        return {'duration': None}
+    offset = 12
+    fmt = None
+    while offset + 8 <= size:
+        f.seek(offset)
+        chunk_id, chunk_size = struct.unpack('<4sI', f.read(8))
+        if chunk_id == b'fmt ':
+            audio_format, channels, sample_rate, byte_rate = struct.unpack('<HHII', f.read(12))
+            fmt = {'channels': channels, 'sample_rate': sample_rate, 'byte_rate': byte_rate}
+        elif chunk_id == b'data':
+            if fmt is None or not fmt['byte_rate']:
+                raise CorruptFileError('WAV data comes before its format')
+            available = min(chunk_size, size - offset - 8)
+            return {
+                'duration': round(available / fmt['byte_rate'], 3),
+                'sample_rate': fmt['sample_rate'],
+                'channels': fmt['channels'],
+            }
+        offset += 8 + chunk_size + (chunk_size & 1)
+    raise CorruptFileError('WAV has no audio data')
+
+
+def _mp3_frame(header):
+    """Decode an MPEG audio frame header; None if these bytes are not one"""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 3
+    layer = 4 - ((header[1] >> 1) & 3)
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = MP3_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    padding = (header[2] >> 1) & 1
+    if layer == 1:
+        samples, length = 384, (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if mpeg1 or layer == 2 else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+    return {
+        'mpeg1': mpeg1,
+        'bitrate': bitrate,
+        'sample_rate': sample_rate,
+        'samples': samples,
+        'length': length,
+        'channels': 1 if header[3] >> 6 == 3 else 2,
+    }
+
+
+def probe_mp3(f, head, size):
+    start = 0
+    if head.startswith(b'ID3'):
+        tag_size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        start = 10 + tag_size + (10 if head[5] & 0x10 else 0)
+    f.seek(start)
+    data = f.read(MP3_SCAN_BYTES)
+
+    # Two consecutive valid headers make a false sync in tag data unlikely
+    for offset in range(len(data) - 4):
+        frame = _mp3_frame(data[offset:offset + 4])
+        if frame and _mp3_frame(data[offset + frame['length']:offset + frame['length'] + 4]):
+            break
+    else:
+        raise CorruptFileError('MP3 has no audio frames')
+
+    # A Xing/Info or VBRI header gives the exact frame count of VBR files
+    side_info = (32 if frame['channels'] == 2 else 17) if frame['mpeg1'] else (17 if frame['channels'] == 2 else 9)
+    xing = data[offset + 4 + side_info:offset + 4 + side_info + 12]
+    frames = None
+    if xing[:4] in (b'Xing', b'Info') and struct.unpack('>I', xing[4:8])[0] & 1:
+        frames = struct.unpack('>I', xing[8:12])[0]
+    elif data[offset + 36:offset + 40] == b'VBRI':
+        frames = struct.unpack('>I', data[offset + 50:offset + 54])[0]
+
+    if frames:
+        duration = frames * frame['samples'] / frame['sample_rate']
+    else:
+        audio_bytes = size - start - offset
+        f.seek(max(0, size - 128))
+        if f.read(3) == b'TAG':
+            audio_bytes -= 128
+        duration = audio_bytes * 8 / frame['bitrate']
+    return {
+        'duration': round(duration, 3),
+        'sample_rate': frame['sample_rate'],
+        'channels': frame['channels'],
+    }
+
+
+def _mp4_boxes(f, start, end):
+    """Yield (type, body offset, body end) for the boxes between start and end"""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        box_size, box_type = struct.unpack('>I4s', f.read(8))
+        header = 8
+        if box_size == 1:
+            (box_size,) = struct.unpack('>Q', f.read(8))
+            header = 16
+        elif box_size == 0:
+            box_size = end - offset
+        if box_size < header:
+            raise CorruptFileError('MP4 box has an invalid size')
+        yield box_type, offset + header, min(offset + box_size, end)
+        offset += box_size
+
+
+def probe_m4a(f, head, size):
+    for box_type, body, body_end in _mp4_boxes(f, 0, size):
+        if box_type != b'moov':
+            continue
+        for child_type, child_body, _ in _mp4_boxes(f, body, body_end):
+            if child_type != b'mvhd':
+                continue
+            f.seek(child_body)
+            version = f.read(4)[0]
+            if version == 1:
+                _, _, timescale, duration = struct.unpack('>QQIQ', f.read(28))
+            else:
+                _, _, timescale, duration = struct.unpack('>IIII', f.read(16))
+            if not timescale:
+                raise CorruptFileError('M4A has no timescale')
+            return {'duration': round(duration / timescale, 3)}
+    raise CorruptFileError('M4A has no movie header')
+
+
+def probe_docx(f, head, size):
+    with zipfile.ZipFile(f) as archive:
+        names = set(archive.namelist())
+    if 'word/document.xml' not in names:
+        raise CorruptFileError('DOCX has no document body')
+    return {}
+
+
+PROBES = {
+    'png': probe_png,
+    'jpeg': probe_jpeg,
+    'svg': probe_svg,
+    'pdf': probe_pdf,
+    'wav': probe_wav,
+    'mp3': probe_mp3,
+    'm4a': probe_m4a,
+    'word': probe_docx,
+}
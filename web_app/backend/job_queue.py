@@ -0,0 +1,378 @@
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Each lane gets its own process pool so long document jobs cannot
+# occupy the workers that quick image jobs need
+DEFAULT_LANES = {
+    'document': {'workers': 1, 'max_queued': 8},
+    'audio': {'workers': 2, 'max_queued': 16},
+    'image': {'workers': 2, 'max_queued': 32},
+    # PDF page thumbnails, kept apart so previews never wait behind conversions
+    'preview': {'workers': 1, 'max_queued': 32},
+}
+
+
+class QueueFullError(Exception):
+    """Raised when a lane already holds its maximum number of jobs"""
+
+
+def load_lane_config():
+    """Read lane sizes from JOB_WORKERS_<LANE> / JOB_MAX_QUEUED_<LANE>"""
+    lanes = {}
+    for lane, defaults in DEFAULT_LANES.items():
+        lanes[lane] = {
+            'workers': int(os.environ.get(f'JOB_WORKERS_{lane.upper()}', defaults['workers'])),
+            'max_queued': int(os.environ.get(f'JOB_MAX_QUEUED_{lane.upper()}', defaults['max_queued'])),
+        }
+    return lanes
+
+
+# Seconds between progress messages a worker sends for one job
+PROGRESS_INTERVAL = 0.25
+
+# Set in each worker process: where events go and which job is running
+_events = None
+_current_job_id = None
+_last_progress = 0.0
+
+
+def init_worker(events, initializer, initargs):
+    """Process pool initializer: keep the event queue, then run the caller's initializer"""
+    global _events
+    _events = events
+    if initializer:
+        initializer(*initargs)
+
+
+def report_progress(progress):
+    """Send a progress dict for the job running in this worker to the API process
+
+    Updates are rate limited, except the one that reports completion.
+    """
+    global _last_progress
+    if _events is None or _current_job_id is None:
+        return
+    now = time.monotonic()
+    final = progress.get('total') is not None and progress.get('done') == progress.get('total')
+    if not final and now - _last_progress < PROGRESS_INTERVAL:
+        return
+    _last_progress = now
+    _events.put((_current_job_id, 'progress', progress))
+
+
+def run_job(job_id, func, args, kwargs):
+    """Run a job inside a worker process and record when it actually ran"""
+    global _current_job_id, _last_progress
+    started_at = time.time()
+    _current_job_id, _last_progress = job_id, 0.0
+    if _events is not None:
+        _events.put((job_id, 'started', started_at))
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        _current_job_id = None
+    return {'result': result, 'started_at': started_at, 'finished_at': time.time()}
+
+
+class JobQueue:
+    """Dispatch jobs to per-lane process pools and track their state
+
+    Workers send start and progress events back over a queue. With a state
+    store, every state change is also saved there so that any process
+    sharing the store can answer status requests for the job.
+    """
+
+    def __init__(self, lanes=None, initializer=None, initargs=(), store=None):
+        self.lanes = lanes or load_lane_config()
+        self.initializer = initializer
+        self.initargs = tuple(initargs)
+        self.store = store
+        self._executors = {}
+        self._warmed = set()
+        self._restarts = {lane: 0 for lane in self.lanes}
+        self._active = {lane: 0 for lane in self.lanes}
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._events = multiprocessing.SimpleQueue()
+        self._listener = None
+
+    def _get_executor(self, lane):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='job-events', daemon=True)
+                self._listener.start()
+            if lane not in self._executors:
+                executor = ProcessPoolExecutor(
+                    max_workers=self.lanes[lane]['workers'],
+                    initializer=init_worker,
+                    initargs=(self._events, self.initializer,
+                              (lane,) + self.initargs if self.initializer else ()),
+                )
+                self._executors[lane] = executor
+                if lane in self._warmed:
+                    # A replacement for a crashed pool: start its workers now, as at boot,
+                    # without making the job that triggered the restart wait for them
+                    for _ in range(self.lanes[lane]['workers']):
+                        executor.submit(os.getpid)
+            return self._executors[lane]
+
+    def _discard_executor(self, lane, executor):
+        """Drop a lane's broken pool so the next submit starts a fresh one
+
+        Jobs that were in flight on it fail with BrokenProcessPool on their own.
+        """
+        with self._lock:
+            if self._executors.get(lane) is not executor:
+                return  # already replaced
+            del self._executors[lane]
+            self._restarts[lane] += 1
+        print(f"Worker pool for the {lane} lane broke; starting a new one on the next job")
+        # Never wait here: this can run on the pool's own management thread
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _listen(self):
+        """Apply start and progress events from the workers to the job records"""
+        while True:
+            job_id, event, data = self._events.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                # Events can arrive after the job already finished
+                if job is None or job['status'] not in ('queued', 'running'):
+                    continue
+                if event == 'started':
+                    job['status'] = 'running'
+                    job['started_at'] = data
+                else:
+                    job['progress'] = data
+                self._changed.notify_all()
+            try:
+                self._save(job)
+            except Exception as e:
+                print(f"Job {job_id} could not be saved: {e}")
+
+    def warm(self, lanes=None):
+        """Start every worker of the given lanes now instead of on first job"""
+        for lane in lanes or self.lanes:
+            executor = self._get_executor(lane)
+            with self._lock:
+                self._warmed.add(lane)
+            # Submitting one call per slot makes the pool start all its processes
+            futures = [executor.submit(os.getpid) for _ in range(self.lanes[lane]['workers'])]
+            for future in futures:
+                future.result()
+
+    def submit(self, lane, func, *args, meta=None, on_success=None, on_failure=None, **kwargs):
+        """Queue func(*args, **kwargs) on a lane and return the job record"""
+        if lane not in self.lanes:
+            raise ValueError(f'Unknown job lane: {lane}')
+
+        with self._lock:
+            if self._active[lane] >= self.lanes[lane]['max_queued']:
+                raise QueueFullError(f'The {lane} queue is full, please retry shortly')
+            self._active[lane] += 1
+
+            job_id = str(uuid.uuid4())
+            job = {
+                'job_id': job_id,
+                'lane': lane,
+                'status': 'queued',
+                'created_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'result': None,
+                'error': None,
+                'progress': None,
+                'meta': meta or {},
+            }
+            self._jobs[job_id] = job
+
+        try:
+            self._save(job)
+            executor = self._get_executor(lane)
+            try:
+                future = executor.submit(run_job, job_id, func, args, kwargs)
+            except BrokenProcessPool:
+                # A worker died since the last job; retry once on a new pool
+                self._discard_executor(lane, executor)
+                executor = self._get_executor(lane)
+                future = executor.submit(run_job, job_id, func, args, kwargs)
+        except Exception:
+            with self._lock:
+                self._active[lane] -= 1
+                del self._jobs[job_id]
+            raise
+
+        job['future'] = future
+        future.add_done_callback(lambda f: self._finish(job, f, executor, on_success, on_failure))
+        return self.get(job_id)
+
+    def record_finished(self, lane, result, meta=None):
+        """Register a job that was satisfied without running, e.g. from a cache"""
+        now = time.time()
+        job_id = str(uuid.uuid4())
+        job = {
+            'job_id': job_id,
+            'lane': lane,
+            'status': 'finished',
+            'created_at': now,
+            'started_at': now,
+            'finished_at': now,
+            'result': result,
+            'error': None,
+            'progress': None,
+            'meta': meta or {},
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+        self._save(job)
+        return self.get(job_id)
+
+    def _finish(self, job, future, executor, on_success, on_failure):
+        """Record the outcome of a job once its future completes"""
+        try:
+            try:
+                outcome = future.result()
+            except BrokenProcessPool:
+                self._discard_executor(job['lane'], executor)
+                raise RuntimeError('The worker process running this job crashed')
+            job['started_at'] = outcome['started_at']
+            job['finished_at'] = outcome['finished_at']
+            job['result'] = outcome['result']
+            if on_success:
+                on_success(job)
+            with self._lock:
+                job['status'] = 'finished'
+        except Exception as e:
+            print(f"Job {job['job_id']} failed: {e}")
+            job['finished_at'] = time.time()
+            job['error'] = str(e)
+            with self._lock:
+                job['status'] = 'failed'
+            if on_failure:
+                try:
+                    on_failure(job)
+                except Exception as callback_error:
+                    print(f"Job {job['job_id']} failure callback error: {callback_error}")
+        finally:
+            try:
+                self._save(job)
+            except Exception as e:
+                print(f"Job {job['job_id']} could not be saved: {e}")
+            with self._lock:
+                self._active[job['lane']] -= 1
+                self._changed.notify_all()
+
+    def _save(self, job):
+        if self.store is not None:
+            self.store.save_job({key: value for key, value in job.items() if key != 'future'})
+
+    def has_capacity(self, lane_counts):
+        """Check whether every lane can take the given number of extra jobs"""
+        with self._lock:
+            return all(
+                self._active[lane] + count <= self.lanes[lane]['max_queued']
+                for lane, count in lane_counts.items()
+            )
+
+    def iter_completed(self, job_ids, timeout=None):
+        """Yield job snapshots in the order the jobs finish or fail"""
+        pending = list(job_ids)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while pending:
+            with self._lock:
+                done = [job_id for job_id in pending
+                        if self._jobs.get(job_id, {}).get('status', 'failed') in ('finished', 'failed')]
+                if not done:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError('Timed out waiting for jobs')
+                    self._changed.wait(remaining)
+                    continue
+            for job_id in done:
+                pending.remove(job_id)
+                yield self.get(job_id) or {'job_id': job_id, 'status': 'failed', 'error': 'Job not found'}
+
+    def get(self, job_id):
+        """Return a JSON-safe snapshot of a job, or None if unknown"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            # Submitted through another process sharing the store
+            return self.store.get_job(job_id) if self.store is not None else None
+
+        return {key: value for key, value in job.items() if key != 'future'}
+
+    def watch(self, job_id, heartbeat=15.0, poll_interval=0.5):
+        """Yield a job snapshot each time its status or progress changes
+
+        Yields None after heartbeat seconds without a change, and stops once
+        the job has finished or failed, or if it is unknown. Jobs of other
+        processes are followed by polling the state store.
+        """
+        last_state = None
+        deadline = time.monotonic() + heartbeat
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                return
+            state = (job['status'], job.get('progress'))
+            if state != last_state:
+                last_state = state
+                yield job
+                if job['status'] in ('finished', 'failed'):
+                    return
+                deadline = time.monotonic() + heartbeat
+                continue
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                yield None
+                deadline = time.monotonic() + heartbeat
+            elif job_id in self._jobs:
+                with self._lock:
+                    # Re-check under the lock so a change made since get() is not missed
+                    current = self._jobs.get(job_id)
+                    if current is not None and (current['status'], current.get('progress')) == state:
+                        self._changed.wait(remaining)
+            else:
+                time.sleep(min(poll_interval, remaining))
+
+    def stats(self):
+        """Return active job counts and limits for every lane"""
+        with self._lock:
+            return {
+                lane: {
+                    'active': self._active[lane],
+                    'workers': config['workers'],
+                    'max_queued': config['max_queued'],
+                    'restarts': self._restarts[lane],
+                }
+                for lane, config in self.lanes.items()
+            }
+
+    def prune(self, max_age):
+        """Forget finished or failed jobs older than max_age seconds"""
+        cutoff = time.time() - max_age
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job['status'] in ('finished', 'failed') and (job['finished_at'] or 0) < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if self.store is not None:
+            self.store.delete_jobs(cutoff)
+        return len(expired)
+
+    def shutdown(self, wait=True):
+        """Stop all worker pools"""
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+        for executor in executors:
+            executor.shutdown(wait=wait)
@@ -0,0 +1,171 @@
+import threading
+
+# Latency buckets in seconds, from quick image jobs to long document jobs
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Size buckets in bytes, 1 KB to 1 GB
+BYTES_BUCKETS = tuple(1024 * 4 ** power for power in range(11))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{key}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple((name, labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+
+class Gauge:
+    """Value that can go up and down, with labels"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple((name, labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """Cumulative histogram with labels, in the Prometheus bucket layout"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, label_names=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            entry = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, entry in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, entry):
+                    samples.append((f'{self.name}_bucket', key + (('le', _format_value(float(bound))),), count))
+                samples.append((f'{self.name}_bucket', key + (('le', '+Inf'),), entry[-1]))
+                samples.append((f'{self.name}_sum', key, entry[-2]))
+                samples.append((f'{self.name}_count', key, entry[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    """Holds metrics and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, label_names=()):
+        metric = Counter(name, help_text, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help_text, label_names=()):
+        metric = Gauge(name, help_text, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, label_names=(), buckets=SECONDS_BUCKETS):
+        metric = Histogram(name, help_text, label_names, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    'converter_stage_seconds',
+    'Time spent in each stage of a conversion',
+    ('stage', 'conversion_type'),
+)
+upload_write_seconds = registry.histogram(
+    'converter_upload_write_seconds',
+    'Time spent writing uploaded bytes to disk',
+    ('file_type',),
+)
+download_bytes = registry.histogram(
+    'converter_download_bytes',
+    'Size of downloaded conversion outputs',
+    ('conversion_type',),
+    buckets=BYTES_BUCKETS,
+)
+jobs_total = registry.counter(
+    'converter_jobs_total',
+    'Conversion jobs by outcome',
+    ('conversion_type', 'status'),
+)
+startup_seconds = registry.gauge(
+    'converter_startup_seconds',
+    'Time to import the API process and to warm each worker process',
+    ('process',),
+)
+workers_started = registry.counter(
+    'converter_workers_started_total',
+    'Worker processes that finished preloading their libraries, per job lane',
+    ('lane',),
+)
+uploads_rejected = registry.counter(
+    'converter_uploads_rejected_total',
+    'Uploads rejected by content sniffing and header probes',
+    ('file_type', 'status_code'),
+)
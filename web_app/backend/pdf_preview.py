@@ -0,0 +1,72 @@
+import os
+import tempfile
+
+from converter.pdf_thumbnails import render_thumbnail
+from result_cache import ResultCache
+
+# Thumbnails are scaled to fit a square of this many pixels
+DEFAULT_THUMBNAIL_SIZE = 200
+MIN_THUMBNAIL_SIZE = 32
+MAX_THUMBNAIL_SIZE = 1024
+
+# Job lane whose workers render thumbnails, apart from the conversion lanes
+PREVIEW_LANE = 'preview'
+
+
+class PreviewError(Exception):
+    """Raised when a page preview cannot be rendered"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class PdfPreviews:
+    """Low-resolution page thumbnails, rendered on first request and cached on disk
+
+    Pages are rendered by the preview lane's worker processes, which keep
+    recently used documents open, so untrusted PDFs are never parsed in the
+    API process and a crash there only fails the one request.
+    """
+
+    def __init__(self, store, cache_dir, job_queue, max_bytes, ttl, timeout=30):
+        self.cache = ResultCache(store, cache_dir, max_bytes, ttl, name='previews')
+        self.job_queue = job_queue
+        self.timeout = timeout
+
+    @staticmethod
+    def make_key(file_hash, page, size):
+        """Cache key, and ETag, of one page at one size"""
+        return ResultCache.make_key(file_hash, 'thumbnail', {'page': page, 'size': size})
+
+    def thumbnail(self, file_hash, path, page, size=DEFAULT_THUMBNAIL_SIZE):
+        """Return PNG bytes of a page, rendering and caching it on a miss"""
+        if not MIN_THUMBNAIL_SIZE <= size <= MAX_THUMBNAIL_SIZE:
+            raise PreviewError(f'Size must be between {MIN_THUMBNAIL_SIZE} and {MAX_THUMBNAIL_SIZE} pixels')
+        key = self.make_key(file_hash, page, size)
+        cached_path = self.cache.lookup(key)
+        if cached_path:
+            try:
+                with open(cached_path, 'rb') as f:
+                    return f.read()
+            except OSError:
+                pass  # evicted since the lookup
+
+        # The worker writes into the cache folder so the file can be linked into place
+        fd, render_path = tempfile.mkstemp(prefix='.render-', suffix='.png', dir=self.cache.cache_dir)
+        os.close(fd)
+        try:
+            job = self.job_queue.submit(PREVIEW_LANE, render_thumbnail, path, file_hash, page, size, render_path,
+                                        meta={'preview': True})
+            try:
+                [job] = self.job_queue.iter_completed([job['job_id']], timeout=self.timeout)
+            except TimeoutError:
+                raise PreviewError('Rendering the page timed out', 503)
+            if job['status'] != 'finished':
+                raise PreviewError(f"Could not render page {page}: {job['error']}", 422)
+            with open(render_path, 'rb') as f:
+                data = f.read()
+            self.cache.put(key, render_path)
+            return data
+        finally:
+            os.remove(render_path)
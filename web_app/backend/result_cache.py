@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Hash a file in fixed-size chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(source_path, dest_path):
+    """Hard-link a file where possible, falling back to a copy"""
+    try:
+        os.link(source_path, dest_path)
+    except OSError:
+        shutil.copy2(source_path, dest_path)
+
+
+class ResultCache:
+    """Content-addressed store of conversion outputs with LRU and TTL eviction
+
+    The index of entries, their sizes and last use live in the shared state
+    store, so every process using the same cache name and folder sees the
+    same entries and stays within one byte budget. Only the hit, miss and
+    eviction counters are per process.
+    """
+
+    def __init__(self, store, cache_dir, max_bytes, ttl, name='results'):
+        self.store = store
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_existing()
+
+    @staticmethod
+    def make_key(input_hash, conversion_type, options=None):
+        """Build the cache key for an input hash, conversion type and options"""
+        raw = json.dumps([input_hash, conversion_type, options or {}], sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _load_existing(self):
+        """Index files left in the folder that the store does not know, e.g. after it was reset"""
+        existing = []
+        for filename in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, filename)
+            if os.path.isfile(path) and not filename.endswith('.tmp'):
+                existing.append((os.path.getmtime(path), filename, path))
+
+        for mtime, filename, path in sorted(existing):
+            key = os.path.splitext(filename)[0]
+            if self.store.get_cache_entry(self.name, key) is None:
+                self.store.add_cache_entry(self.name, key, path, os.path.getsize(path), mtime)
+
+        self.evict_expired()
+        self._evict_over_budget()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def lookup(self, key):
+        """Return the path of a cached entry to read in place, or None on a miss
+
+        The file can be evicted at any time, so callers must treat a failed
+        read as a miss.
+        """
+        now = time.time()
+        entry = self.store.get_cache_entry(self.name, key)
+        if entry is None or now - entry['stored_at'] > self.ttl:
+            self._count('misses')
+            return None
+        self.store.touch_cache_entry(self.name, key, now)
+        self._count('hits')
+        return entry['path']
+
+    def get(self, key, dest_path):
+        """Place a cached output at dest_path and return its path, or None on a miss
+
+        The extension of dest_path is replaced by that of the cached output.
+        """
+        cached_path = self.lookup(key)
+        if cached_path is None:
+            return None
+
+        dest_path = os.path.splitext(dest_path)[0] + os.path.splitext(cached_path)[1]
+        try:
+            link_or_copy(cached_path, dest_path)
+            # Linked files share an mtime, so refresh it to keep the output
+            # from looking an hour old to cleanup_old_files
+            os.utime(dest_path)
+        except OSError as e:
+            print(f"Error reading cache entry {key}: {e}")
+            self._remove(key)
+            return None
+        return dest_path
+
+    def put(self, key, source_path):
+        """Store a copy of a finished output under key"""
+        extension = os.path.splitext(source_path)[1]
+        cached_path = os.path.join(self.cache_dir, f"{key}{extension}")
+        tmp_path = f"{cached_path}.tmp"
+
+        try:
+            link_or_copy(source_path, tmp_path)
+            os.replace(tmp_path, cached_path)
+        except OSError as e:
+            print(f"Error caching {source_path}: {e}")
+            return
+        self._add(key, cached_path)
+
+    def put_bytes(self, key, data, extension):
+        """Store data produced in memory under key"""
+        cached_path = os.path.join(self.cache_dir, f"{key}{extension}")
+        tmp_path = f"{cached_path}.tmp"
+
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, cached_path)
+        except OSError as e:
+            print(f"Error caching {key}: {e}")
+            return
+        self._add(key, cached_path)
+
+    def _add(self, key, cached_path):
+        self.store.add_cache_entry(self.name, key, cached_path, os.path.getsize(cached_path), time.time())
+        self._evict_over_budget()
+
+    def _remove(self, key):
+        """Delete an entry; False if another process removed it first"""
+        entry = self.store.delete_cache_entry(self.name, key)
+        if entry is None:
+            return False
+        self._count('evictions')
+        try:
+            os.remove(entry['path'])
+        except OSError:
+            pass
+        return True
+
+    def _evict_over_budget(self, batch=100):
+        """Drop least recently used entries until under max_bytes"""
+        while True:
+            used = self.store.cache_usage(self.name)['bytes']
+            entries = self.store.cache_entries(self.name, limit=batch) if used > self.max_bytes else []
+            if not entries:
+                return
+            for entry in entries:
+                if used <= self.max_bytes:
+                    break
+                if self._remove(entry['key']):
+                    used -= entry['size']
+
+    def evict_expired(self, batch=100):
+        """Remove entries older than the TTL"""
+        cutoff = time.time() - self.ttl
+        removed = 0
+        while True:
+            entries = self.store.cache_entries(self.name, stored_before=cutoff, limit=batch)
+            removed += sum(self._remove(entry['key']) for entry in entries)
+            if len(entries) < batch:
+                return removed
+
+    def stats(self):
+        """Return hit/miss counters and current size"""
+        usage = self.store.cache_usage(self.name)
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': usage['entries'],
+                'bytes': usage['bytes'],
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+            }
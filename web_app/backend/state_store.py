@@ -0,0 +1,376 @@
+import abc
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class StateStore(abc.ABC):
+    """Shared bookkeeping for files, jobs and small values
+
+    Every API process reads and writes through a store, so a request can be
+    served by any process or host that shares it. SQLiteStateStore covers a
+    single host; a networked store (Redis, Postgres, ...) implements the
+    same methods to scale across hosts.
+    """
+
+    # Files: one record per live upload or output
+    @abc.abstractmethod
+    def add_file(self, path, size, owner, kind, created_at, expires_at):
+        """Record a file, keeping the pins of an existing record"""
+
+    @abc.abstractmethod
+    def get_file(self, path):
+        """The record of a file, or None"""
+
+    @abc.abstractmethod
+    def delete_file(self, path):
+        """Remove a record; returns it only to the caller that actually removed it"""
+
+    @abc.abstractmethod
+    def adjust_pins(self, path, delta):
+        """Add delta to a file's pin count, never going below zero"""
+
+    @abc.abstractmethod
+    def set_expiry(self, path, expires_at):
+        """Move a file's expiry time"""
+
+    @abc.abstractmethod
+    def expired_files(self, now, limit=100):
+        """Unpinned records whose expiry has passed, soonest first"""
+
+    @abc.abstractmethod
+    def oldest_files(self, limit=100):
+        """Unpinned records, oldest first"""
+
+    @abc.abstractmethod
+    def files_for_owner(self, owner, kind=None):
+        """Records of a session's files, optionally of one kind"""
+
+    @abc.abstractmethod
+    def usage(self, owner=None):
+        """File count and bytes of one owner, or totals by kind for all"""
+
+    # Jobs: JSON-safe job snapshots
+    @abc.abstractmethod
+    def save_job(self, job):
+        """Insert or replace a job snapshot"""
+
+    @abc.abstractmethod
+    def get_job(self, job_id):
+        """The latest snapshot of a job, or None"""
+
+    @abc.abstractmethod
+    def delete_jobs(self, finished_before):
+        """Remove settled jobs that finished before a time; returns how many"""
+
+    # Small values grouped by namespace, e.g. upload hashes
+    @abc.abstractmethod
+    def set_value(self, namespace, key, value):
+        """Store a JSON-safe value"""
+
+    @abc.abstractmethod
+    def get_value(self, namespace, key, default=None):
+        """A stored value, or default"""
+
+    @abc.abstractmethod
+    def pop_value(self, namespace, key, default=None):
+        """Remove a value; returns it only to the caller that actually removed it"""
+
+    # Cache entries: the index of each result cache, grouped by cache name
+    @abc.abstractmethod
+    def add_cache_entry(self, cache, key, path, size, stored_at):
+        """Insert or replace an entry, marked as used when stored"""
+
+    @abc.abstractmethod
+    def get_cache_entry(self, cache, key):
+        """The record of an entry, or None"""
+
+    @abc.abstractmethod
+    def touch_cache_entry(self, cache, key, used_at):
+        """Mark an entry as used, for least recently used eviction"""
+
+    @abc.abstractmethod
+    def delete_cache_entry(self, cache, key):
+        """Remove an entry; returns it only to the caller that actually removed it"""
+
+    @abc.abstractmethod
+    def cache_entries(self, cache, stored_before=None, limit=100):
+        """Entries least recently used first, optionally only those stored before a time"""
+
+    @abc.abstractmethod
+    def cache_usage(self, cache):
+        """Entry count and bytes of one cache"""
+
+    # Locks: named leases held by one owner until released or expired
+    @abc.abstractmethod
+    def acquire_lock(self, name, owner, expires_at, now):
+        """Take a lock unless another owner holds an unexpired lease; returns whether it was taken"""
+
+    @abc.abstractmethod
+    def release_lock(self, name, owner):
+        """Release a lock if owner still holds it"""
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    owner TEXT,
+    kind TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    pins INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS files_expires_at ON files (expires_at);
+CREATE INDEX IF NOT EXISTS files_created_at ON files (created_at);
+CREATE INDEX IF NOT EXISTS files_owner ON files (owner);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    finished_at REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at);
+CREATE TABLE IF NOT EXISTS kv (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE TABLE IF NOT EXISTS cache_entries (
+    cache TEXT NOT NULL,
+    key TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (cache, key)
+);
+CREATE INDEX IF NOT EXISTS cache_entries_used_at ON cache_entries (cache, used_at);
+CREATE INDEX IF NOT EXISTS cache_entries_stored_at ON cache_entries (cache, stored_at);
+CREATE TABLE IF NOT EXISTS locks (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+'''
+
+FILE_COLUMNS = ('path', 'size', 'owner', 'kind', 'created_at', 'expires_at', 'pins')
+CACHE_COLUMNS = ('key', 'path', 'size', 'stored_at', 'used_at')
+
+
+class SQLiteStateStore(StateStore):
+    """State store in one SQLite database, shared by every process on a host
+
+    Each thread gets its own connection. WAL mode lets readers proceed
+    while another process writes.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(SCHEMA)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        # A forked child must not reuse its parent's connection
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _execute(self, sql, params=()):
+        return self._connection().execute(sql, params)
+
+    @contextmanager
+    def _transaction(self):
+        """Take the write lock up front so read-then-write steps are atomic across processes"""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    @staticmethod
+    def _file_record(row):
+        return dict(zip(FILE_COLUMNS, row)) if row else None
+
+    def add_file(self, path, size, owner, kind, created_at, expires_at):
+        self._execute(
+            'INSERT OR REPLACE INTO files (path, size, owner, kind, created_at, expires_at, pins) '
+            'VALUES (?, ?, ?, ?, ?, ?, COALESCE((SELECT pins FROM files WHERE path = ?), 0))',
+            (path, size, owner, kind, created_at, expires_at, path),
+        )
+
+    def get_file(self, path):
+        row = self._execute(f'SELECT {", ".join(FILE_COLUMNS)} FROM files WHERE path = ?', (path,)).fetchone()
+        return self._file_record(row)
+
+    def delete_file(self, path):
+        with self._transaction() as connection:
+            row = connection.execute(
+                f'SELECT {", ".join(FILE_COLUMNS)} FROM files WHERE path = ?', (path,)
+            ).fetchone()
+            if row:
+                connection.execute('DELETE FROM files WHERE path = ?', (path,))
+        return self._file_record(row)
+
+    def adjust_pins(self, path, delta):
+        self._execute('UPDATE files SET pins = MAX(0, pins + ?) WHERE path = ?', (delta, path))
+
+    def set_expiry(self, path, expires_at):
+        self._execute('UPDATE files SET expires_at = ? WHERE path = ?', (expires_at, path))
+
+    def expired_files(self, now, limit=100):
+        rows = self._execute(
+            f'SELECT {", ".join(FILE_COLUMNS)} FROM files WHERE expires_at <= ? AND pins = 0 '
+            'ORDER BY expires_at LIMIT ?',
+            (now, limit),
+        ).fetchall()
+        return [self._file_record(row) for row in rows]
+
+    def oldest_files(self, limit=100):
+        rows = self._execute(
+            f'SELECT {", ".join(FILE_COLUMNS)} FROM files WHERE pins = 0 ORDER BY created_at LIMIT ?',
+            (limit,),
+        ).fetchall()
+        return [self._file_record(row) for row in rows]
+
+    def files_for_owner(self, owner, kind=None):
+        sql = f'SELECT {", ".join(FILE_COLUMNS)} FROM files WHERE owner = ?'
+        params = (owner,)
+        if kind is not None:
+            sql += ' AND kind = ?'
+            params += (kind,)
+        return [self._file_record(row) for row in self._execute(sql, params).fetchall()]
+
+    def usage(self, owner=None):
+        if owner is not None:
+            files, used = self._execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files WHERE owner = ?', (owner,)
+            ).fetchone()
+            return {'files': files, 'used_bytes': used}
+
+        by_kind = {
+            kind: {'files': files, 'bytes': used}
+            for kind, files, used in self._execute(
+                'SELECT kind, COUNT(*), SUM(size) FROM files GROUP BY kind'
+            ).fetchall()
+        }
+        sessions = self._execute('SELECT COUNT(DISTINCT owner) FROM files').fetchone()[0]
+        return {
+            'files': sum(totals['files'] for totals in by_kind.values()),
+            'used_bytes': sum(totals['bytes'] for totals in by_kind.values()),
+            'sessions': sessions,
+            'by_kind': by_kind,
+        }
+
+    def save_job(self, job):
+        self._execute(
+            'INSERT OR REPLACE INTO jobs (job_id, status, finished_at, data) VALUES (?, ?, ?, ?)',
+            (job['job_id'], job['status'], job.get('finished_at'), json.dumps(job)),
+        )
+
+    def get_job(self, job_id):
+        row = self._execute('SELECT data FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete_jobs(self, finished_before):
+        cursor = self._execute(
+            "DELETE FROM jobs WHERE status IN ('finished', 'failed') AND finished_at < ?", (finished_before,)
+        )
+        return cursor.rowcount
+
+    def set_value(self, namespace, key, value):
+        self._execute(
+            'INSERT OR REPLACE INTO kv (namespace, key, value) VALUES (?, ?, ?)',
+            (namespace, key, json.dumps(value)),
+        )
+
+    def get_value(self, namespace, key, default=None):
+        row = self._execute('SELECT value FROM kv WHERE namespace = ? AND key = ?', (namespace, key)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def pop_value(self, namespace, key, default=None):
+        with self._transaction() as connection:
+            row = connection.execute(
+                'SELECT value FROM kv WHERE namespace = ? AND key = ?', (namespace, key)
+            ).fetchone()
+            if row:
+                connection.execute('DELETE FROM kv WHERE namespace = ? AND key = ?', (namespace, key))
+        return json.loads(row[0]) if row else default
+
+
+    @staticmethod
+    def _cache_record(row):
+        return dict(zip(CACHE_COLUMNS, row)) if row else None
+
+    def add_cache_entry(self, cache, key, path, size, stored_at):
+        self._execute(
+            'INSERT OR REPLACE INTO cache_entries (cache, key, path, size, stored_at, used_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (cache, key, path, size, stored_at, stored_at),
+        )
+
+    def get_cache_entry(self, cache, key):
+        row = self._execute(
+            f'SELECT {", ".join(CACHE_COLUMNS)} FROM cache_entries WHERE cache = ? AND key = ?', (cache, key)
+        ).fetchone()
+        return self._cache_record(row)
+
+    def touch_cache_entry(self, cache, key, used_at):
+        self._execute('UPDATE cache_entries SET used_at = ? WHERE cache = ? AND key = ?', (used_at, cache, key))
+
+    def delete_cache_entry(self, cache, key):
+        with self._transaction() as connection:
+            row = connection.execute(
+                f'SELECT {", ".join(CACHE_COLUMNS)} FROM cache_entries WHERE cache = ? AND key = ?', (cache, key)
+            ).fetchone()
+            if row:
+                connection.execute('DELETE FROM cache_entries WHERE cache = ? AND key = ?', (cache, key))
+        return self._cache_record(row)
+
+    def cache_entries(self, cache, stored_before=None, limit=100):
+        sql = f'SELECT {", ".join(CACHE_COLUMNS)} FROM cache_entries WHERE cache = ?'
+        params = (cache,)
+        if stored_before is not None:
+            sql += ' AND stored_at < ?'
+            params += (stored_before,)
+        rows = self._execute(sql + ' ORDER BY used_at LIMIT ?', params + (limit,)).fetchall()
+        return [self._cache_record(row) for row in rows]
+
+    def cache_usage(self, cache):
+        entries, used = self._execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE cache = ?', (cache,)
+        ).fetchone()
+        return {'entries': entries, 'bytes': used}
+
+    def acquire_lock(self, name, owner, expires_at, now):
+        with self._transaction() as connection:
+            connection.execute('DELETE FROM locks WHERE name = ? AND expires_at <= ?', (name, now))
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO locks (name, owner, expires_at) VALUES (?, ?, ?)', (name, owner, expires_at)
+            )
+        return cursor.rowcount == 1
+
+    def release_lock(self, name, owner):
+        self._execute('DELETE FROM locks WHERE name = ? AND owner = ?', (name, owner))
+
+
+def open_state_store(url=None):
+    """Create the store named by STATE_STORE_URL (default: sqlite:///state.db)"""
+    url = url or os.environ.get('STATE_STORE_URL', 'sqlite:///state.db')
+    if url.startswith('sqlite:///'):
+        return SQLiteStateStore(url[len('sqlite:///'):])
+    raise ValueError(f'Unsupported state store: {url}')
@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+
+
+class StorageFullError(Exception):
+    """Raised when the byte quota cannot be met without deleting files in use"""
+
+
+class StorageManager:
+    """Index of uploaded and converted files with expiry and a byte quota
+
+    Every live file is recorded in the shared state store with its size,
+    owning session and expiry time. Sweeps ask the store for files whose
+    expiry has passed, so they only touch expired files. Registering a file
+    that pushes usage over the quota evicts the oldest unpinned files first.
+    Pinned files (inputs of running jobs, downloads in progress) are never
+    evicted. Because the index lives in the store, any process sharing it
+    can clean up after any other.
+    """
+
+    def __init__(self, store, quota_bytes, ttl, on_remove=None):
+        self.store = store
+        self.quota_bytes = quota_bytes
+        self.ttl = ttl
+        self.on_remove = on_remove
+        self.evictions = {'expired': 0, 'quota': 0}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def register(self, path, owner=None, kind='upload', ttl=None, created_at=None):
+        """Index a file that now exists on disk, then enforce the quota"""
+        size = os.path.getsize(path)
+        created_at = time.time() if created_at is None else created_at
+        expires_at = created_at + (self.ttl if ttl is None else ttl)
+        self.store.add_file(path, size, owner, kind, created_at, expires_at)
+        if not self._make_room(0, keep=path):
+            raise StorageFullError('Storage is full, please retry shortly')
+
+    def ensure_space(self, nbytes):
+        """Evict the oldest unpinned files until nbytes more would fit the quota"""
+        if nbytes > self.quota_bytes:
+            raise StorageFullError('File is larger than the storage quota')
+        if not self._make_room(nbytes):
+            raise StorageFullError('Storage is full, please retry shortly')
+
+    def owner_of(self, path):
+        record = self.store.get_file(path)
+        return record['owner'] if record else None
+
+    def pin(self, path):
+        """Protect a file from eviction until unpin() is called"""
+        self.store.adjust_pins(path, 1)
+
+    def unpin(self, path):
+        self.store.adjust_pins(path, -1)
+
+    def expire_in(self, path, seconds):
+        """Reschedule a file's deletion for seconds from now"""
+        self.store.set_expiry(path, time.time() + seconds)
+
+    def remove(self, path):
+        """Delete a file and drop it from the index"""
+        self.store.delete_file(path)
+        self._delete([path])
+
+    def remove_owner(self, owner, kind=None):
+        """Delete a session's files, optionally of one kind; returns how many were deleted"""
+        paths = [record['path'] for record in self.store.files_for_owner(owner, kind)
+                 if self.store.delete_file(record['path'])]
+        return self._delete(paths)
+
+    def evict_expired(self, now=None, batch=100):
+        """Delete files whose expiry has passed, touching only those files"""
+        now = time.time() if now is None else now
+        deleted = 0
+        while True:
+            records = self.store.expired_files(now, batch)
+            # Another process may have claimed some of them first
+            claimed = [record['path'] for record in records if self.store.delete_file(record['path'])]
+            deleted += self._delete(claimed)
+            with self._lock:
+                self.evictions['expired'] += len(claimed)
+            if len(records) < batch:
+                return deleted
+
+    def scan(self, directory, kind):
+        """Adopt files left in a directory by a previous run, expiring by mtime"""
+        if not os.path.isdir(directory):
+            return
+        for entry in os.scandir(directory):
+            if entry.is_file() and self.store.get_file(entry.path) is None:
+                try:
+                    self.register(entry.path, kind=kind, created_at=entry.stat().st_mtime)
+                except (OSError, StorageFullError):
+                    pass
+
+    def usage(self, owner=None):
+        """Report bytes and file counts, overall or for one session"""
+        usage = self.store.usage(owner)
+        if owner is None:
+            with self._lock:
+                usage.update({
+                    'quota_bytes': self.quota_bytes,
+                    'ttl_seconds': self.ttl,
+                    'evictions': dict(self.evictions),
+                })
+        return usage
+
+    def start(self, interval, sweep=None):
+        """Call sweep (default: evict_expired) every interval seconds in the background"""
+        sweep = sweep or self.evict_expired
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    sweep()
+                except Exception as e:
+                    print(f"Storage sweep error: {e}")
+
+        thread = threading.Thread(target=run, name='storage-sweeper', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    def _make_room(self, extra, keep=None, batch=50):
+        """Evict the oldest unpinned files until usage plus extra fits; False if it cannot"""
+        while True:
+            used = self.store.usage()['used_bytes']
+            if used + extra <= self.quota_bytes:
+                return True
+            candidates = [record for record in self.store.oldest_files(batch) if record['path'] != keep]
+            if not candidates:
+                return False
+            for record in candidates:
+                if used + extra <= self.quota_bytes:
+                    break
+                if self.store.delete_file(record['path']):
+                    used -= record['size']
+                    self._delete([record['path']])
+                    with self._lock:
+                        self.evictions['quota'] += 1
+
+    def _delete(self, paths):
+        deleted = 0
+        for path in paths:
+            try:
+                os.remove(path)
+                deleted += 1
+                print(f"Storage removed: {path}")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error deleting {path}: {e}")
+            if self.on_remove:
+                self.on_remove(path)
+        return deleted
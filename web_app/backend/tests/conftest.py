@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+# Tests import the backend modules the way app.py does, from web_app/backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """The Flask app, importable once per session, with all its folders in a temp directory"""
+    root = tmp_path_factory.mktemp('app')
+    previous = os.getcwd()
+    os.chdir(root)
+    os.environ.update({
+        'UPLOAD_FOLDER': str(root / 'uploads'),
+        'OUTPUT_FOLDER': str(root / 'outputs'),
+        'STATE_STORE_URL': f"sqlite:///{root / 'state.db'}",
+        'WARM_WORKERS': '0',
+    })
+    import app
+    yield app
+    app.job_queue.shutdown(wait=False)
+    os.chdir(previous)
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def upload(client):
+    """Upload a file through the API and return its unique filename"""
+    def upload(path, filename=None):
+        with open(path, 'rb') as f:
+            response = client.post('/api/upload', data={'file': (f, filename or os.path.basename(path))},
+                                   content_type='multipart/form-data')
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()['unique_filename']
+    return upload
@@ -0,0 +1,162 @@
+import io
+import json
+import os
+import time
+
+import pytest
+from PIL import Image
+
+
+@pytest.fixture
+def png(tmp_path):
+    path = tmp_path / 'photo.png'
+    Image.new('RGB', (32, 24), (10, 120, 200)).save(path)
+    return path
+
+
+@pytest.fixture
+def no_submit(app_module, monkeypatch):
+    """Fail the test if anything reaches the job queue"""
+    def submit(*args, **kwargs):
+        raise AssertionError('a job was queued')
+    monkeypatch.setattr(app_module.job_queue, 'submit', submit)
+
+
+def wait_finished(client, job):
+    for _ in range(300):
+        job = client.get(job['status_url']).get_json()
+        if job['status'] in ('finished', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError('job did not finish')
+
+
+def test_options_reach_the_converter(client, upload, png):
+    job = client.post('/api/convert', json={'unique_filename': upload(png), 'conversion_type': 'png_to_webp',
+                                            'options': {'max_width': 16, 'quality': 50, 'colour': 'blue'}})
+    assert job.status_code == 202
+    job = wait_finished(client, job.get_json())
+    assert job['status'] == 'finished'
+    assert job['output_filename'].endswith('.webp')
+
+    with Image.open(io.BytesIO(client.get(job['download_url']).data)) as image:
+        assert image.format == 'WEBP'
+        assert image.size == (16, 12)
+
+
+def test_invalid_option_value_fails_the_job(client, upload, png):
+    job = client.post('/api/convert', json={'unique_filename': upload(png), 'conversion_type': 'png_to_jpeg',
+                                            'options': {'quality': 500}}).get_json()
+    job = wait_finished(client, job)
+    assert job['status'] == 'failed'
+    assert 'Quality' in job['error']
+
+
+def read_events(response):
+    """Parse a server-sent event stream into (event, data) pairs"""
+    events = []
+    for block in response.get_data(as_text=True).split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if fields:
+            events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def test_events_stream_progress_until_the_job_settles(client, upload, png):
+    job = client.post('/api/convert', json={'unique_filename': upload(png), 'conversion_type': 'png_to_jpeg',
+                                            'options': {'quality': 61}}).get_json()
+    response = client.get(job['events_url'])
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    events = read_events(response)
+    assert [event for event, _ in events[:-1]] == ['progress'] * (len(events) - 1)
+    event, data = events[-1]
+    assert event == 'finished'
+    assert data['job_id'] == job['job_id']
+    assert data['download_url'].endswith('.jpg')
+
+    assert client.get('/api/jobs/unknown/events').status_code == 404
+
+
+def test_interrupted_download_resumes_with_range(client, upload, png):
+    job = client.post('/api/convert', json={'unique_filename': upload(png), 'conversion_type': 'png_to_jpeg'}).get_json()
+    download_url = wait_finished(client, job)['download_url']
+    whole = client.get(download_url)
+    assert whole.status_code == 200
+    etag = whole.headers['ETag']
+    size = len(whole.data)
+
+    part = client.get(download_url, headers={'Range': 'bytes=10-', 'If-Range': etag})
+    assert part.status_code == 206
+    assert part.headers['Content-Range'] == f'bytes 10-{size - 1}/{size}'
+    assert whole.data[:10] + part.data == whole.data
+
+    # A stale validator gets the whole file again instead of a mismatched tail
+    assert client.get(download_url, headers={'Range': 'bytes=10-', 'If-Range': '"stale"'}).status_code == 200
+    assert client.get(download_url, headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_batch_with_mismatched_item_queues_nothing(client, upload, png, no_submit):
+    first = upload(png)
+    second = upload(png)
+    response = client.post('/api/convert-batch', json={'items': [
+        {'unique_filename': first, 'conversion_type': 'png_to_jpeg'},
+        {'unique_filename': second, 'conversion_type': 'mp3_to_wav'},
+    ]})
+    assert response.status_code == 400
+    assert 'Item 1' in response.get_json()['error']
+
+
+@pytest.mark.parametrize('items', [
+    ['not an object'],
+    [{'unique_filename': 'x', 'conversion_type': 'png_to_jpeg', 'options': 'fast'}],
+    'not a list',
+])
+def test_batch_rejects_malformed_items(client, upload, png, no_submit, items):
+    if isinstance(items, list) and isinstance(items[0], dict):
+        items[0]['unique_filename'] = upload(png)
+    response = client.post('/api/convert-batch', json={'items': items})
+    assert response.status_code == 400
+
+
+def test_convert_rejects_non_object_body(client):
+    assert client.post('/api/convert', json=['png_to_jpeg']).status_code == 400
+
+
+def test_unknown_options_do_not_split_the_result_cache(client, upload, png):
+    unique_filename = upload(png)
+    first = client.post('/api/convert', json={'unique_filename': unique_filename, 'conversion_type': 'png_to_jpeg',
+                                              'options': {'quality': 70}}).get_json()
+    assert wait_finished(client, first)['status'] == 'finished'
+
+    again = client.post('/api/convert', json={'unique_filename': unique_filename, 'conversion_type': 'png_to_jpeg',
+                                              'options': {'quality': 70, 'colour': 'blue', 'pages': 'all'}})
+    assert again.status_code == 200
+    assert again.get_json()['cached'] is True
+
+
+def test_zip_download_unpins_outputs_when_the_client_disconnects(app_module, client, upload, png, monkeypatch):
+    # Keep the files around after the response so their pin counts can be read
+    monkeypatch.setattr(app_module.storage, 'remove', lambda path: None)
+    jobs = [client.post('/api/convert', json={'unique_filename': upload(png), 'conversion_type': conversion_type})
+            .get_json() for conversion_type in ('png_to_jpeg', 'png_to_webp')]
+    filenames = [wait_finished(client, job)['output_filename'] for job in jobs]
+    paths = [app_module.outputs.path(filename) for filename in filenames]
+
+    response = client.post('/api/download-zip', json={'filenames': filenames}, buffered=False)
+    next(response.response)
+    assert [app_module.state_store.get_file(path)['pins'] for path in paths] == [1, 1]
+    response.close()
+    assert [app_module.state_store.get_file(path)['pins'] for path in paths] == [0, 0]
+
+
+def test_batch_zip_unpins_each_output_after_adding_it(app_module, client, upload, png, monkeypatch):
+    unpinned = []
+    monkeypatch.setattr(app_module.storage, 'unpin', unpinned.append)
+    response = client.post('/api/convert-batch', json={'items': [
+        {'unique_filename': upload(png), 'conversion_type': 'png_to_jpeg'},
+        {'unique_filename': upload(png), 'conversion_type': 'png_to_webp'},
+    ]})
+    assert response.status_code == 200 and response.data
+    assert sorted(os.path.splitext(path)[1] for path in unpinned) == ['.jpg', '.webp']
@@ -0,0 +1,163 @@
+import json
+import math
+import os
+import struct
+import subprocess
+import wave
+
+import numpy as np
+import pytest
+
+from converter import audio_converter
+from converter.audio_analysis import AudioAnalyzer, k_weighting_filter
+from converter.instrumentation import ANALYSIS_SUFFIX
+from converter.registry import conversion_plans
+
+
+def write_tone(path, seconds=1.0, sample_rate=44100, channels=2, frequency=1000, amplitude=0.5):
+    """Write a 16-bit sine tone as a WAV file"""
+    frames = bytearray()
+    for index in range(int(seconds * sample_rate)):
+        sample = int(amplitude * 32767 * math.sin(2 * math.pi * frequency * index / sample_rate))
+        frames += struct.pack('<h', sample) * channels
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(bytes(frames))
+    return str(path)
+
+
+def wav_format(path):
+    with wave.open(str(path), 'rb') as f:
+        return f.getframerate(), f.getnchannels(), f.getnframes() / f.getframerate()
+
+
+@pytest.fixture
+def tone(tmp_path):
+    return write_tone(tmp_path / 'tone.wav')
+
+
+def test_ffmpeg_applies_encoder_options(tone, tmp_path):
+    output_path = conversion_plans()['wav_to_mp3'](tone, bitrate='96k', sample_rate=22050, channels=1,
+                                                   engine='ffmpeg')
+    assert output_path.endswith('.mp3')
+
+    # Decode the MP3 again to check what ffmpeg wrote
+    decoded = tmp_path / 'decoded.wav'
+    subprocess.run([audio_converter.find_ffmpeg(), '-loglevel', 'error', '-i', output_path, str(decoded)], check=True)
+    sample_rate, channels, seconds = wav_format(decoded)
+    assert (sample_rate, channels) == (22050, 1)
+    assert seconds == pytest.approx(1.0, abs=0.1)
+
+
+def test_auto_falls_back_to_pydub_when_ffmpeg_fails(tone, tmp_path, monkeypatch):
+    def broken_ffmpeg(*args, **kwargs):
+        raise RuntimeError('ffmpeg failed')
+    monkeypatch.setattr(audio_converter, 'transcode_with_ffmpeg', broken_ffmpeg)
+
+    output_path = audio_converter.convert_audio(tone, str(tmp_path / 'mono.wav'), 'wav', 'wav',
+                                                sample_rate=8000, channels=1)
+    assert wav_format(output_path)[:2] == (8000, 1)
+
+
+def test_pydub_engine_skips_ffmpeg(tone, tmp_path, monkeypatch):
+    def unexpected(*args, **kwargs):
+        raise AssertionError('ffmpeg was used')
+    monkeypatch.setattr(audio_converter, 'transcode_with_ffmpeg', unexpected)
+    output_path = audio_converter.convert_audio(tone, str(tmp_path / 'copy.wav'), 'wav', 'wav', engine='pydub')
+    assert wav_format(output_path)[:2] == (44100, 2)
+
+
+def test_ffmpeg_engine_raises_with_the_ffmpeg_error(tmp_path):
+    broken = tmp_path / 'broken.wav'
+    broken.write_bytes(b'RIFF\x00\x00\x00\x00WAVEnot audio at all')
+    with pytest.raises(RuntimeError, match='ffmpeg failed: .*[Ii]nvalid data'):
+        audio_converter.convert_audio(str(broken), str(tmp_path / 'out.mp3'), 'mp3', 'wav', engine='ffmpeg')
+
+
+def test_auto_reports_both_errors_when_the_fallback_fails_too(tmp_path):
+    broken = tmp_path / 'broken.wav'
+    broken.write_bytes(b'RIFF\x00\x00\x00\x00WAVEnot audio at all')
+    with pytest.raises(RuntimeError, match='ffmpeg failed: .*; the pydub fallback failed too'):
+        audio_converter.convert_audio(str(broken), str(tmp_path / 'out.mp3'), 'mp3', 'wav')
+
+
+@pytest.mark.parametrize('options', [{'bitrate': '192'}, {'sample_rate': 4000}, {'channels': 6},
+                                     {'engine': 'sox'}])
+def test_rejects_bad_options(tone, tmp_path, options):
+    with pytest.raises(ValueError):
+        audio_converter.convert_audio(tone, str(tmp_path / 'out.mp3'), 'mp3', 'wav', **options)
+
+
+def read_analysis(output_path):
+    with open(output_path + ANALYSIS_SUFFIX) as f:
+        return json.load(f)
+
+
+def test_analysis_of_a_known_tone(tmp_path):
+    # A 1 kHz sine at half scale on both channels: -6.02 dBFS peak, -9.03 dBFS RMS,
+    # and -6.02 LUFS (a full-scale 1 kHz sine in one channel reads -3.01 LUFS)
+    tone = write_tone(tmp_path / 'tone.wav', seconds=3)
+    output_path = audio_converter.convert_audio(tone, str(tmp_path / 'tone.mp3'), 'mp3', 'wav',
+                                                engine='ffmpeg', analyze=True, peaks=30)
+    analysis = read_analysis(output_path)
+    assert analysis['duration'] == pytest.approx(3.0, abs=0.01)
+    assert (analysis['sample_rate'], analysis['channels']) == (44100, 2)
+    assert analysis['peak_dbfs'] == pytest.approx(-6.02, abs=0.05)
+    assert analysis['rms_dbfs'] == pytest.approx(-9.03, abs=0.05)
+    assert analysis['loudness_lufs'] == pytest.approx(-6.02, abs=0.05)
+    assert analysis['clipped_samples'] == 0
+    assert len(analysis['peaks']) == 30
+    assert all(peak == pytest.approx(0.5, abs=0.01) for peak in analysis['peaks'])
+
+
+def test_k_weighting_matches_the_reference_coefficients_at_48k():
+    # BS.1770-4 table 1 (shelf) and table 2 (high pass)
+    shelf, highpass = [dict(pair.split('=') for pair in biquad[len('biquad='):].split(':'))
+                       for biquad in k_weighting_filter(48000).split(',')]
+    reference = {'b0': 1.53512485958697, 'b1': -2.69169618940638, 'b2': 1.19839281085285,
+                 'a1': -1.69065929318241, 'a2': 0.73248077421585}
+    assert {key: float(shelf[key]) for key in reference} == pytest.approx(reference, abs=1e-9)
+    assert {key: float(highpass[key]) for key in ('b0', 'b1', 'b2', 'a1', 'a2')} == pytest.approx(
+        {'b0': 1.0, 'b1': -2.0, 'b2': 1.0, 'a1': -1.99004745483398, 'a2': 0.99007225036621}, abs=1e-9)
+
+
+def test_analysis_follows_the_encoder_options(tmp_path):
+    tone = write_tone(tmp_path / 'tone.wav', seconds=1)
+    output_path = audio_converter.convert_audio(tone, str(tmp_path / 'mono.wav'), 'wav', 'wav',
+                                                sample_rate=16000, channels=1, engine='ffmpeg', analyze=True)
+    analysis = read_analysis(output_path)
+    assert (analysis['sample_rate'], analysis['channels']) == (16000, 1)
+    assert analysis['duration'] == pytest.approx(1.0, abs=0.01)
+
+
+def test_pydub_fallback_reports_levels_without_loudness(tone, tmp_path):
+    output_path = audio_converter.convert_audio(tone, str(tmp_path / 'copy.wav'), 'wav', 'wav',
+                                                engine='pydub', analyze=True, peaks=10)
+    analysis = read_analysis(output_path)
+    assert analysis['loudness_lufs'] is None
+    assert analysis['peak_dbfs'] == pytest.approx(-6.02, abs=0.05)
+    assert len(analysis['peaks']) == 10
+
+
+def test_analyzer_accepts_chunks_of_any_length():
+    frames = np.zeros((1000, 2), dtype='<f4')
+    frames[250, 0] = 1.0
+    frames[900, 1] = -0.25
+    analyzer = AudioAnalyzer(1000, 2, peaks=4, expected_frames=1000, weighted=False)
+    data = frames.tobytes()
+    for start in range(0, len(data), 333):
+        analyzer.feed_bytes(data[start:start + 333])
+
+    result = analyzer.result()
+    assert analyzer.frames == 1000
+    assert result['peaks'] == [0.0, 1.0, 0.0, 0.25]
+    assert result['clipped_samples'] == 1
+    assert result['peak_dbfs'] == 0.0
+    assert result['loudness_lufs'] is None
+
+
+def test_analysis_is_off_by_default(tone, tmp_path):
+    output_path = audio_converter.convert_audio(tone, str(tmp_path / 'plain.wav'), 'wav', 'wav')
+    assert not os.path.exists(output_path + ANALYSIS_SUFFIX)
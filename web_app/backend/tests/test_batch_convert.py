@@ -0,0 +1,40 @@
+import json
+import os
+
+from PIL import Image
+
+import batch_convert
+
+
+def run(tmp_path, *extra):
+    summary_path = tmp_path / 'summary.json'
+    status = batch_convert.main([str(tmp_path / 'in'), '--to', 'jpg', '--output-dir', str(tmp_path / 'out'),
+                                 '--workers', '1', '--summary-json', str(summary_path), *extra])
+    return status, json.loads(summary_path.read_text())
+
+
+def test_second_run_converts_only_what_changed(tmp_path):
+    (tmp_path / 'in' / 'nested').mkdir(parents=True)
+    Image.new('RGB', (16, 16), (0, 0, 255)).save(tmp_path / 'in' / 'a.png')
+    Image.new('RGB', (16, 16), (0, 255, 0)).save(tmp_path / 'in' / 'nested' / 'b.png')
+    (tmp_path / 'in' / 'broken.png').write_bytes(b'not a png')
+
+    status, summary = run(tmp_path)
+    assert status == 1
+    assert (summary['converted'], summary['failed']) == (2, 1)
+    # No staging directory is left behind, not even by the failed conversion
+    assert set(os.listdir(tmp_path / 'out')) == {'a.jpg', 'nested', batch_convert.MANIFEST_NAME}
+    assert os.listdir(tmp_path / 'out' / 'nested') == ['b.jpg']
+
+    # Touched but identical: hashed, not converted; rewritten: converted again
+    os.utime(tmp_path / 'in' / 'a.png', ns=(0, 0))
+    Image.new('RGB', (16, 16), (255, 0, 0)).save(tmp_path / 'in' / 'nested' / 'b.png')
+    (tmp_path / 'in' / 'broken.png').unlink()
+    status, summary = run(tmp_path)
+    assert status == 0
+    assert (summary['converted'], summary['unchanged'], summary['skipped']) == (1, 1, 0)
+
+    status, summary = run(tmp_path)
+    assert (summary['converted'], summary['skipped']) == (0, 2)
+    status, summary = run(tmp_path, '--force')
+    assert summary['converted'] == 2
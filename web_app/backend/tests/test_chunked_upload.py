@@ -0,0 +1,100 @@
+import hashlib
+import io
+import os
+import time
+
+import pytest
+from PIL import Image
+
+from chunked_upload import ChunkedUploadManager, OffsetMismatch, UploadError, parse_content_range
+from state_store import open_state_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    return open_state_store(f"sqlite:///{tmp_path / 'state.db'}")
+
+
+@pytest.fixture
+def manager(store, tmp_path):
+    return ChunkedUploadManager(store, str(tmp_path), max_size=1000)
+
+
+def put(manager, upload_id, data, start, total):
+    return manager.write_chunk(upload_id, f'bytes {start}-{start + len(data) - 1}/{total}', io.BytesIO(data))
+
+
+def test_chunks_are_joined_and_hashed(manager, tmp_path):
+    data = os.urandom(300)
+    state = manager.create('song.mp3', len(data), 'session')
+    assert put(manager, state['upload_id'], data[:100], 0, 300)[1] is None
+
+    state, file_hash = put(manager, state['upload_id'], data[100:], 100, 300)
+    assert file_hash == hashlib.sha256(data).hexdigest()
+    assert (tmp_path / state['unique_filename']).read_bytes() == data
+    assert os.listdir(tmp_path / '.partial') == []
+
+
+def test_resume_after_a_cut_off_chunk(manager, store, tmp_path):
+    data = os.urandom(300)
+    upload_id = manager.create('song.mp3', len(data), 'session')['upload_id']
+    with pytest.raises(UploadError):
+        # The client promised 200 bytes but the connection dropped after 150
+        manager.write_chunk(upload_id, 'bytes 0-199/300', io.BytesIO(data[:150]))
+
+    # A restarted server has no running hash and rebuilds it from disk
+    manager = ChunkedUploadManager(store, str(tmp_path), max_size=1000)
+    assert manager.get(upload_id)['offset'] == 150
+    with pytest.raises(OffsetMismatch) as excinfo:
+        put(manager, upload_id, data[200:], 200, 300)
+    assert excinfo.value.offset == 150
+
+    _, file_hash = put(manager, upload_id, data[150:], 150, 300)
+    assert file_hash == hashlib.sha256(data).hexdigest()
+
+
+def test_chunk_is_refused_while_another_process_writes_the_upload(manager, store):
+    data = os.urandom(300)
+    upload_id = manager.create('song.mp3', len(data), 'session')['upload_id']
+    put(manager, upload_id, data[:100], 0, 300)
+
+    # Another process holds the lock for this upload
+    assert store.acquire_lock(f'upload:{upload_id}', 'other', time.time() + 60, time.time())
+    with pytest.raises(OffsetMismatch) as excinfo:
+        put(manager, upload_id, data[100:], 100, 300)
+    assert excinfo.value.offset == 100
+
+    store.release_lock(f'upload:{upload_id}', 'other')
+    _, file_hash = put(manager, upload_id, data[100:], 100, 300)
+    assert file_hash == hashlib.sha256(data).hexdigest()
+
+
+@pytest.mark.parametrize('header', [None, 'bytes 0-9', 'bytes 5-4/10', 'bytes 0-10/10'])
+def test_invalid_content_range_is_rejected(header):
+    with pytest.raises(UploadError):
+        parse_content_range(header)
+
+
+def test_resumable_upload_through_the_api(client, tmp_path):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (200, 30, 30)).save(buffer, format='PNG')
+    data = buffer.getvalue()
+    created = client.post('/api/uploads', json={'filename': 'red.png', 'size': len(data)})
+    assert created.status_code == 201
+    upload_url = created.get_json()['upload_url']
+
+    half = len(data) // 2
+    response = client.put(upload_url, data=data[:half],
+                          headers={'Content-Range': f'bytes 0-{half - 1}/{len(data)}'})
+    assert response.get_json()['offset'] == half
+
+    response = client.put(upload_url, data=data[1:],
+                          headers={'Content-Range': f'bytes 1-{len(data) - 1}/{len(data)}'})
+    assert response.status_code == 409
+    assert response.get_json()['offset'] == half
+
+    assert client.get(upload_url).get_json()['offset'] == half
+    response = client.put(upload_url, data=data[half:],
+                          headers={'Content-Range': f'bytes {half}-{len(data) - 1}/{len(data)}'})
+    assert response.status_code == 200
+    assert response.get_json()['sha256'] == hashlib.sha256(data).hexdigest()
@@ -0,0 +1,84 @@
+import os
+import time
+
+from PIL import Image
+
+from conversion_tasks import remove_stale_workdirs, run_conversion
+from converter import registry
+from job_queue import JobQueue
+
+
+def make_png(path, color, size=(1600, 1200)):
+    Image.new('RGB', size, color).save(path)
+    return str(path)
+
+
+def write_tag(input_path, tag):
+    """A converter that writes next to its input, slowly enough for jobs to overlap"""
+    output_path = os.path.splitext(input_path)[0] + '.txt'
+    with open(output_path, 'w') as f:
+        f.write(tag)
+    time.sleep(0.3)
+    return output_path
+
+
+def test_overlapping_jobs_keep_their_own_output(tmp_path):
+    input_path = make_png(tmp_path / 'shared.png', (0, 0, 0), size=(4, 4))
+    queue = JobQueue(lanes={'work': {'workers': 4, 'max_queued': 4}})
+    try:
+        jobs = [queue.submit('work', run_conversion, write_tag, input_path, str(tmp_path / f'out{index}.txt'),
+                             {'tag': f'job {index}'})
+                for index in range(4)]
+        finished = list(queue.iter_completed([job['job_id'] for job in jobs], timeout=30))
+    finally:
+        queue.shutdown()
+
+    assert [job['status'] for job in finished] == ['finished'] * 4
+    for index in range(4):
+        assert (tmp_path / f'out{index}.txt').read_text() == f'job {index}'
+
+
+def test_concurrent_jobs_on_one_upload_do_not_share_files(tmp_path):
+    uploads = tmp_path / 'uploads'
+    outputs = tmp_path / 'outputs'
+    uploads.mkdir()
+    outputs.mkdir()
+    input_path = make_png(uploads / 'abc_photo.png', (200, 30, 30))
+    plan = registry.plan('png', 'jpeg')
+
+    queue = JobQueue(lanes={'image': {'workers': 4, 'max_queued': 16}})
+    try:
+        jobs = [
+            queue.submit('image', run_conversion, plan, input_path, str(outputs / f'{index}_photo.jpg'),
+                         {'max_width': 100 * (index + 1)})
+            for index in range(8)
+        ]
+        finished = list(queue.iter_completed([job['job_id'] for job in jobs], timeout=60))
+    finally:
+        queue.shutdown()
+
+    assert [job['status'] for job in finished] == ['finished'] * 8
+    for job in finished:
+        index = int(os.path.basename(job['result']['output_path']).split('_')[0])
+        with Image.open(job['result']['output_path']) as image:
+            # Each job got its own output, not another job's
+            assert image.format == 'JPEG'
+            assert image.width == 100 * (index + 1)
+    # Nothing is written next to the shared upload, and no work directories are left
+    assert os.listdir(uploads) == ['abc_photo.png']
+    assert sorted(os.listdir(outputs)) == [f'{index}_photo.jpg' for index in range(8)]
+
+
+def test_stale_job_directories_are_removed(tmp_path):
+    now = time.time()
+    for name, age in (('.job-killed', 7200), ('.job-running', 10), ('kept-dir', 7200)):
+        workdir = tmp_path / name
+        workdir.mkdir()
+        (workdir / 'input.png').write_bytes(b'data')
+        for path in (workdir / 'input.png', workdir):
+            os.utime(path, (now - age, now - age))
+    # A job still writing its output, in a directory that was made long ago
+    os.utime(tmp_path / '.job-running', (now - 7200, now - 7200))
+
+    assert remove_stale_workdirs(str(tmp_path), max_age=3600) == 1
+    assert sorted(os.listdir(tmp_path)) == ['.job-running', 'kept-dir']
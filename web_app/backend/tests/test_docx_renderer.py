@@ -0,0 +1,57 @@
+import fitz
+from docx import Document
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+
+from converter import docx_renderer
+from converter.registry import conversion_plans
+
+PLANS = conversion_plans()
+
+
+def add_hyperlink(paragraph, text, url):
+    """Append a w:hyperlink run, the way Word stores links"""
+    hyperlink = OxmlElement('w:hyperlink')
+    hyperlink.set(qn('r:id'), paragraph.part.relate_to(url, RT.HYPERLINK, is_external=True))
+    run = OxmlElement('w:r')
+    text_element = OxmlElement('w:t')
+    text_element.text = text
+    run.append(text_element)
+    hyperlink.append(run)
+    paragraph._p.append(hyperlink)
+
+
+def pdf_text(path):
+    with fitz.open(path) as document:
+        return document.page_count, ''.join(page.get_text() for page in document)
+
+
+def test_long_document_keeps_every_paragraph_in_order(tmp_path, monkeypatch):
+    # A small window makes the story refill many times over the build
+    monkeypatch.setattr(docx_renderer, 'STORY_WINDOW', 5)
+    document = Document()
+    document.add_heading('Report', level=1)
+    for number in range(1, 151):
+        document.add_paragraph(f'Paragraph {number} of the report.')
+    document.save(tmp_path / 'report.docx')
+
+    page_count, text = pdf_text(PLANS['word_to_pdf'](str(tmp_path / 'report.docx')))
+    assert page_count > 3
+    positions = [text.index(f'Paragraph {number} of') for number in range(1, 151)]
+    assert positions == sorted(positions)
+    assert text.index('Report') < positions[0]
+
+
+def test_hyperlink_text_and_target_are_kept(tmp_path):
+    document = Document()
+    paragraph = document.add_paragraph('See ')
+    add_hyperlink(paragraph, 'the manual', 'https://example.com/manual')
+    paragraph.add_run(' for details.')
+    document.save(tmp_path / 'links.docx')
+
+    output_path = PLANS['word_to_pdf'](str(tmp_path / 'links.docx'))
+    _, text = pdf_text(output_path)
+    assert 'See the manual for details.' in ' '.join(text.split())
+    with fitz.open(output_path) as pdf:
+        assert [link['uri'] for link in pdf[0].get_links()] == ['https://example.com/manual']
@@ -0,0 +1,99 @@
+import io
+import zipfile
+
+import fitz
+import pytest
+from PIL import Image
+
+import file_probe
+from file_probe import CorruptFileError, OverBudgetError, ProbeError, file_kind, probe, sniff
+
+
+def png_bytes(size=(40, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def test_kinds_follow_the_converter_graph():
+    assert file_kind('a.JPG') == 'jpeg'
+    assert file_kind('report.docx') == 'word'
+    assert file_kind('song.m4a') == 'm4a'
+    # Output-only formats and unknown extensions cannot be uploaded
+    assert file_kind('a.webp') is None
+    assert file_kind('a.exe') is None
+    assert file_kind('README') is None
+
+
+def test_sniff_rejects_content_that_does_not_match_extension():
+    assert sniff('a.png', png_bytes()) == 'png'
+    with pytest.raises(ProbeError, match='does not match'):
+        sniff('a.jpg', png_bytes())
+    with pytest.raises(ProbeError, match='Unsupported'):
+        sniff('a.exe', b'MZ')
+
+
+def test_probe_reads_image_and_docx_headers(tmp_path):
+    image = tmp_path / 'a.png'
+    image.write_bytes(png_bytes())
+    assert probe(str(image), 'a.png') == {'kind': 'png', 'size': image.stat().st_size, 'width': 40, 'height': 30}
+
+    document = tmp_path / 'a.docx'
+    with zipfile.ZipFile(document, 'w') as archive:
+        archive.writestr('[Content_Types].xml', '<Types/>')
+        archive.writestr('word/document.xml', '<w:document/>')
+    assert probe(str(document), 'a.docx')['kind'] == 'word'
+
+
+def test_probe_enforces_pixel_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_probe, 'IMAGE_MAX_PIXELS', 1000)
+    image = tmp_path / 'a.png'
+    image.write_bytes(png_bytes())
+    with pytest.raises(OverBudgetError):
+        probe(str(image), 'a.png')
+
+
+def test_probe_rejects_truncated_headers(tmp_path):
+    image = tmp_path / 'a.png'
+    image.write_bytes(png_bytes()[:12])
+    with pytest.raises(CorruptFileError):
+        probe(str(image), 'a.png')
+
+
+def test_png_with_data_after_iend_is_accepted(tmp_path):
+    image = tmp_path / 'a.png'
+    image.write_bytes(png_bytes() + b'\0' * 4096)
+    assert probe(str(image), 'a.png')['width'] == 40
+
+
+def save_pdf(path, pages, **options):
+    with fitz.open() as document:
+        for _ in range(pages):
+            document.new_page()
+        document.save(path, **options)
+    return str(path)
+
+
+def test_probe_counts_pdf_pages_through_the_trailer(tmp_path):
+    path = save_pdf(tmp_path / 'a.pdf', 3)
+    assert probe(path, 'a.pdf')['pages'] == 3
+
+    # Incremental updates append a new xref table pointing back with /Prev
+    with fitz.open(path) as document:
+        document.new_page()
+        document.save(path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+    assert probe(path, 'a.pdf')['pages'] == 4
+
+    # An outline's /Count is not mistaken for the page count
+    with fitz.open(path) as document:
+        document.set_toc([[1, f'Chapter {n}', 1] for n in range(1, 10)])
+        document.save(tmp_path / 'outline.pdf')
+    assert probe(str(tmp_path / 'outline.pdf'), 'a.pdf')['pages'] == 4
+
+
+def test_probe_enforces_page_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_probe, 'PDF_MAX_PAGES', 5)
+    with pytest.raises(OverBudgetError, match='6 pages'):
+        probe(save_pdf(tmp_path / 'a.pdf', 6), 'a.pdf')
+    # Without a readable count the upload passes and the worker checks it
+    assert probe(save_pdf(tmp_path / 'b.pdf', 6, use_objstms=1), 'b.pdf')['pages'] is None
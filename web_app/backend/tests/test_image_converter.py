@@ -0,0 +1,167 @@
+import gc
+import os
+import warnings
+
+import pytest
+from PIL import ExifTags, Image, features
+
+from converter import image_converter
+from converter.image_converter import trace_to_svg
+from converter.registry import conversion_plans
+
+PLANS = conversion_plans()
+
+# A red disc on a transparent 100x50 canvas
+SVG = (b'<svg xmlns="http://www.w3.org/2000/svg" width="100" height="50">'
+       b'<circle cx="50" cy="25" r="20" fill="#ff0000"/></svg>')
+
+
+def save_photo(path, size, orientation=None, software=None):
+    """Save a gradient JPEG, optionally with EXIF orientation and software tags"""
+    image = Image.linear_gradient('L').resize(size).convert('RGB')
+    exif = Image.Exif()
+    if orientation:
+        exif[ExifTags.Base.Orientation] = orientation
+    if software:
+        exif[ExifTags.Base.Software] = software
+    image.save(path, 'JPEG', exif=exif.tobytes())
+    return str(path)
+
+
+@pytest.fixture
+def svg(tmp_path):
+    path = tmp_path / 'icon.svg'
+    path.write_bytes(SVG)
+    return str(path)
+
+
+@pytest.mark.parametrize('options, size', [
+    ({}, (100, 50)),
+    ({'width': 300}, (300, 150)),
+    ({'height': 100}, (200, 100)),
+    ({'width': 50, 'height': 50}, (50, 50)),
+    ({'dpi': 192}, (200, 100)),
+])
+def test_svg_to_png_output_size(svg, options, size):
+    with Image.open(PLANS['svg_to_png'](svg, **options)) as image:
+        assert image.size == size
+
+
+def test_svg_to_png_keeps_transparency(svg):
+    with Image.open(PLANS['svg_to_png'](svg, width=200)) as image:
+        image = image.convert('RGBA')
+        assert image.getpixel((2, 2))[3] == 0
+        assert image.getpixel((100, 50)) == (255, 0, 0, 255)
+
+
+def test_svg_to_jpeg_is_flattened_onto_white(svg):
+    output_path = PLANS['svg_to_jpeg'](svg, width=200)
+    assert output_path.endswith('.jpg')
+    with Image.open(output_path) as image:
+        assert image.mode == 'RGB'
+        assert all(channel > 245 for channel in image.getpixel((2, 2)))
+        red, green, blue = image.getpixel((100, 50))
+        assert red > 240 and green < 20 and blue < 20
+
+
+def test_identical_svgs_are_parsed_once(svg, tmp_path, monkeypatch):
+    image_converter._svg_documents.clear()
+    opened = []
+    real_open = image_converter.fitz.open
+
+    def counting_open(*args, **kwargs):
+        opened.append(kwargs.get('filetype'))
+        return real_open(*args, **kwargs)
+    monkeypatch.setattr(image_converter.fitz, 'open', counting_open)
+
+    copy = tmp_path / 'copy.svg'
+    copy.write_bytes(SVG)
+    PLANS['svg_to_png'](svg, width=64)
+    PLANS['svg_to_png'](str(copy), width=128)
+    PLANS['svg_to_jpeg'](svg, dpi=48)
+    assert opened == ['svg']
+
+
+@pytest.mark.parametrize('options', [{'width': -10}, {'dpi': -96}, {'width': 100000}])
+def test_rejects_bad_output_sizes(svg, options):
+    with pytest.raises(ValueError):
+        PLANS['svg_to_png'](svg, **options)
+
+
+@pytest.mark.parametrize('bounds, size', [
+    ({'max_width': 100}, (100, 75)),
+    ({'max_height': 30}, (40, 30)),
+    ({'max_width': 100, 'max_height': 50}, (67, 50)),
+    ({'max_width': 1000}, (400, 300)),
+])
+def test_resize_keeps_aspect_ratio_and_never_upscales(tmp_path, bounds, size):
+    photo = save_photo(tmp_path / 'photo.jpg', (400, 300))
+    with Image.open(PLANS['jpeg_to_png'](photo, **bounds)) as image:
+        assert image.size == size
+
+
+def test_exif_orientation_is_applied_to_the_pixels(tmp_path):
+    photo = save_photo(tmp_path / 'photo.jpg', (40, 20), orientation=6)
+    with Image.open(PLANS['jpeg_to_png'](photo, max_height=20)) as image:
+        # Rotated to portrait, and the bounds apply to the rotated photo
+        assert image.size == (10, 20)
+
+
+@pytest.mark.parametrize('strip_metadata', [False, True])
+def test_strip_metadata(tmp_path, strip_metadata):
+    photo = save_photo(tmp_path / 'photo.jpg', (40, 20), software='camera 1.0')
+    with Image.open(PLANS['jpeg_to_webp'](photo, strip_metadata=strip_metadata)) as image:
+        assert (image.getexif().get(ExifTags.Base.Software) == 'camera 1.0') is not strip_metadata
+
+
+def test_quality_changes_the_encoded_size(tmp_path):
+    image = Image.effect_noise((128, 128), 64).convert('RGB')
+    image.save(tmp_path / 'noise.png')
+    low = os.path.getsize(PLANS['png_to_jpeg'](str(tmp_path / 'noise.png'), quality=10))
+    high = os.path.getsize(PLANS['png_to_jpeg'](str(tmp_path / 'noise.png'), quality=95))
+    assert low < high / 2
+
+
+def test_jpeg_output_flattens_transparency_onto_white(tmp_path):
+    Image.new('RGBA', (8, 8), (0, 0, 0, 0)).save(tmp_path / 'clear.png')
+    with Image.open(PLANS['png_to_jpeg'](str(tmp_path / 'clear.png'))) as image:
+        assert image.mode == 'RGB'
+        assert all(channel > 250 for channel in image.getpixel((4, 4)))
+
+
+def test_webp_keeps_transparency(tmp_path):
+    Image.new('RGBA', (8, 8), (255, 0, 0, 128)).save(tmp_path / 'glass.png')
+    output_path = PLANS['png_to_webp'](str(tmp_path / 'glass.png'))
+    assert output_path.endswith('.webp')
+    with Image.open(output_path) as image:
+        assert image.format == 'WEBP'
+        assert image.mode == 'RGBA'
+
+
+@pytest.mark.skipif(not features.check('avif'), reason='Pillow built without AVIF')
+def test_avif_output(tmp_path):
+    Image.new('RGB', (8, 8), (0, 0, 255)).save(tmp_path / 'blue.png')
+    with Image.open(PLANS['png_to_avif'](str(tmp_path / 'blue.png'), quality=50)) as image:
+        assert image.format == 'AVIF'
+
+
+@pytest.mark.parametrize('options', [{'quality': 0}, {'quality': 101}, {'max_width': -5}])
+def test_rejects_bad_image_options(tmp_path, options):
+    Image.new('RGB', (8, 8)).save(tmp_path / 'small.png')
+    with pytest.raises(ValueError):
+        PLANS['png_to_jpeg'](str(tmp_path / 'small.png'), **options)
+
+
+def test_trace_to_svg_closes_its_input(tmp_path):
+    input_path = tmp_path / 'shape.png'
+    image = Image.new('RGB', (64, 64), 'white')
+    image.paste((200, 20, 20), (16, 16, 48, 48))
+    image.save(input_path)
+
+    # A file left for the garbage collector to close raises ResourceWarning
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always', ResourceWarning)
+        trace_to_svg(str(input_path), str(tmp_path / 'shape.svg'), detail='low')
+        gc.collect()
+    assert not [warning for warning in caught if issubclass(warning.category, ResourceWarning)]
+    assert '<svg' in (tmp_path / 'shape.svg').read_text()
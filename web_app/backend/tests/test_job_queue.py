@@ -0,0 +1,110 @@
+import os
+import signal
+import time
+
+import pytest
+
+from job_queue import JobQueue, QueueFullError, report_progress
+
+
+def add(a, b):
+    return a + b
+
+
+def fail():
+    raise ValueError('bad input')
+
+
+def crash():
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def steps(count):
+    for done in range(1, count + 1):
+        time.sleep(0.3)
+        report_progress({'done': done, 'total': count})
+    return count
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(lanes={'work': {'workers': 1, 'max_queued': 4}})
+    yield queue
+    queue.shutdown()
+
+
+def wait_for(queue, job):
+    for _ in range(600):
+        job = queue.get(job['job_id'])
+        if job['status'] in ('finished', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError('job did not finish')
+
+
+def test_runs_job_and_calls_success_callback(queue):
+    seen = []
+    job = queue.submit('work', add, 2, 3, on_success=lambda finished: seen.append(finished['result']))
+    finished = wait_for(queue, job)
+    assert finished['status'] == 'finished'
+    assert finished['result'] == 5
+    assert seen == [5]
+    assert queue.stats()['work']['active'] == 0
+
+
+def test_failed_job_records_its_error(queue):
+    failed = wait_for(queue, queue.submit('work', fail))
+    assert failed['status'] == 'failed'
+    assert failed['error'] == 'bad input'
+    assert queue.stats()['work']['active'] == 0
+
+
+def test_rejects_jobs_beyond_max_queued():
+    queue = JobQueue(lanes={'work': {'workers': 1, 'max_queued': 1}})
+    try:
+        queue.submit('work', add, 1, 1)
+        with pytest.raises(QueueFullError):
+            queue.submit('work', add, 1, 1)
+    finally:
+        queue.shutdown()
+
+
+def test_unknown_lane_is_rejected(queue):
+    with pytest.raises(ValueError):
+        queue.submit('video', add, 1, 1)
+
+
+def test_watch_follows_progress_until_the_job_settles(queue):
+    job = queue.submit('work', steps, 3)
+    snapshots = list(queue.watch(job['job_id'], heartbeat=30))
+
+    assert snapshots[-1]['status'] == 'finished'
+    assert snapshots[-1]['result'] == 3
+    assert all(snapshot['status'] in ('queued', 'running') for snapshot in snapshots[:-1])
+    done = [snapshot['progress']['done'] for snapshot in snapshots if snapshot['progress']]
+    assert done[:2] == [1, 2]
+    assert done == sorted(done)
+    assert list(queue.watch('unknown')) == []
+
+
+def test_worker_crash_fails_its_job_and_lane_recovers(queue):
+    failures = []
+    crashed = wait_for(queue, queue.submit('work', crash, on_failure=failures.append))
+    assert crashed['status'] == 'failed'
+    assert 'crashed' in crashed['error']
+    assert len(failures) == 1
+
+    # The lane gets a new pool instead of raising BrokenProcessPool forever
+    for _ in range(2):
+        finished = wait_for(queue, queue.submit('work', add, 1, 2))
+        assert finished['status'] == 'finished'
+        assert finished['result'] == 3
+    stats = queue.stats()['work']
+    assert stats['restarts'] == 1
+    assert stats['active'] == 0
+
+
+def test_crash_after_warm_restarts_warmed_pool(queue):
+    queue.warm()
+    assert wait_for(queue, queue.submit('work', crash))['status'] == 'failed'
+    assert wait_for(queue, queue.submit('work', add, 2, 2))['result'] == 4
@@ -0,0 +1,64 @@
+import os
+import time
+
+from PIL import Image
+
+from converter import instrumentation
+from metrics import MetricsRegistry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    latency = registry.histogram('latency_seconds', 'Latency', ('stage',), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, stage='decode')
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ['# HELP latency_seconds Latency', '# TYPE latency_seconds histogram']
+    assert 'latency_seconds_bucket{stage="decode",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="decode",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{stage="decode",le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum{stage="decode"} 5.55' in lines
+    assert 'latency_seconds_count{stage="decode"} 3' in lines
+
+
+def test_counter_escapes_label_values():
+    registry = MetricsRegistry()
+    jobs = registry.counter('jobs_total', 'Jobs', ('conversion_type',))
+    jobs.inc(conversion_type='a"b')
+    jobs.inc(2, conversion_type='a"b')
+    assert 'jobs_total{conversion_type="a\\"b"} 3' in registry.render().splitlines()
+
+
+def test_stages_accumulate_until_collected():
+    instrumentation.collect()
+    with instrumentation.stage('decode'):
+        time.sleep(0.01)
+    with instrumentation.stage('decode'):
+        pass
+    instrumentation.record('encode', 0.5)
+
+    timings = instrumentation.collect()
+    assert timings['decode'] >= 0.01
+    assert timings['encode'] == 0.5
+    assert instrumentation.collect() == {}
+
+
+def test_conversion_stages_reach_the_metrics_endpoint(client, upload, tmp_path):
+    # Random pixels, so this input is never already in the result cache
+    path = tmp_path / 'noise.png'
+    Image.frombytes('RGB', (16, 16), os.urandom(16 * 16 * 3)).save(path)
+    job = client.post('/api/convert', json={'unique_filename': upload(path),
+                                            'conversion_type': 'png_to_jpeg'}).get_json()
+    for _ in range(300):
+        if client.get(job['status_url']).get_json()['status'] in ('finished', 'failed'):
+            break
+        time.sleep(0.05)
+
+    response = client.get('/api/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    text = response.get_data(as_text=True)
+    for stage in ('queue_wait', 'decode', 'encode', 'output_copy'):
+        assert f'converter_stage_seconds_count{{stage="{stage}",conversion_type="png_to_jpeg"}}' in text
+    assert 'converter_jobs_total{conversion_type="png_to_jpeg",status="finished"}' in text
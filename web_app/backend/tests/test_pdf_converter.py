@@ -0,0 +1,179 @@
+import zipfile
+
+import fitz
+import pytest
+from docx import Document
+from docx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from docx.opc.packuri import PackURI
+from docx.opc.part import XmlPart
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+from PIL import Image
+
+from converter import instrumentation, limits
+from converter.pdf_converter import merge_docx_files, parse_page_range
+from converter.registry import conversion_plans
+
+PLANS = conversion_plans()
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    """A 12-page A6 document with the page number written on every page"""
+    path = tmp_path / 'report.pdf'
+    with fitz.open() as document:
+        for number in range(1, 13):
+            page = document.new_page(width=298, height=420)
+            page.insert_text((40, 60), f'Page {number}', fontsize=24)
+        document.save(path)
+    return str(path)
+
+
+@pytest.fixture
+def progress():
+    """Progress reports (done, total, unit) from the converter under test"""
+    reports = []
+    instrumentation.set_progress_reporter(lambda done, total, unit: reports.append((done, total, unit)))
+    yield reports
+    instrumentation.set_progress_reporter(None)
+
+
+@pytest.mark.parametrize('pages, expected', [
+    (None, [0]),
+    ('all', list(range(10))),
+    ('3', [2]),
+    ('1-3, 8', [0, 1, 2, 7]),
+    ('2-3,3-4', [1, 2, 3]),
+    ('-2', [0, 1]),
+    ('9-', [8, 9]),
+])
+def test_parse_page_range(pages, expected):
+    assert parse_page_range(pages, 10) == expected
+
+
+@pytest.mark.parametrize('pages', ['0', '11', '5-3', '1-11', ',', 'two'])
+def test_parse_page_range_rejects_bad_ranges(pages):
+    with pytest.raises(ValueError):
+        parse_page_range(pages, 10)
+
+
+def test_first_page_only_by_default(pdf):
+    output_path = PLANS['pdf_to_png'](pdf)
+    assert output_path.endswith('.png')
+    with Image.open(output_path) as image:
+        assert image.size == (596, 840)
+
+
+def test_all_pages_are_rendered_in_parallel_into_a_zip(pdf, progress):
+    output_path = PLANS['pdf_to_png'](pdf, pages='all', zoom=1, workers=3)
+    assert output_path.endswith('.zip')
+    with zipfile.ZipFile(output_path) as archive:
+        assert sorted(archive.namelist()) == [f'page_{number:02d}.png' for number in range(1, 13)]
+        with archive.open('page_07.png') as page, Image.open(page) as image:
+            assert image.size == (298, 420)
+    assert progress[-1] == (12, 12, 'pages')
+    assert [done for done, _, _ in progress] == sorted(done for done, _, _ in progress)
+
+
+def test_selected_pages_in_grayscale(pdf):
+    output_path = PLANS['pdf_to_png'](pdf, pages='2,4-5', dpi=72, colorspace='gray', workers=1)
+    with zipfile.ZipFile(output_path) as archive:
+        assert archive.namelist() == ['page_02.png', 'page_04.png', 'page_05.png']
+        with archive.open('page_04.png') as page, Image.open(page) as image:
+            assert image.mode == 'L'
+
+
+@pytest.mark.parametrize('options', [{'dpi': 1200}, {'zoom': 0}, {'colorspace': 'cmyk'}])
+def test_rejects_bad_render_options(pdf, options):
+    with pytest.raises(ValueError):
+        PLANS['pdf_to_png'](pdf, **options)
+
+
+def test_sharded_pdf_to_word_keeps_page_order(pdf, progress):
+    output_path = PLANS['pdf_to_word'](pdf, shards=3, workers=2)
+    text = [paragraph.text for paragraph in Document(output_path).paragraphs if paragraph.text.strip()]
+    assert text == [f'Page {number}' for number in range(1, 13)]
+    assert progress == [(1, 3, 'shards'), (2, 3, 'shards'), (3, 3, 'shards')]
+
+
+@pytest.mark.parametrize('conversion', ['pdf_to_png', 'pdf_to_word', 'pdf_to_jpeg'])
+def test_page_budget_is_enforced_before_rendering(pdf, tmp_path, monkeypatch, conversion):
+    # Object streams hide the page count from the upload probe
+    packed = tmp_path / 'packed.pdf'
+    with fitz.open(pdf) as document:
+        document.save(packed, use_objstms=1)
+    monkeypatch.setattr(limits, 'PDF_MAX_PAGES', 10)
+    with pytest.raises(ValueError, match='12 pages, the limit is 10'):
+        PLANS[conversion](str(packed))
+
+
+def add_footnote(document, text):
+    """Give a document a footnotes part with one note and a paragraph referring to it"""
+    notes = parse_xml(f'<w:footnotes {nsdecls("w")}><w:footnote w:id="1"><w:p><w:r><w:t>{text}</w:t></w:r></w:p>'
+                      '</w:footnote></w:footnotes>')
+    part = XmlPart(PackURI('/word/footnotes.xml'), CT.WML_FOOTNOTES, notes, document.part.package)
+    document.part.relate_to(part, RT.FOOTNOTES)
+    paragraph = document.add_paragraph('Noted')
+    paragraph._p.append(parse_xml(f'<w:r {nsdecls("w")}><w:footnoteReference w:id="1"/></w:r>'))
+
+
+def numbered_paragraph(document, text, num_id):
+    paragraph = document.add_paragraph(text)
+    paragraph._p.get_or_add_pPr().append(parse_xml(
+        f'<w:numPr {nsdecls("w")}><w:ilvl w:val="0"/><w:numId w:val="{num_id}"/></w:numPr>'))
+    return paragraph
+
+
+def numbering_format(document, paragraph):
+    numbering = document.part.numbering_part.element
+    num_id = paragraph._p.pPr.numPr.numId.val
+    num = next(num for num in numbering.iter(qn('w:num')) if num.get(qn('w:numId')) == str(num_id))
+    abstract_id = num.find(qn('w:abstractNumId')).get(qn('w:val'))
+    abstract = next(abstract for abstract in numbering.iter(qn('w:abstractNum'))
+                    if abstract.get(qn('w:abstractNumId')) == abstract_id)
+    return abstract.find(f"{qn('w:lvl')}/{qn('w:numFmt')}").get(qn('w:val'))
+
+
+def test_merge_carries_headers_footnotes_and_numbering(tmp_path):
+    paths = []
+    for index in range(2):
+        document = Document()
+        document.sections[0].header.paragraphs[0].text = f'Header {index}'
+        add_footnote(document, f'Note {index}')
+        numbered_paragraph(document, f'Item {index}', 1)
+        if index == 1:
+            # The second shard defines numId 1 differently
+            numbering = document.part.numbering_part.element
+            abstract_id = next(numbering.iter(qn('w:num'))).find(qn('w:abstractNumId')).get(qn('w:val'))
+            for abstract in numbering.iter(qn('w:abstractNum')):
+                if abstract.get(qn('w:abstractNumId')) == abstract_id:
+                    abstract.find(f"{qn('w:lvl')}/{qn('w:numFmt')}").set(qn('w:val'), 'upperRoman')
+        paths.append(str(tmp_path / f'shard_{index}.docx'))
+        document.save(paths[-1])
+
+    merged = Document(merge_docx_files(paths, str(tmp_path / 'merged.docx')))
+
+    assert [section.header.paragraphs[0].text for section in merged.sections] == ['Header 0', 'Header 1']
+    references = merged.element.body.findall(f".//{qn('w:footnoteReference')}")
+    footnotes = merged.part.part_related_by(RT.FOOTNOTES).element
+    notes = {note.get(qn('w:id')): note.find(f".//{qn('w:t')}").text for note in footnotes.iter(qn('w:footnote'))}
+    assert [notes[reference.get(qn('w:id'))] for reference in references] == ['Note 0', 'Note 1']
+
+    items = [paragraph for paragraph in merged.paragraphs if paragraph.text.startswith('Item')]
+    assert numbering_format(merged, items[0]) != 'upperRoman'
+    assert numbering_format(merged, items[1]) == 'upperRoman'
+
+
+def test_merge_drops_references_with_nothing_to_point_at(tmp_path):
+    first, second = Document(), Document()
+    first.add_paragraph('First')
+    paragraph = numbered_paragraph(second, 'Item', 99)
+    paragraph._p.append(parse_xml(f'<w:r {nsdecls("w")}><w:footnoteReference w:id="5"/></w:r>'))
+    paths = [str(tmp_path / 'first.docx'), str(tmp_path / 'second.docx')]
+    first.save(paths[0])
+    second.save(paths[1])
+
+    merged = Document(merge_docx_files(paths, str(tmp_path / 'merged.docx')))
+    [item] = [paragraph for paragraph in merged.paragraphs if paragraph.text == 'Item']
+    assert item._p.pPr.numPr is None
+    assert merged.element.body.find(f".//{qn('w:footnoteReference')}") is None
@@ -0,0 +1,58 @@
+import io
+import os
+import subprocess
+import sys
+
+import fitz
+import pytest
+from PIL import Image
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def pdf(tmp_path_factory):
+    path = tmp_path_factory.mktemp('pdf') / 'report.pdf'
+    document = fitz.open()
+    for number in range(1, 4):
+        page = document.new_page(width=595, height=842)
+        page.insert_text((72, 72), f'Page {number}', fontsize=24)
+    document.save(path)
+    return path
+
+
+def test_thumbnail_is_rendered_then_served_from_cache(client, upload, pdf, app_module):
+    unique_filename = upload(pdf)
+    response = client.get(f'/api/preview/{unique_filename}/2?size=100')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    with Image.open(io.BytesIO(response.data)) as image:
+        assert max(image.size) == 100
+
+    hits = app_module.pdf_previews.cache.stats()['hits']
+    again = client.get(f'/api/preview/{unique_filename}/2?size=100')
+    assert again.data == response.data
+    assert app_module.pdf_previews.cache.stats()['hits'] == hits + 1
+
+    revalidated = client.get(f'/api/preview/{unique_filename}/2?size=100',
+                             headers={'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+
+
+@pytest.mark.parametrize('path, status', [
+    ('/4', 404),
+    ('/1?size=5000', 400),
+])
+def test_rejects_bad_page_or_size(client, upload, pdf, path, status):
+    unique_filename = upload(pdf)
+    assert client.get(f'/api/preview/{unique_filename}{path}').status_code == status
+
+
+def test_api_process_does_not_load_pymupdf(tmp_path):
+    env = {**os.environ, 'WARM_WORKERS': '0', 'STATE_STORE_URL': f"sqlite:///{tmp_path / 'state.db'}",
+           'UPLOAD_FOLDER': str(tmp_path / 'uploads'), 'OUTPUT_FOLDER': str(tmp_path / 'outputs')}
+    result = subprocess.run(
+        [sys.executable, '-c', f'import sys; sys.path.insert(0, {BACKEND!r}); import app; print("fitz" in sys.modules)'],
+        cwd=tmp_path, env=env, capture_output=True, text=True, check=True,
+    )
+    assert result.stdout.strip().splitlines()[-1] == 'False'
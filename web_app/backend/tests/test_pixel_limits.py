@@ -0,0 +1,55 @@
+import fitz
+import pytest
+
+from converter import image_converter, limits, pdf_converter
+
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg" width="100" height="100"><rect width="100" height="100"/></svg>'
+
+
+@pytest.fixture(autouse=True)
+def small_budget(monkeypatch):
+    monkeypatch.setattr(limits, 'IMAGE_MAX_PIXELS', 1_000_000)
+
+
+@pytest.fixture
+def svg(tmp_path):
+    path = tmp_path / 'icon.svg'
+    path.write_bytes(SVG)
+    return str(path)
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    path = tmp_path / 'page.pdf'
+    document = fitz.open()
+    document.new_page(width=595, height=842)
+    document.save(path)
+    return str(path)
+
+
+def test_svg_render_within_budget(svg):
+    pix = image_converter.render_svg(svg, width=900)
+    assert (pix.width, pix.height) == (900, 900)
+
+
+def test_svg_render_over_budget_is_refused(svg):
+    # Well under the per-side limit, but 9 MP
+    with pytest.raises(ValueError, match='Image is too large'):
+        image_converter.render_svg(svg, width=3000)
+
+
+def test_pdf_render_over_budget_is_refused(pdf):
+    assert pdf_converter.render_pdf_page(pdf, dpi=72).width == 595
+    with pytest.raises(ValueError, match='Image is too large'):
+        pdf_converter.render_pdf_page(pdf, dpi=300)
+
+
+def test_pdf_to_png_over_budget_is_refused(pdf, tmp_path):
+    with pytest.raises(ValueError, match='Image is too large'):
+        pdf_converter.convert_pdf_to_png(pdf, str(tmp_path / 'page.png'), dpi=300)
+
+
+def test_oversized_pixmap_is_refused():
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 1200, 1000), False)
+    with pytest.raises(ValueError, match='Image is too large'):
+        image_converter.pixmap_to_image(pix)
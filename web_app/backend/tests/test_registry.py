@@ -0,0 +1,76 @@
+import inspect
+
+import fitz
+import pytest
+
+from converter import registry
+
+calls = []
+
+
+def first(input_path, output_path, scale=1, shared='first'):
+    calls.append(('first', scale, shared))
+    with open(output_path, 'w') as f:
+        f.write('a')
+    return output_path
+
+
+def second(input_path, output_path, shared='second', level=0):
+    calls.append(('second', shared, level))
+    with open(output_path, 'w') as f:
+        f.write('b')
+    return output_path
+
+
+@pytest.fixture
+def chain():
+    """Formats ta -> tb -> tc joined by the functions above"""
+    for name in ('ta', 'tb', 'tc'):
+        registry.register_format(name, [f'.{name}'], 'test')
+    registry.register_converter('ta', 'tb', f'{__name__}:first')
+    registry.register_converter('tb', 'tc', f'{__name__}:second')
+    calls.clear()
+    yield registry.plan('ta', 'tc')
+    for name in ('ta', 'tb', 'tc'):
+        del registry.FORMATS[name]
+        del registry.EDGES[name]
+    registry.plan.cache_clear()
+
+
+def test_plans_cheapest_route():
+    assert registry.plan('pdf', 'jpeg').route == ['pdf', 'pixmap', 'image', 'jpeg']
+    assert registry.plan('png', 'png') is None
+    assert registry.plan('mp3', 'png') is None
+
+
+def test_plan_signature_lists_every_steps_options(chain):
+    assert list(inspect.signature(chain).parameters) == ['input_path', 'scale', 'shared', 'level']
+
+
+def test_each_option_goes_to_the_first_step_that_accepts_it(chain, tmp_path):
+    input_path = tmp_path / 'in.ta'
+    input_path.write_text('x')
+    output_path = chain(str(input_path), scale=2, shared='mine', level=3)
+    assert output_path == str(tmp_path / 'in.tc')
+    assert calls == [('first', 2, 'mine'), ('second', 'second', 3)]
+    # The intermediate file is removed
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['in.ta', 'in.tc']
+
+
+def test_multi_page_output_cannot_feed_another_step(tmp_path):
+    document = fitz.open()
+    for _ in range(2):
+        document.new_page(width=100, height=100)
+    input_path = tmp_path / 'doc.pdf'
+    document.save(input_path)
+
+    plan = registry.plan('pdf', 'svg')
+    assert plan.route == ['pdf', 'png', 'svg']
+    with pytest.raises(ValueError, match='multi-page output'):
+        plan(str(input_path), pages='all')
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['doc.pdf']
+
+
+def test_option_names_match_the_imported_signatures():
+    for plan in registry.conversion_plans().values():
+        assert plan.option_names() == set(inspect.signature(plan).parameters) - {'input_path'}, plan
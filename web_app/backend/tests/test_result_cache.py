@@ -0,0 +1,94 @@
+import os
+import time
+
+import pytest
+
+from result_cache import ResultCache
+from state_store import open_state_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    return open_state_store(f"sqlite:///{tmp_path / 'state.db'}")
+
+
+def make_output(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_get_places_the_cached_output_with_its_own_extension(store, tmp_path):
+    cache = ResultCache(store, str(tmp_path / 'cache'), max_bytes=1000, ttl=60)
+    key = ResultCache.make_key('hash', 'pdf_to_png', {'pages': 'all'})
+    cache.put(key, make_output(tmp_path, 'pages.zip', b'zip bytes'))
+
+    placed = cache.get(key, str(tmp_path / 'result.png'))
+    assert placed == str(tmp_path / 'result.zip')
+    assert open(placed, 'rb').read() == b'zip bytes'
+    assert cache.get(ResultCache.make_key('hash', 'pdf_to_png'), str(tmp_path / 'other.png')) is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_least_recently_used_entry_is_evicted_over_budget(store, tmp_path):
+    cache = ResultCache(store, str(tmp_path / 'cache'), max_bytes=25, ttl=60)
+    for key in ('a', 'b'):
+        cache.put(key, make_output(tmp_path, f'{key}.bin', b'x' * 10))
+    assert cache.get('a', str(tmp_path / 'hit.bin'))  # b is now the least recently used
+    cache.put('c', make_output(tmp_path, 'c.bin', b'x' * 10))
+
+    assert not cache.get('b', str(tmp_path / 'miss.bin'))
+    assert not os.path.exists(tmp_path / 'cache' / 'b.bin')
+    assert cache.stats()['bytes'] == 20
+
+
+def test_expired_entries_miss_and_are_removed(store, tmp_path):
+    cache = ResultCache(store, str(tmp_path / 'cache'), max_bytes=1000, ttl=60)
+    cache.put('old', make_output(tmp_path, 'old.bin', b'data'))
+    store.add_cache_entry('results', 'old', str(tmp_path / 'cache' / 'old.bin'), 4, time.time() - 120)
+
+    assert not cache.get('old', str(tmp_path / 'old-copy.bin'))
+    assert cache.evict_expired() == 1
+    assert not os.path.exists(tmp_path / 'cache' / 'old.bin')
+
+
+def test_index_is_rebuilt_from_files_on_disk(store, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    ResultCache(store, cache_dir, max_bytes=1000, ttl=60).put('kept', make_output(tmp_path, 'kept.png', b'data'))
+    # A fresh store adopts the files already in the folder
+    cache = ResultCache(open_state_store(f"sqlite:///{tmp_path / 'new.db'}"), cache_dir, max_bytes=1000, ttl=60)
+    assert cache.stats()['entries'] == 1
+    assert cache.get('kept', str(tmp_path / 'restored.png'))
+
+
+def test_lookup_reads_entries_stored_from_memory(store, tmp_path):
+    cache = ResultCache(store, str(tmp_path / 'cache'), max_bytes=1000, ttl=60)
+    cache.put_bytes('thumb', b'png bytes', '.png')
+    path = cache.lookup('thumb')
+    assert path == str(tmp_path / 'cache' / 'thumb.png')
+    assert open(path, 'rb').read() == b'png bytes'
+    assert cache.lookup('missing') is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_caches_sharing_a_store_share_entries_and_budget(store, tmp_path):
+    # Two API processes, each with its own cache object over the same folder
+    first = ResultCache(store, str(tmp_path / 'cache'), max_bytes=25, ttl=60)
+    second = ResultCache(store, str(tmp_path / 'cache'), max_bytes=25, ttl=60)
+    first.put('a', make_output(tmp_path, 'a.bin', b'x' * 10))
+    second.put('b', make_output(tmp_path, 'b.bin', b'x' * 10))
+    assert second.lookup('a') == str(tmp_path / 'cache' / 'a.bin')
+
+    first.put('c', make_output(tmp_path, 'c.bin', b'x' * 10))
+    # a was used after b was stored, so b is the one over the shared budget
+    assert first.lookup('b') is None
+    assert sorted(os.listdir(tmp_path / 'cache')) == ['a.bin', 'c.bin']
+    assert second.stats()['bytes'] == 20
+
+
+def test_caches_with_different_names_are_separate(store, tmp_path):
+    results = ResultCache(store, str(tmp_path / 'results'), max_bytes=1000, ttl=60)
+    previews = ResultCache(store, str(tmp_path / 'previews'), max_bytes=1000, ttl=60, name='previews')
+    results.put('a', make_output(tmp_path, 'a.bin', b'data'))
+    assert previews.lookup('a') is None
+    assert previews.stats()['entries'] == 0
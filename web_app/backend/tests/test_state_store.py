@@ -0,0 +1,83 @@
+import pytest
+
+from state_store import StateStore, open_state_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    return open_state_store(f"sqlite:///{tmp_path / 'state.db'}")
+
+
+def test_values_are_namespaced_and_pop_removes_them(store):
+    store.set_value('upload_hash', 'a.png', 'abc')
+    store.set_value('upload_meta', 'a.png', {'pages': 3})
+    assert store.get_value('upload_meta', 'a.png') == {'pages': 3}
+    assert store.pop_value('upload_hash', 'a.png') == 'abc'
+    assert store.get_value('upload_hash', 'a.png', 'gone') == 'gone'
+
+
+def paths(records):
+    return sorted(record['path'] for record in records)
+
+
+def test_files_expire_unless_pinned_and_count_towards_their_owner(store):
+    store.add_file('/u/a', 10, 'session-1', 'upload', 0, 100)
+    store.add_file('/u/b', 5, 'session-1', 'output', 0, 150)
+    store.add_file('/u/c', 7, 'session-2', 'upload', 0, 300)
+    store.adjust_pins('/u/b', 1)
+
+    assert paths(store.expired_files(200)) == ['/u/a']
+    assert paths(store.files_for_owner('session-1')) == ['/u/a', '/u/b']
+    assert paths(store.files_for_owner('session-1', kind='output')) == ['/u/b']
+    assert store.usage('session-1') == {'files': 2, 'used_bytes': 15}
+
+    assert store.delete_file('/u/a')['size'] == 10
+    assert store.get_file('/u/a') is None
+    store.adjust_pins('/u/b', -1)
+    assert paths(store.expired_files(200)) == ['/u/b']
+
+
+def test_jobs_round_trip(store):
+    store.save_job({'job_id': 'j1', 'status': 'finished', 'finished_at': 10})
+    assert store.get_job('j1')['status'] == 'finished'
+    store.delete_jobs(finished_before=20)
+    assert store.get_job('j1') is None
+
+
+def test_cache_entries_are_grouped_by_cache_and_used_least_recently_first(store):
+    store.add_cache_entry('results', 'a', '/c/a.png', 10, 100)
+    store.add_cache_entry('results', 'b', '/c/b.png', 5, 200)
+    store.add_cache_entry('previews', 'a', '/c/p/a.png', 7, 100)
+    store.touch_cache_entry('results', 'a', 300)
+
+    assert [entry['key'] for entry in store.cache_entries('results')] == ['b', 'a']
+    assert [entry['key'] for entry in store.cache_entries('results', stored_before=150)] == ['a']
+    assert store.cache_usage('results') == {'entries': 2, 'bytes': 15}
+    assert store.delete_cache_entry('results', 'a')['path'] == '/c/a.png'
+    assert store.delete_cache_entry('results', 'a') is None
+    assert store.get_cache_entry('previews', 'a')['size'] == 7
+
+
+def test_locks_have_one_owner_until_released_or_expired(store):
+    assert store.acquire_lock('upload:1', 'first', expires_at=100, now=0)
+    assert not store.acquire_lock('upload:1', 'second', expires_at=100, now=50)
+    store.release_lock('upload:1', 'second')  # not the owner, so nothing happens
+    assert not store.acquire_lock('upload:1', 'second', expires_at=100, now=50)
+    # An expired lease is taken over
+    assert store.acquire_lock('upload:1', 'second', expires_at=300, now=200)
+    store.release_lock('upload:1', 'second')
+    assert store.acquire_lock('upload:1', 'first', expires_at=400, now=200)
+
+
+def test_stores_must_implement_every_method():
+    class PartialStore(StateStore):
+        def get_value(self, namespace, key, default=None):
+            return default
+
+    with pytest.raises(TypeError):
+        PartialStore()
+
+
+def test_unknown_store_url_is_rejected():
+    with pytest.raises(ValueError):
+        open_state_store('redis://localhost')
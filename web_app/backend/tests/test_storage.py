@@ -0,0 +1,80 @@
+import io
+
+import pytest
+
+from state_store import open_state_store
+from storage import StorageFullError, StorageManager
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return StorageManager(open_state_store(f"sqlite:///{tmp_path / 'state.db'}"), quota_bytes=25, ttl=60)
+
+
+def make_file(tmp_path, name, size=10):
+    path = tmp_path / name
+    path.write_bytes(b'x' * size)
+    return str(path)
+
+
+def test_oldest_unpinned_files_are_evicted_over_quota(storage, tmp_path):
+    first = make_file(tmp_path, 'first')
+    second = make_file(tmp_path, 'second')
+    storage.register(first, owner='a', created_at=1)
+    storage.register(second, owner='a', created_at=2)
+    storage.pin(first)
+
+    third = make_file(tmp_path, 'third')
+    storage.register(third, owner='b', created_at=3)
+    assert (tmp_path / 'first').exists()
+    assert not (tmp_path / 'second').exists()
+    usage = storage.usage()
+    assert usage['used_bytes'] == 20
+    assert usage['evictions']['quota'] == 1
+
+
+def test_storage_full_when_only_pinned_files_remain(storage, tmp_path):
+    for index in range(2):
+        path = make_file(tmp_path, f'pinned{index}')
+        storage.register(path, created_at=index)
+        storage.pin(path)
+    with pytest.raises(StorageFullError):
+        storage.ensure_space(10)
+    with pytest.raises(StorageFullError):
+        storage.ensure_space(100)
+
+
+def test_sweep_deletes_only_expired_unpinned_files(storage, tmp_path):
+    old = make_file(tmp_path, 'old', 1)
+    busy = make_file(tmp_path, 'busy', 1)
+    fresh = make_file(tmp_path, 'fresh', 1)
+    storage.register(old, created_at=0)
+    storage.register(busy, created_at=0)
+    storage.register(fresh, created_at=1000)
+    storage.pin(busy)
+
+    assert storage.evict_expired(now=100) == 1
+    assert not (tmp_path / 'old').exists()
+    assert (tmp_path / 'busy').exists() and (tmp_path / 'fresh').exists()
+
+    storage.unpin(busy)
+    assert storage.evict_expired(now=200) == 1
+    assert not (tmp_path / 'busy').exists()
+
+
+def test_remove_owner_deletes_one_kind(storage, tmp_path):
+    storage.register(make_file(tmp_path, 'upload', 1), owner='session', kind='upload')
+    storage.register(make_file(tmp_path, 'output', 1), owner='session', kind='output')
+    assert storage.remove_owner('session', kind='upload') == 1
+    assert storage.usage('session') == {'files': 1, 'used_bytes': 1}
+
+
+def test_upload_over_quota_is_rejected(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module.storage, 'quota_bytes', 100)
+    response = client.post('/api/upload', data={'file': (io.BytesIO(b'x' * 1000), 'big.png')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 507
+    assert response.headers['Retry-After'] == '30'
+
+    response = client.post('/api/uploads', json={'filename': 'big.mp3', 'size': 1000})
+    assert response.status_code == 507
@@ -0,0 +1,26 @@
+import io
+import zipfile
+
+from zip_stream import ZipStream
+
+
+def test_streamed_archive_is_a_valid_zip(tmp_path):
+    text = tmp_path / 'notes.txt'
+    text.write_bytes(b'hello ' * 1000)
+    photo = tmp_path / 'photo.png'
+    photo.write_bytes(bytes(range(256)) * 4)
+
+    archive = ZipStream()
+    chunks = []
+    chunks.extend(archive.add_file(str(text), 'notes.txt'))
+    chunks.extend(archive.add_file(str(photo), 'photo.png'))
+    chunks.extend(archive.add_file(str(text), 'notes.txt'))
+    chunks.extend(archive.add_bytes('manifest.json', b'{}'))
+    chunks.append(archive.close())
+
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as result:
+        assert result.testzip() is None
+        assert result.namelist() == ['notes.txt', 'photo.png', 'notes (2).txt', 'manifest.json']
+        assert result.read('notes (2).txt') == text.read_bytes()
+        assert result.getinfo('photo.png').compress_type == zipfile.ZIP_STORED
+        assert result.getinfo('notes.txt').compress_type == zipfile.ZIP_DEFLATED
@@ -0,0 +1,85 @@
+import io
+import os
+import time
+import zipfile
+
+READ_SIZE = 256 * 1024
+
+# Formats that are already compressed gain nothing from DEFLATE
+STORED_EXTENSIONS = {'.mp3', '.m4a', '.jpg', '.jpeg', '.png', '.docx', '.zip', '.webp', '.avif'}
+
+
+def compression_for(filename):
+    """Pick STORED for already-compressed formats and DEFLATE for the rest"""
+    if os.path.splitext(filename)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable buffer that hands out what has been written so far"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipStream:
+    """Build a ZIP archive as a sequence of byte chunks without a temporary file
+
+    zipfile writes data descriptors instead of seeking back when the target
+    is not seekable, so every chunk can be sent as soon as it is produced.
+    """
+
+    def __init__(self):
+        self._sink = _ChunkSink()
+        self._zip = zipfile.ZipFile(self._sink, 'w', allowZip64=True)
+        self._names = set()
+
+    def _unique_name(self, arcname):
+        name, extension = os.path.splitext(arcname)
+        candidate = arcname
+        counter = 2
+        while candidate in self._names:
+            candidate = f"{name} ({counter}){extension}"
+            counter += 1
+        self._names.add(candidate)
+        return candidate
+
+    def add_file(self, path, arcname, compress_type=None):
+        """Yield the archive bytes for one file, read in fixed-size pieces"""
+        info = zipfile.ZipInfo(self._unique_name(arcname), time.localtime(os.path.getmtime(path))[:6])
+        info.compress_type = compression_for(arcname) if compress_type is None else compress_type
+        # A size hint lets zipfile decide up front whether ZIP64 is needed
+        info.file_size = os.path.getsize(path)
+        with open(path, 'rb') as source, self._zip.open(info, 'w') as entry:
+            for chunk in iter(lambda: source.read(READ_SIZE), b''):
+                entry.write(chunk)
+                data = self._sink.drain()
+                if data:
+                    yield data
+        yield self._sink.drain()
+
+    def add_bytes(self, arcname, data, compress_type=zipfile.ZIP_DEFLATED):
+        """Yield the archive bytes for an in-memory entry"""
+        info = zipfile.ZipInfo(self._unique_name(arcname), time.localtime()[:6])
+        info.compress_type = compress_type
+        self._zip.writestr(info, data)
+        yield self._sink.drain()
+
+    def close(self):
+        """Finish the archive and return the central directory bytes"""
+        self._zip.close()
+        return self._sink.drain()
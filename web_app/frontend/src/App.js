@@ -1,5 +1,5 @@
 import React, { useState, useRef, useCallback, useEffect } from 'react';
-import { getTranslation } from './translations';
+import { getConversionLabel, getTranslation } from './translations';
 import LanguageSelector from './components/LanguageSelector';
 import TermsModal from './components/TermsModal';
 
@@ -70,17 +70,20 @@ function App() {
 
         if (response.ok) {
           const data = await response.json();
+          // The server lists what its converter graph can reach from this file
+          const conversions = data.conversions || getConversionOptions(file.name);
           const fileData = {
             id: data.unique_filename,
             name: file.name,
             type: file.type,
             size: file.size,
             original_filename: data.filename,
-            conversionOptions: getConversionOptions(file.name),
+            pages: data.metadata?.kind === 'pdf' ? data.metadata.pages : 0,
+            conversionOptions: conversions,
             convertedFiles: []
           };
           newFiles.push(fileData);
-          newConversionOptions[data.unique_filename] = getConversionOptions(file.name);
+          newConversionOptions[data.unique_filename] = conversions;
         } else {
           alert(getTranslation(language, 'uploadFailed'));
         }
@@ -105,9 +108,9 @@ function App() {
     const options = {
       'pdf': ['pdf_to_word', 'pdf_to_png'],
       'docx': ['word_to_pdf'],
-      'jpg': ['jpeg_to_png', 'jpeg_to_svg'],
-      'jpeg': ['jpeg_to_png', 'jpeg_to_svg'],
-      'png': ['png_to_jpeg', 'png_to_svg'],
+      'jpg': ['jpeg_to_png', 'jpeg_to_svg', 'jpeg_to_webp', 'jpeg_to_avif'],
+      'jpeg': ['jpeg_to_png', 'jpeg_to_svg', 'jpeg_to_webp', 'jpeg_to_avif'],
+      'png': ['png_to_jpeg', 'png_to_svg', 'png_to_webp', 'png_to_avif'],
       'svg': ['svg_to_png', 'svg_to_jpeg'],
       'mp3': ['mp3_to_wav', 'mp3_to_m4a'],
       'wav': ['wav_to_mp3', 'wav_to_m4a'],
@@ -136,64 +139,83 @@ function App() {
     event.preventDefault();
   };
 
+  const waitForJob = (job, onProgress) => {
+    // Conversions run as background jobs; follow this one's progress events until it settles
+    if (job.status === 'finished' || job.status === 'failed') return Promise.resolve(job);
+    return new Promise((resolve) => {
+      const events = new EventSource(`http://localhost:5000${job.events_url}`);
+      events.addEventListener('progress', (event) => {
+        const data = JSON.parse(event.data);
+        if (data.progress && data.progress.percent !== null) onProgress(data.progress.percent);
+      });
+      const settle = (event) => {
+        events.close();
+        resolve(JSON.parse(event.data));
+      };
+      events.addEventListener('finished', settle);
+      events.addEventListener('failed', settle);
+      events.onerror = () => {
+        // The stream dropped; EventSource would reconnect, but one status check is enough
+        events.close();
+        fetch(`http://localhost:5000${job.status_url}`)
+          .then(response => (response.ok ? response.json() : null))
+          .then(current => resolve(current && (current.status === 'queued' || current.status === 'running')
+            ? waitForJob(current, onProgress) : current))
+          .catch(() => resolve(null));
+      };
+    });
+  };
+
+  const convertOne = async (fileId, conversionType) => {
+    const progressKey = `${fileId}_${conversionType}`;
+    setConvertingFiles(prev => new Set(prev).add(progressKey));
+    setConversionProgress(prev => ({ ...prev, [progressKey]: 0 }));
+
+    const response = await fetch('http://localhost:5000/api/convert', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({
+        unique_filename: fileId,
+        conversion_type: conversionType
+      }),
+    });
+
+    const onProgress = (percent) => setConversionProgress(prev => ({ ...prev, [progressKey]: percent }));
+    const data = response.ok ? await waitForJob(await response.json(), onProgress) : null;
+
+    setConvertingFiles(prev => {
+      const newSet = new Set(prev);
+      newSet.delete(progressKey);
+      return newSet;
+    });
+
+    if (data && data.success) {
+      setConversionProgress(prev => ({ ...prev, [progressKey]: 100 }));
+      // Show each file as soon as it is ready so it can be downloaded while others still run
+      setConvertedFiles(prev => [...prev, {
+        ...data,
+        fileId,
+        originalName: uploadedFiles.find(f => f.id === fileId)?.name
+      }]);
+    } else {
+      alert(getTranslation(language, 'conversionFailed'));
+    }
+  };
+
   const handleConvert = async () => {
     if (Object.keys(selectedConversions).length === 0) return;
 
     setIsConverting(true);
-    const newConvertedFiles = [];
+    setConvertedFiles([]);
 
     try {
-      for (const [fileId, conversionType] of Object.entries(selectedConversions)) {
-        if (!conversionType) continue;
-
-        // Add to converting set
-        setConvertingFiles(prev => new Set(prev).add(`${fileId}_${conversionType}`));
-        
-        // Start progress simulation
-        const progressKey = `${fileId}_${conversionType}`;
-        setConversionProgress(prev => ({ ...prev, [progressKey]: 0 }));
-        
-        // Simulate progress updates
-        const progressInterval = setInterval(() => {
-          setConversionProgress(prev => {
-            const current = prev[progressKey] || 0;
-            if (current < 90) { // Stop at 90% until conversion completes
-              return { ...prev, [progressKey]: current + Math.random() * 15 };
-            }
-            return prev;
-          });
-        }, 200);
-
-        const response = await fetch('http://localhost:5000/api/convert', {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify({
-            unique_filename: fileId,
-            conversion_type: conversionType
-          }),
-        });
-
-        // Clear progress interval
-        clearInterval(progressInterval);
-
-        if (response.ok) {
-          const data = await response.json();
-          newConvertedFiles.push({
-            ...data,
-            fileId,
-            originalName: uploadedFiles.find(f => f.id === fileId)?.name
-          });
-          
-          // Set progress to 100% when complete
-          setConversionProgress(prev => ({ ...prev, [progressKey]: 100 }));
-        } else {
-          alert(getTranslation(language, 'conversionFailed'));
-        }
-      }
-
-      setConvertedFiles(newConvertedFiles);
+      await Promise.all(
+        Object.entries(selectedConversions)
+          .filter(([, conversionType]) => conversionType)
+          .map(([fileId, conversionType]) => convertOne(fileId, conversionType))
+      );
     } catch (error) {
       if (error.message.includes('Failed to fetch') || error.message.includes('NetworkError')) {
         alert('Backend server is not available. Please run the backend locally or deploy it to a hosting service.');
@@ -202,15 +224,7 @@ function App() {
       }
     } finally {
       setIsConverting(false);
-      setConvertingFiles(prev => {
-        const newSet = new Set(prev);
-        for (const [fileId, conversionType] of Object.entries(selectedConversions)) {
-          if (conversionType) {
-            newSet.delete(`${fileId}_${conversionType}`);
-          }
-        }
-        return newSet;
-      });
+      setConvertingFiles(new Set());
       
       // Clear progress after a short delay
       setTimeout(() => {
@@ -380,6 +394,23 @@ function App() {
                       </div>
                     </div>
                     
+                    {file.pages > 0 && (
+                      // Thumbnails load as they scroll into view and are cached by the server
+                      <div className="flex gap-2 overflow-x-auto mb-3 pb-2">
+                        {Array.from({ length: file.pages }, (_, index) => (
+                          <img
+                            key={index}
+                            src={`http://localhost:5000/api/preview/${encodeURIComponent(file.id)}/${index + 1}?size=160`}
+                            alt={`${getTranslation(language, 'page')} ${index + 1}`}
+                            loading="lazy"
+                            width="113"
+                            height="160"
+                            className="border rounded bg-white object-contain flex-shrink-0"
+                          />
+                        ))}
+                      </div>
+                    )}
+                    
                     {conversionOptions[file.id] && conversionOptions[file.id].length > 0 ? (
                       <div>
                         <h4 className="text-sm font-medium text-gray-700 mb-2">
@@ -419,7 +450,7 @@ function App() {
                                   </span>
                                 </div>
                               ) : (
-                                getTranslation(language, option)
+                                getConversionLabel(language, option)
                               )}
                             </button>
                           ))}
@@ -23,6 +23,7 @@ export const translations = {
     
     // Conversion Options
     chooseConversion: "Choose Conversion",
+    page: "Page",
     noConversionsAvailable: "No conversion options available for this file type.",
     
     // Conversion Labels
@@ -36,6 +37,10 @@ export const translations = {
     png_to_jpeg: "PNG → JPEG",
     png_to_svg: "PNG → SVG",
     jpeg_to_svg: "JPEG → SVG",
+    jpeg_to_webp: "JPEG → WebP",
+    png_to_webp: "PNG → WebP",
+    jpeg_to_avif: "JPEG → AVIF",
+    png_to_avif: "PNG → AVIF",
     svg_to_png: "SVG → PNG",
     svg_to_jpeg: "SVG → JPEG",
     pdf_to_word: "PDF → Word",
@@ -103,6 +108,7 @@ export const translations = {
     
     // Conversion Options
     chooseConversion: "Vælg Konvertering",
+    page: "Side",
     noConversionsAvailable: "Ingen konverteringsmuligheder tilgængelige for denne filtype.",
     
     // Conversion Labels
@@ -116,6 +122,10 @@ export const translations = {
     png_to_jpeg: "PNG → JPEG",
     png_to_svg: "PNG → SVG",
     jpeg_to_svg: "JPEG → SVG",
+    jpeg_to_webp: "JPEG → WebP",
+    png_to_webp: "PNG → WebP",
+    jpeg_to_avif: "JPEG → AVIF",
+    png_to_avif: "PNG → AVIF",
     svg_to_png: "SVG → PNG",
     svg_to_jpeg: "SVG → JPEG",
     pdf_to_word: "PDF → Word",
@@ -162,4 +172,21 @@ export const translations = {
 
 export const getTranslation = (language, key) => {
   return translations[language]?.[key] || translations.en[key] || key;
-}; 
\ No newline at end of file
+}; 
+
+// Display names for formats in conversion types the labels above do not cover
+const formatNames = {
+  word: 'Word',
+  jpeg: 'JPEG',
+  webp: 'WebP',
+};
+
+export const getConversionLabel = (language, conversionType) => {
+  const label = getTranslation(language, conversionType);
+  if (label !== conversionType || !conversionType.includes('_to_')) {
+    return label;
+  }
+  const [source, target] = conversionType.split('_to_');
+  const name = (format) => formatNames[format] || format.toUpperCase();
+  return `${name(source)} → ${name(target)}`;
+};